@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+import ingest
+import storage
+import workload
+from schema import CASE_ID
+
+# --- 1. 指派關聯表 (一案一人一角色一列，以案件編號連結主檔；案件名稱僅供閱讀與匯出) ---
+TABLE = "assignments"
+COLUMNS = [CASE_ID, '案件名稱', '姓名', '角色']
+ROLES = ("PM", "Staff")
+ROLE_COLS = {"PM": "PM名單", "Staff": "Staff名單"}
+
+
+def empty_relation():
+    return pd.DataFrame(columns=COLUMNS)
+
+
+def from_roi_strings(roi_df):
+    """將 roi_data 舊格式的逗號名單 (PM名單 / Staff名單) 轉為關聯表，只在第一次載入時執行。"""
+    frames = []
+    for role, col in ROLE_COLS.items():
+        if roi_df.empty or col not in roi_df.columns or '案件名稱' not in roi_df.columns:
+            continue
+        names = roi_df.reindex(columns=[CASE_ID, '案件名稱', col])
+        names[col] = names[col].astype(str).replace(['nan', 'None', '0.0', '0', ''], "")
+        long = workload.explode_names(names, col, '姓名')
+        frames.append(long.assign(角色=role)[COLUMNS])
+    if not frames:
+        return empty_relation()
+    return pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def load_relation(roi_df=None, snapshot=None):
+    if storage.exists(TABLE):
+        relation = storage.read_table(TABLE, snapshot)
+        return relation if not relation.empty else empty_relation()
+    relation = from_roi_strings(storage.read_table("roi_data") if roi_df is None else roi_df)
+    if not relation.empty:
+        storage.write_table(TABLE, relation)
+    return relation
+
+
+def _case_rows(case_id, case_name, members):
+    rows = [{CASE_ID: case_id, '案件名稱': case_name, '姓名': name, '角色': role}
+            for role, names in members.items() for name in names]
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def save_case(case_id, case_name, members):
+    """
+    只替換單一案件的指派列 (資料庫後端為單一交易，不重寫整張表)，
+    並只重算彙總立方體中該案所屬的期間。
+    """
+    since = storage.current_version(TABLE)
+    storage.replace_rows(TABLE, {CASE_ID: case_id}, _case_rows(case_id, case_name, members))
+    ingest.refresh_cube_cases([case_id], since)
+
+
+def to_strings(relation, case_ids):
+    """組回 PM名單 / Staff名單 顯示字串 (依 case_ids 的案件順序)，僅供畫面呈現。"""
+    out = pd.DataFrame({CASE_ID: case_ids})
+    for role, col in ROLE_COLS.items():
+        part = relation[relation['角色'] == role]
+        joined = part.groupby(CASE_ID, sort=False)['姓名'].agg(",".join)
+        out[col] = out[CASE_ID].map(joined).fillna("")
+    return out
+
+
+# --- 2. 整數鍵索引 ---
+class AssignmentIndex:
+    """
+    指派關聯的記憶體索引：
+    1. 案件編號與人員以 factorize 轉為連續整數鍵 (case_id / person_id)。
+    2. 依案件、依人員各建一份 CSR 索引 (排序後的列位置 + 起訖指標)，
+       「某 PM 的所有案件」「某案件的 Staff」皆為 O(k) 查詢，不必掃描整張表。
+    3. version 記錄索引對應的指派關聯表版本，頁面跨執行保留索引，只在版本變動 (寫入、回復) 時重建；
+       Staff 的分工占比改由 DistributionTracker 查詢 (shares)，不再每次重跑對分工表 groupby。
+    """
+
+    def __init__(self, relation, version=None):
+        # 主檔已不存在的案件 (編號為空值) 不納入索引
+        relation = relation[relation[CASE_ID].notna()].reset_index(drop=True)
+        self.version = version
+        self.case_id, self.cases = pd.factorize(relation[CASE_ID])
+        self.person_id, self.people = pd.factorize(relation['姓名'])
+        self.role = relation['角色'].to_numpy()
+        self._case_key = {name: i for i, name in enumerate(self.cases)}
+        self._person_key = {name: i for i, name in enumerate(self.people)}
+        self._by_case, self._case_ptr = self._csr(self.case_id, len(self.cases))
+        self._by_person, self._person_ptr = self._csr(self.person_id, len(self.people))
+
+    @staticmethod
+    def _csr(keys, n_keys):
+        order = np.argsort(keys, kind='stable')
+        ptr = np.searchsorted(keys[order], np.arange(n_keys + 1))
+        return order, ptr
+
+    def _rows_of_case(self, case):
+        key = self._case_key.get(case)
+        if key is None:
+            return np.array([], dtype=int)
+        return self._by_case[self._case_ptr[key]:self._case_ptr[key + 1]]
+
+    def _rows_of_person(self, person):
+        key = self._person_key.get(person)
+        if key is None:
+            return np.array([], dtype=int)
+        return self._by_person[self._person_ptr[key]:self._person_ptr[key + 1]]
+
+    def members(self, case, role):
+        rows = self._rows_of_case(case)
+        rows = rows[self.role[rows] == role]
+        return [self.people[i] for i in self.person_id[rows]]
+
+    def cases_of(self, person, role=None):
+        rows = self._rows_of_person(person)
+        if role is not None:
+            rows = rows[self.role[rows] == role]
+        return [self.cases[i] for i in self.case_id[rows]]
+
+    def staffed_cases(self, role="Staff"):
+        return set(self.cases[np.unique(self.case_id[self.role == role])])
+
+    def shares(self, case, tracker):
+        """某案件各 Staff 的分工占比 (依指派順序)，未填報為 NaN；O(該案列數)。"""
+        known = tracker.shares.get(case, {})
+        return {name: known.get(name, np.nan) for name in self.members(case, "Staff")}
+
+
+# --- 3. 分工占比完成度 ---
+class DistributionTracker:
+    """
+    每案分工占比合計的常駐索引：
+    1. 建立時對 workload_distribution 做一次 groupby，之後每次儲存單一案件只更新該案 (O(該案列數))。
+    2. shares 為 {案件編號: {負責人: 占比}}，分工填報與 AssignmentIndex.shares 直接查詢，不必重新 groupby。
+    3. complete 為合計達 100% 的案件集合，「已指派 Staff 但未完成」= staffed - complete (集合運算)。
+    4. version 記錄索引對應的資料表版本；頁面釘選的版本不同 (其他 session 寫入、回復) 時重建。
+    5. frame() 由索引還原分工占比表 (負荷彙總與自動指派使用)，版本相同的重新執行不必再讀取資料表。
+    """
+
+    TOLERANCE = 0.1
+
+    def __init__(self, dist_df, version=None):
+        self.shares = {}
+        if not dist_df.empty:
+            rows = dist_df[dist_df[CASE_ID].notna()]
+            grouped = rows.groupby([CASE_ID, '負責人'], sort=False, dropna=False)['占比'].sum()
+            for (case_id, owner), share in grouped.items():
+                self.shares.setdefault(case_id, {})[owner] = float(share)
+        self.sums = {case_id: sum(owners.values()) for case_id, owners in self.shares.items()}
+        self.complete = {case_id for case_id, total in self.sums.items() if abs(total - 100) < self.TOLERANCE}
+        self.version = version
+        self._frame = None
+
+    def frame(self):
+        """目前的分工占比 (案件編號, 負責人, 占比)；結果快取到下一次 update。"""
+        if self._frame is None:
+            rows = [(case_id, owner, share) for case_id, owners in self.shares.items() for owner, share in owners.items()]
+            self._frame = pd.DataFrame(rows, columns=[CASE_ID, '負責人', '占比'])
+        return self._frame
+
+    def rows(self, case_id):
+        """單一案件目前的分工列 (負責人, 占比)。"""
+        owners = self.shares.get(case_id, {})
+        return pd.DataFrame({'負責人': list(owners), '占比': list(owners.values())})
+
+    def update(self, case_id, shares, version=None):
+        """
+        儲存單一案件的分工後呼叫 (shares 為以負責人為索引的占比 Series)；
+        只有版本恰好前進一版 (期間無其他寫入) 才沿用索引，否則標記待重建。
+        """
+        shares = pd.to_numeric(pd.Series(shares), errors='coerce').fillna(0)
+        self._frame = None
+        self.shares[case_id] = {owner: float(share) for owner, share in shares.groupby(level=0, sort=False).sum().items()}
+        total = float(shares.sum())
+        self.sums[case_id] = total
+        if abs(total - 100) < self.TOLERANCE:
+            self.complete.add(case_id)
+        else:
+            self.complete.discard(case_id)
+        expected = None if self.version is None else self.version + 1
+        self.version = version if version is not None and version == expected else None
+
+    def incomplete(self, staffed):
+        return set(staffed) - self.complete
@@ -0,0 +1,395 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import ingest
+import optimizer
+import roi
+import schema
+import scorer
+import storage
+import workload
+
+# --- 1. 合成案件資料 (欄位對齊 inputs_raw_cases) ---
+YES_NO_COLS = ['個體是否共用系統', '系統是否客製化', '是否被Q', '是否為PCAOB', '前期負責PM是否更換',
+               'IPO是否首查', 'IPO是否為複雜資安', 'ITAC是否首查', 'GC是否首查', 'Caats是否首查']
+CASE_TYPES = ['FSA', 'IPO', 'GC健檢', 'CAATS', 'FSA/專審']
+IPO_TYPES = ['上市', '上櫃', '興櫃', '公發']
+
+
+def make_cases(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        '案件名稱': [f"案件{i:07d}" for i in range(n)],
+        '案件類型': rng.choice(CASE_TYPES, n),
+        '個體數': rng.integers(1, 10, n),
+        '系統數': rng.integers(1, 12, n),
+        '(系統)已考量共用情況之實際系統數': rng.integers(0, 12, n),
+        '前底稿完整度': rng.choice([np.nan, 0.0, 1.0], n),
+        'IPO送件類型': rng.choice(IPO_TYPES + [None], n),
+        'ITAC題數': rng.choice([np.nan, 0, 2, 6, 12], n),
+    })
+    for col in YES_NO_COLS:
+        # 模擬 Excel 匯入時常見的空值與前後空白
+        df[col] = rng.choice(['是', '否', ' 是', None], n, p=[0.35, 0.45, 0.05, 0.15])
+    return df
+
+
+def make_people(n_people, pm_ratio=0.2):
+    n_pm = max(1, int(n_people * pm_ratio))
+    return ([f"PM{i:04d}" for i in range(n_pm)],
+            [f"Staff{i:04d}" for i in range(n_people - n_pm)])
+
+
+def make_assignments(cases, n_people, seed=0):
+    """
+    依 roi_data / workload_distribution 的格式產生指派資料：
+    回傳 (含 PM名單、Staff名單 逗號字串的 roi_df, 分工占比 dist_df)。
+    """
+    rng = np.random.default_rng(seed)
+    pms, staffs = make_people(n_people)
+    names = cases['案件名稱'].to_numpy()
+    n = len(names)
+    pm_pick = rng.integers(0, len(pms), (n, 2))
+    n_pm = rng.integers(0, 3, n)
+    st_pick = rng.integers(0, len(staffs), (n, 3))
+    n_st = rng.integers(0, 4, n)
+    pm_str = [",".join(pms[j] for j in dict.fromkeys(pm_pick[i, :n_pm[i]])) for i in range(n)]
+    st_lists = [[staffs[j] for j in dict.fromkeys(st_pick[i, :n_st[i]])] for i in range(n)]
+    roi_df = pd.DataFrame({'案件名稱': names, 'PM名單': pm_str, 'Staff名單': [",".join(x) for x in st_lists],
+                           '最終報價(萬)': rng.choice([0, 50, 100, 200, 300], n).astype(float),
+                           '預計工時': rng.integers(0, 400, n).astype(float)})
+    counts = np.array([len(x) for x in st_lists])
+    dist_df = pd.DataFrame({'案件名稱': np.repeat(names, counts),
+                            '負責人': [p for x in st_lists for p in x],
+                            '占比': np.repeat(np.divide(100, counts, out=np.zeros(n), where=counts > 0), counts)})
+    return roi_df, dist_df
+
+
+# --- 2. 重構前的逐規則評分 (作為比較基準) ---
+def legacy_calculate_complexity(df):
+    df_result = df.copy()
+
+    def get_num(col_name):
+        return pd.to_numeric(df_result.get(col_name), errors='coerce').fillna(0)
+
+    def get_bool_score(col_name, points):
+        condition = df_result.get(col_name).astype(str).str.strip() == '是'
+        return np.where(condition, points, 0)
+
+    actual_sys = get_num('(系統)已考量共用情況之實際系統數')
+    raw_sys = get_num('系統數')
+    final_sys = np.where(actual_sys > 0, actual_sys, raw_sys)
+    score = (get_num('個體數') * 2) + (final_sys * 4)
+    share_cond = df_result.get('個體是否共用系統').astype(str).str.strip() == '否'
+    score += np.where(share_cond, 3, 0)
+    score += get_bool_score('系統是否客製化', 3)
+    score += get_bool_score('是否被Q', 8)
+    score += get_bool_score('是否為PCAOB', 10)
+    score += get_bool_score('前期負責PM是否更換', 5)
+    ipo_col = df_result.get('IPO送件類型').astype(str)
+    ipo_conditions = [ipo_col.str.contains('上市'), ipo_col.str.contains('上櫃'), ipo_col.str.contains('興櫃')]
+    score += np.select(ipo_conditions, [5, 4, 2], default=0)
+    score += get_bool_score('IPO是否為複雜資安', 7)
+    score += get_bool_score('IPO是否首查', 5)
+    score += (get_num('ITAC題數') * 1.5)
+    score += get_bool_score('ITAC是否首查', 8)
+    score += get_bool_score('GC是否首查', 5)
+    score += get_bool_score('Caats是否首查', 6)
+    df_result['複雜度評分'] = score
+    return df_result.sort_values(by='複雜度評分', ascending=False)
+
+
+# --- 2.1 頁面內的彙總邏輯 (照抄 pages/ 目前寫法，作為比較基準) ---
+def to_list(val): return [n.strip() for n in str(val).split(',')] if val and str(val) not in ["nan", ""] else []
+
+
+def legacy_pm_workload(combined_df):
+    pm_perf = []
+    for _, row in combined_df.iterrows():
+        pms = to_list(row['PM名單'])
+        for p in pms:
+            if p: pm_perf.append({'PM': p, '案件名稱': row['案件名稱'], '案件類型': row['案件類型'], '複雜度': row['複雜度評分']})
+    pm_stats_df = pd.DataFrame(pm_perf)
+    pm_summary = pm_stats_df.groupby('PM').agg(count=('案件名稱', 'count'), sum=('複雜度', 'sum')).reset_index()
+    pm_summary['avg'] = (pm_summary['sum'] / pm_summary['count']).round(2)
+    return pm_summary.sort_values(by='avg', ascending=False)
+
+
+def legacy_staff_workload(dist_df, master_df):
+    analysis_df = pd.merge(dist_df, master_df[['案件名稱', '案件類型', '複雜度評分']], on='案件名稱', how='left')
+    analysis_df['加權負荷'] = (analysis_df['複雜度評分'] * (analysis_df['占比'] / 100)).round(2)
+    return analysis_df.groupby('負責人').agg(count=('案件名稱', 'count'), sum=('加權負荷', 'sum')).reset_index().round(2).sort_values(by='sum', ascending=True)
+
+
+def legacy_roi(calc_df):
+    calc_df = calc_df.copy()
+    calc_df['投報率'] = calc_df.apply(
+        lambda x: round(x['最終報價(萬)'] / x['複雜度評分'], 2) if x['複雜度評分'] > 0 else 0, axis=1
+    )
+    active_mask = calc_df['最終報價(萬)'] > 0
+    avg_roi = calc_df.loc[active_mask, '投報率'].mean() if active_mask.any() else 0
+    avg_price = calc_df.loc[active_mask, '最終報價(萬)'].mean() if active_mask.any() else 0
+    avg_complexity = calc_df['複雜度評分'].mean()
+    calc_df['商務評價'] = calc_df['投報率'].apply(lambda x: "high" if x >= avg_roi and x > 0 else "low")
+    bad_cases = calc_df[(calc_df['複雜度評分'] > avg_complexity) & (calc_df['最終報價(萬)'] < avg_price) & active_mask]
+    star_cases = calc_df[(calc_df['複雜度評分'] < avg_complexity) & (calc_df['最終報價(萬)'] > avg_price)]
+    return calc_df, bad_cases, star_cases
+
+
+# --- 3. 計時工具 ---
+def best_of(fn, repeat=3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _r(seconds):
+    return round(seconds, 4)
+
+
+# --- 4. 各項基準 ---
+def bench_scoring(rows, repeat, opts):
+    df = make_cases(rows)
+    result = {"rows": rows}
+    plan_s, planned = best_of(lambda: scorer.calculate_complexity(df), repeat)
+    result["compiled_s"] = _r(plan_s)
+    if rows <= opts.legacy_max_rows:
+        legacy_s, legacy = best_of(lambda: legacy_calculate_complexity(df), repeat)
+        # 兩者分數必須完全一致
+        assert np.allclose(legacy['複雜度評分'].sort_index(), planned['複雜度評分'].sort_index())
+        result.update(legacy_s=_r(legacy_s), speedup=round(legacy_s / plan_s, 2))
+    plan = scorer.default_plan()
+    result["compiled_score_only_s"] = _r(best_of(lambda: plan.score(df), repeat)[0])
+    normalized = schema.normalize_case_frame(df)
+    result["normalized_score_only_s"] = _r(best_of(lambda: plan.score(normalized), repeat)[0])
+    result["batch_s"] = _r(best_of(lambda: scorer.score_batch(normalized), 1)[0])
+    return result
+
+
+def bench_storage(rows, repeat, opts):
+    """Excel 與欄式儲存的讀取時間 (不經快取，直接呼叫後端)。"""
+    df = scorer.calculate_complexity(make_cases(rows))
+    result = {"rows": rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        parquet = storage.ParquetBackend()
+        path = os.path.join(tmp, "master" + parquet.suffix)
+        parquet.write(schema.normalize_case_frame(df), path)
+        result["parquet_read_s"] = _r(best_of(lambda: parquet.read(path), repeat)[0])
+        result["parquet_mb"] = round(os.path.getsize(path) / 2 ** 20, 2)
+        if rows <= opts.excel_max_rows:
+            excel = storage.ExcelBackend()
+            path = os.path.join(tmp, "master" + excel.suffix)
+            excel.write(df, path)
+            # openpyxl 解析很慢，只量一次
+            result["excel_read_s"] = _r(best_of(lambda: excel.read(path), 1)[0])
+            result["excel_mb"] = round(os.path.getsize(path) / 2 ** 20, 2)
+            result["speedup"] = round(result["excel_read_s"] / result["parquet_read_s"], 2)
+    return result
+
+
+def bench_loading(rows, repeat, opts):
+    """人力配置分析頁：PM 案件負擔與 Staff 加權負荷彙總。"""
+    master = scorer.calculate_complexity(make_cases(rows))
+    roi_df, dist_df = make_assignments(master, opts.people)
+    combined = pd.merge(master[['案件名稱', '案件類型', '複雜度評分']], roi_df[['案件名稱', 'PM名單', 'Staff名單']],
+                        on='案件名稱', how='left')
+    result = {"rows": rows, "people": opts.people}
+    engine_s, load = best_of(lambda: workload.compute_workload(combined, dist_df), repeat)
+    result["engine_s"] = _r(engine_s)
+    result["engine_pm_s"] = _r(best_of(lambda: workload.pm_workload(combined), repeat)[0])
+    if rows <= opts.legacy_max_rows:
+        legacy_s, legacy = best_of(lambda: legacy_pm_workload(combined), repeat)
+        pd.testing.assert_frame_equal(legacy.reset_index(drop=True), load["pm_summary"].reset_index(drop=True))
+        result.update(legacy_pm_s=_r(legacy_s), pm_speedup=round(legacy_s / result["engine_pm_s"], 2))
+    result["legacy_staff_s"] = _r(best_of(lambda: legacy_staff_workload(dist_df, master), repeat)[0])
+    return result
+
+
+def bench_roi(rows, repeat, opts):
+    """投報率分析頁：投報率、商務評價與異常案件篩選。"""
+    master = scorer.calculate_complexity(make_cases(rows))
+    roi_df, _ = make_assignments(master, opts.people)
+    calc_df = pd.merge(master[['案件名稱', '複雜度評分']], roi_df[['案件名稱', '最終報價(萬)', '預計工時']], on='案件名稱')
+    result = {"rows": rows}
+    engine_s, (engine, _) = best_of(lambda: roi.analyze(calc_df), repeat)
+    result["engine_s"] = _r(engine_s)
+    if rows <= opts.legacy_max_rows:
+        legacy_s, (legacy, bad_cases, star_cases) = best_of(lambda: legacy_roi(calc_df), repeat)
+        # 投報率、評價與兩類異常案件必須與逐列寫法一致
+        assert np.array_equal(legacy['投報率'].to_numpy(dtype=float), engine['投報率'].to_numpy())
+        assert np.array_equal(legacy['商務評價'].eq("high").to_numpy(), engine['高於平均'].to_numpy())
+        assert bad_cases.index.equals(engine.index[engine['象限'] == roi.RAISE_PRICE])
+        assert star_cases.index.equals(engine.index[engine['象限'] == roi.STAR])
+        result.update(legacy_s=_r(legacy_s), speedup=round(legacy_s / engine_s, 2))
+    return result
+
+
+def bench_optimizer(rows, repeat, opts):
+    """自動指派：rows 案件 × people 人員 (產能 0.5 / 1 / 1.5) 的負荷平衡建議。"""
+    master = scorer.calculate_complexity(make_cases(rows)).reset_index(drop=True)
+    master[schema.CASE_ID] = np.arange(1, rows + 1)
+    pms, staffs = make_people(opts.people)
+    roster = pd.DataFrame({'姓名': pms + staffs, '角色類型': ['PM'] * len(pms) + ['Staff'] * len(staffs)})
+    roster[optimizer.CAPACITY_COL] = np.random.default_rng(0).choice([0.5, 1.0, 1.5], len(roster))
+    seconds, proposal = best_of(lambda: optimizer.propose(master, roster), repeat)
+    loads = proposal["loads"].groupby('角色')['相對負荷']
+    # 最高 / 平均相對負荷，1.0 代表完全平均
+    balance = (loads.max() / loads.mean()).round(4).to_dict()
+    return {"rows": rows, "people": opts.people, "propose_s": _r(seconds), "max_over_mean": balance,
+            "stats": proposal["stats"]}
+
+
+@contextlib.contextmanager
+def _scratch_outputs(folder):
+    """匯入流程改寫到暫存輸出目錄 (主檔、匯入清單與解析快取)，結束後還原。"""
+    saved = storage.OUTPUT_DIR, ingest.MANIFEST_FILE, ingest.CACHE_DIR
+    storage.OUTPUT_DIR = folder
+    ingest.MANIFEST_FILE = os.path.join(folder, "ingest_manifest.json")
+    ingest.CACHE_DIR = os.path.join(folder, "ingest_cache")
+    storage.invalidate()
+    try:
+        yield
+    finally:
+        storage.OUTPUT_DIR, ingest.MANIFEST_FILE, ingest.CACHE_DIR = saved
+        storage.invalidate()
+
+
+def _timed_sync(folder, outputs, **kwargs):
+    with _scratch_outputs(outputs):
+        start = time.perf_counter()
+        master, report = ingest.sync(folder, **kwargs)
+        return time.perf_counter() - start, master, report
+
+
+def bench_ingest(rows, repeat, opts):
+    """
+    原始檔匯入：rows 案件平均分散到 opts.files 個月份活頁簿。
+    量測平行 / 逐檔解析 (parse_files，另記錄自動選擇的方式與門檻)、首次匯入、無變更時的重新匯入、新增一個月份的增量匯入，
+    以及全部改走串流解析 (大型活頁簿路徑) 的首次匯入；sync 會寫入檔案，只量一次。
+    """
+    if rows > opts.excel_max_rows:
+        return {"rows": rows, "files": opts.files, "skipped": f"> --excel-max-rows ({opts.excel_max_rows})"}
+    df = make_cases(rows)
+    result = {"rows": rows, "files": opts.files}
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = os.path.join(tmp, "raw")
+        os.makedirs(raw)
+        for month, part in enumerate(np.array_split(np.arange(rows), opts.files), 1):
+            df.iloc[part].to_excel(os.path.join(raw, f"cases_2025{month:02d}.xlsx"), index=False)
+        paths = ingest.list_raw_files(raw)
+        result["raw_mb"] = round(sum(os.path.getsize(p) for p in paths) / 2 ** 20, 2)
+        result["parse_serial_s"] = _r(best_of(lambda: ingest.parse_files(paths, max_workers=1), repeat)[0])
+        threshold = ingest.PARALLEL_MIN_BYTES
+        ingest.PARALLEL_MIN_BYTES = 0
+        try:
+            result["parse_parallel_s"] = _r(best_of(lambda: ingest.parse_files(paths), repeat)[0])
+        finally:
+            ingest.PARALLEL_MIN_BYTES = threshold
+        # 預設設定下 parse_files 實際採用的方式 (合計小於門檻時逐檔解析)
+        result["parallel_min_mb"] = round(threshold / 2 ** 20, 2)
+        result["parse_auto"] = "parallel" if ingest.use_pool(paths, len(paths)) else "serial"
+
+        outputs = os.path.join(tmp, "outputs")
+        seconds, master, _ = _timed_sync(raw, outputs)
+        assert len(master) == rows
+        result["sync_full_s"] = _r(seconds)
+        result["sync_noop_s"] = _r(_timed_sync(raw, outputs)[0])
+        make_cases(max(rows // opts.files, 1), seed=1).to_excel(os.path.join(raw, "cases_202601.xlsx"), index=False)
+        seconds, _, report = _timed_sync(raw, outputs)
+        assert report["parsed"] == ["cases_202601.xlsx"]
+        result["sync_incremental_s"] = _r(seconds)
+
+        threshold = ingest.STREAM_THRESHOLD_BYTES
+        ingest.STREAM_THRESHOLD_BYTES = 0
+        try:
+            result["sync_streamed_s"] = _r(_timed_sync(raw, os.path.join(tmp, "streamed"))[0])
+        finally:
+            ingest.STREAM_THRESHOLD_BYTES = threshold
+    return result
+
+
+BENCHES = {"scoring": bench_scoring, "storage": bench_storage, "loading": bench_loading, "roi": bench_roi,
+           "optimizer": bench_optimizer, "ingest": bench_ingest}
+
+
+# --- 5. 結果輸出與比較 ---
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(sizes, repeat, only, opts):
+    results = {name: [] for name in only}
+    for name in only:
+        for rows in sizes:
+            record = BENCHES[name](rows, repeat, opts)
+            print(name, record, flush=True)
+            results[name].append(record)
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """逐項列出兩次結果的秒數比值 (>1 代表目前較慢)。"""
+    rows = []
+    for name, records in current["results"].items():
+        base_by_rows = {r["rows"]: r for r in baseline.get("results", {}).get(name, [])}
+        for record in records:
+            base = base_by_rows.get(record["rows"], {})
+            for key, value in record.items():
+                if key.endswith("_s") and key in base and base[key]:
+                    rows.append({"bench": name, "rows": record["rows"], "metric": key,
+                                 "baseline": base[key], "current": value, "ratio": round(value / base[key], 2)})
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OMMS 效能基準測試")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="逗號分隔的案件數")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", default=",".join(BENCHES), help="逗號分隔的基準項目")
+    parser.add_argument("--people", type=int, default=500, help="合成人員數 (PM + Staff)")
+    parser.add_argument("--legacy-max-rows", type=int, default=100_000, help="逐列舊寫法只跑到此列數")
+    parser.add_argument("--excel-max-rows", type=int, default=100_000, help="Excel 讀取與匯入只跑到此列數")
+    parser.add_argument("--files", type=int, default=4, help="匯入基準的月份活頁簿數")
+    parser.add_argument("--output", help="結果 JSON 路徑 (預設 benchmark_results/<commit>.json)")
+    parser.add_argument("--compare", help="與先前的結果 JSON 比較")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = [s for s in args.only.split(",") if s]
+    report = run_suite(sizes, args.repeat, only, args)
+
+    output = args.output or os.path.join("benchmark_results", f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            print(compare(json.load(fh), report).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
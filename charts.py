@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+# --- 1. 大量資料點的圖表配置 ---
+# 散佈圖點數超過此門檻即改為「密度熱圖 + 個別異常點」，避免逐點傳送到瀏覽器
+MAX_POINTS = int(os.environ.get("OMMS_SCATTER_MAX_POINTS", "2000"))
+
+# 密度熱圖每軸的分箱數
+GRID_BINS = 60
+
+# 縮減後的圖表依資料版本快取 (同一 snapshot 重新整理頁面不必重算)
+CACHE_SIZE = 16
+_FIGURES = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def cached_figure(key, build):
+    """
+    以 key (頁面、資料版本、語系等) 快取 build() 產生的圖表；資料版本變動時 key 不同自然重建。
+    回傳的圖表為共用物件，呼叫端不應再修改。
+    """
+    with _LOCK:
+        fig = _FIGURES.get(key)
+        if fig is not None:
+            _FIGURES.move_to_end(key)
+            return fig
+    fig = build()
+    with _LOCK:
+        _FIGURES[key] = fig
+        while len(_FIGURES) > CACHE_SIZE:
+            _FIGURES.popitem(last=False)
+    return fig
+
+
+# --- 2. 縮減 ---
+def density_trace(x, y, name="", bins=GRID_BINS):
+    """二維分箱 (np.histogram2d) 的件數熱圖，空格子不著色；傳送量固定為 bins × bins。"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    counts, x_edges, y_edges = np.histogram2d(x[finite], y[finite], bins=bins)
+    return go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=np.where(counts > 0, counts, np.nan).T,
+        colorscale="Greys", showscale=False, opacity=0.6, name=name,
+        hovertemplate="%{x:.1f}, %{y:.1f}: %{z:.0f}<extra>" + name + "</extra>",
+    )
+
+
+def adaptive_scatter(df, x, y, outliers=None, priority=None, density_name="", **kwargs):
+    """
+    依點數選擇散佈圖的呈現方式：
+    1. 點數 <= MAX_POINTS：與 px.scatter 相同，逐點繪製。
+    2. 超過門檻：整體分布改畫密度熱圖，只有 outliers (布林遮罩) 標記的案件保留為個別點
+       (含 text / hover 標籤)；異常點本身仍超過門檻時，依 priority 由大到小取前 MAX_POINTS 筆。
+    """
+    if len(df) <= MAX_POINTS:
+        return px.scatter(df, x=x, y=y, **kwargs)
+    points = df.iloc[:0] if outliers is None else df[outliers]
+    if len(points) > MAX_POINTS:
+        if priority is None:
+            points = points.iloc[:MAX_POINTS]
+        else:
+            points = points.loc[priority[outliers].nlargest(MAX_POINTS).index]
+    fig = px.scatter(points, x=x, y=y, **kwargs)
+    # 熱圖放在最底層，異常點疊在上方
+    fig.add_trace(density_trace(df[x], df[y], density_name))
+    fig.data = fig.data[-1:] + fig.data[:-1]
+    return fig
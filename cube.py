@@ -0,0 +1,154 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+import scorer
+import storage
+import views
+from schema import CASE_ID
+
+# --- 1. 資料期間與彙總立方體配置 ---
+# 每個原始檔依檔名 (例如 cases_202601.xlsx) 標記資料期間，匯入主檔時一併保留
+PERIOD_COL = "資料期間"
+_PERIOD_PATTERN = re.compile(r"(20\d{2})[-_]?(0[1-9]|1[0-2])(?!\d)")
+
+# 期間 × 案件類型 × 風險層級 × PM 的彙總表；趨勢與期間比較只讀這張表
+CUBE = "case_cube"
+DIMENSIONS = [PERIOD_COL, "案件類型", "風險層級", "PM"]
+MEASURES = ["案件數", "複雜度合計"]
+UNASSIGNED = "(未指派)"
+UNCLASSIFIED = "(未分類)"
+
+
+def period_of(path):
+    """由檔名取出 YYYY-MM；檔名沒有年月時以檔名主體作為期間。"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = _PERIOD_PATTERN.search(stem)
+    return f"{match.group(1)}-{match.group(2)}" if match else stem
+
+
+def tag_period(df, path):
+    """在解析結果加上資料期間欄 (已存在時以檔名為準覆寫)。"""
+    out = df.copy()
+    out[PERIOD_COL] = period_of(path)
+    return out
+
+
+# --- 2. 單一期間的彙總 ---
+def _pm_weights(relation):
+    """每案各 PM 的分攤權重 (1 ÷ 該案 PM 人數)，多位 PM 共管的案件不會重複計數。"""
+    if relation is None or relation.empty or CASE_ID not in relation.columns:
+        return pd.DataFrame(columns=[CASE_ID, "PM", "權重"])
+    pms = relation[relation['角色'] == 'PM'].dropna(subset=[CASE_ID, '姓名'])
+    pms = pms.drop_duplicates(subset=[CASE_ID, '姓名'])
+    ids = pd.to_numeric(pms[CASE_ID], errors='coerce').to_numpy(dtype=float)
+    return pd.DataFrame({CASE_ID: ids, "PM": pms['姓名'].astype(str).to_numpy(),
+                         "權重": 1.0 / pms.groupby(CASE_ID)['姓名'].transform('size').to_numpy()})
+
+
+def period_slice(period, chunks, case_ids, relation, version):
+    """
+    將同一期間的原始檔 (一或多個，逐批傳入) 彙總成立方體的一個切片：
+    1. 以原始檔內容評分 (與主檔之後的人工編輯無關)，風險層級沿用 views.risk_codes。
+    2. 依案件名稱對照案件編號 (case_ids)，再依指派關聯表分攤給 PM；無 PM 的案件歸入 UNASSIGNED。
+    3. 各批次先各自彙總再加總，不必將整個期間的原始資料合併進記憶體。
+    4. 指派版本記錄彙總時指派關聯表的版本，供 is_stale 判斷是否需重建。
+    """
+    weights = _pm_weights(relation)
+    partials = [_aggregate(period, df, case_ids, weights) for df in chunks]
+    partials = [p for p in partials if p is not None]
+    if not partials:
+        return pd.DataFrame(columns=DIMENSIONS + MEASURES + ["指派版本"])
+    cube = pd.concat(partials, ignore_index=True).groupby(DIMENSIONS, sort=True)[MEASURES].sum().reset_index()
+    cube[MEASURES] = cube[MEASURES].round(4)
+    cube["指派版本"] = -1 if version is None else int(version)
+    return cube
+
+
+def _aggregate(period, df, case_ids, weights):
+    df = df.dropna(how='all')
+    if df.empty:
+        return None
+    if '複雜度評分' not in df.columns:
+        df = scorer.calculate_complexity(df, sort=False)
+    scores = pd.to_numeric(df['複雜度評分'], errors='coerce')
+    names = df['案件名稱'].astype(str) if '案件名稱' in df.columns else pd.Series("", index=df.index)
+    types = df['案件類型'].astype(str).where(df['案件類型'].notna(), UNCLASSIFIED) if '案件類型' in df.columns else UNCLASSIFIED
+    cases = pd.DataFrame({
+        PERIOD_COL: period,
+        CASE_ID: np.array(names.map(case_ids), dtype=float),
+        "案件類型": types,
+        "風險層級": views.risk_codes(scores),
+        "複雜度評分": scores.fillna(0).to_numpy(dtype=float),
+    })
+
+    merged = cases.merge(weights, on=CASE_ID, how='left')
+    merged["PM"] = merged["PM"].fillna(UNASSIGNED)
+    merged["權重"] = merged["權重"].fillna(1.0)
+    merged["案件數"] = merged["權重"]
+    merged["複雜度合計"] = merged["複雜度評分"] * merged["權重"]
+    return merged.groupby(DIMENSIONS, sort=True)[MEASURES].sum().reset_index()
+
+
+# --- 3. 寫入與讀取 ---
+def write(slices, full=False, bump=None):
+    """
+    寫入各期間切片 ({期間: DataFrame})：
+    1. full=True 時整表重寫 (重建)；否則只替換這些期間的列，其他期間的彙總不重算。
+    2. bump=(舊指派版本, 新指派版本)：指派關聯表只變更了部分案件時，其他期間中仍為舊版本彙總的列
+       PM 維度不受影響，直接標記為新版本，與重算的切片一次寫入。
+    """
+    if full:
+        frames = [s for s in slices.values() if not s.empty]
+        storage.write_table(CUBE, pd.concat(frames, ignore_index=True) if frames
+                            else pd.DataFrame(columns=DIMENSIONS + MEASURES + ["指派版本"]))
+        return
+    if bump is None:
+        for period, frame in slices.items():
+            storage.replace_rows(CUBE, {PERIOD_COL: period}, frame)
+        return
+    current = storage.read_table(CUBE)
+    if not current.empty:
+        current = current[~current[PERIOD_COL].isin(list(slices))].copy()
+        current.loc[pd.to_numeric(current["指派版本"], errors='coerce') == bump[0], "指派版本"] = bump[1]
+    frames = [f for f in [current] + list(slices.values()) if not f.empty]
+    storage.write_table(CUBE, pd.concat(frames, ignore_index=True) if frames
+                        else pd.DataFrame(columns=DIMENSIONS + MEASURES + ["指派版本"]))
+
+
+def stale_periods(cube, snapshot=None):
+    """指派版本與目前 (或釘選) 的指派關聯表版本不同的期間。"""
+    expected = storage.current_version("assignments") if snapshot is None else snapshot.get("assignments")
+    expected = -1 if expected is None else expected
+    return set(cube.loc[pd.to_numeric(cube["指派版本"], errors='coerce') != expected, PERIOD_COL])
+
+
+def is_stale(cube, snapshot):
+    """立方體缺少、或彙總時的指派版本與釘選的指派關聯表版本不同 (PM 維度已過期) 即需重建。"""
+    if cube.empty or "指派版本" not in cube.columns:
+        return True
+    expected = (snapshot or {}).get("assignments")
+    expected = -1 if expected is None else expected
+    return bool((pd.to_numeric(cube["指派版本"], errors='coerce') != expected).any())
+
+
+# --- 4. 趨勢與期間比較 ---
+def trend(cube, by=None):
+    """各期間 (可再依 by 維度細分) 的案件數、複雜度合計與平均複雜度。"""
+    keys = [PERIOD_COL] + ([by] if by else [])
+    out = cube.groupby(keys, sort=True)[MEASURES].sum().reset_index()
+    counts = out["案件數"].to_numpy(dtype=float)
+    out["平均複雜度"] = np.divide(out["複雜度合計"].to_numpy(dtype=float), counts,
+                              out=np.zeros(len(out)), where=counts > 0).round(2)
+    return out
+
+
+def compare(cube, base, target, by):
+    """兩個期間在 by 維度各類別的案件數與複雜度合計，以及比較期減基期的增減。"""
+    def side(period):
+        return trend(cube[cube[PERIOD_COL] == period], by).set_index(by)[MEASURES]
+
+    out = side(base).join(side(target), how='outer', lsuffix=f" ({base})", rsuffix=f" ({target})").fillna(0)
+    for measure in MEASURES:
+        out[f"{measure}增減"] = out[f"{measure} ({target})"] - out[f"{measure} ({base})"]
+    return out.round(2).reset_index()
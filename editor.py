@@ -0,0 +1,101 @@
+import os
+import numpy as np
+import pandas as pd
+
+# --- 1. 分頁編輯配置 ---
+# 主檔編輯器一次只放入一頁，篩選 / 排序在伺服器端以列位置完成，不複製整張主檔
+PAGE_SIZES = (50, 100, 200, 500)
+DEFAULT_PAGE_SIZE = int(os.environ.get("OMMS_EDITOR_PAGE_SIZE", "100"))
+if DEFAULT_PAGE_SIZE not in PAGE_SIZES:
+    PAGE_SIZES = tuple(sorted(PAGE_SIZES + (DEFAULT_PAGE_SIZE,)))
+
+# 排序選項：代碼 → (欄位, 遞增)；"seq" 為主檔原順序 (序號)
+SORTS = {
+    "seq": None,
+    "score_desc": ('複雜度評分', False),
+    "score_asc": ('複雜度評分', True),
+    "name": ('案件名稱', True),
+}
+
+
+# --- 2. 篩選、排序與分頁 ---
+def select_rows(df, case_types=None, score_range=None, search="", sort="seq"):
+    """
+    回傳符合條件的列位置 (依排序)：
+    1. case_types：案件類型清單，空值代表不篩選。
+    2. score_range：(下限, 上限)；尚未評分 (空值) 的列一律保留，避免剛編輯的案件被篩掉。
+    3. search：案件名稱包含的文字 (不分大小寫)。
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if case_types and '案件類型' in df.columns:
+        mask &= df['案件類型'].isin(case_types).to_numpy()
+    if score_range is not None and '複雜度評分' in df.columns:
+        scores = pd.to_numeric(df['複雜度評分'], errors='coerce').to_numpy(dtype=float)
+        lo, hi = score_range
+        mask &= np.isnan(scores) | ((scores >= lo) & (scores <= hi))
+    if search and '案件名稱' in df.columns:
+        mask &= df['案件名稱'].astype(str).str.contains(search, case=False, regex=False, na=False).to_numpy()
+    positions = np.flatnonzero(mask)
+
+    spec = SORTS.get(sort)
+    if spec is None or spec[0] not in df.columns:
+        return positions
+    col, ascending = spec
+    values = pd.Series(df[col].to_numpy()[positions])
+    if col == '複雜度評分':
+        values = pd.to_numeric(values, errors='coerce')
+    order = values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+    return positions[order]
+
+
+def page_count(n_rows, size):
+    return max(1, -(-n_rows // size))
+
+
+def page_rows(positions, page, size):
+    """第 page 頁 (由 1 起算) 的列位置。"""
+    start = (page - 1) * size
+    return positions[start:start + size]
+
+
+# --- 3. 寫回 ---
+def apply_page(base, positions, page_edited, delta):
+    """
+    將編輯器回傳的單頁結果套回全表：
+    1. base 為全表 (編輯器欄位格式、RangeIndex)，positions 為本頁各列在全表的位置。
+    2. 只取代被編輯的列、刪除被刪的列，新增列附加在全表最後。
+    3. 另回傳換算成全表位置的 delta (edited_rows / deleted_rows / added_rows)，
+       與整表編輯器的差異格式相同，可直接交給增量評分。
+    """
+    deleted = sorted(int(i) for i in delta.get("deleted_rows", []))
+    dropped = set(deleted)
+    changes = {int(i): v for i, v in delta.get("edited_rows", {}).items() if int(i) not in dropped}
+    edited = np.array(sorted(changes), dtype=int)
+    added = delta.get("added_rows", [])
+
+    # 編輯器回傳：本頁未刪除的列 (原順序) + 新增列
+    kept = np.setdiff1d(np.arange(len(positions)), deleted)
+    existing = page_edited.iloc[:len(kept)]
+    rows = existing.iloc[np.searchsorted(kept, edited)].set_axis(positions[edited])
+    result = pd.concat([base.drop(index=positions[edited]), rows]).sort_index()
+    result = result.drop(index=positions[deleted]).reset_index(drop=True)
+    if added:
+        result = pd.concat([result, page_edited.iloc[len(kept):]], ignore_index=True)
+
+    full_delta = {
+        "edited_rows": {int(positions[i]): changes[i] for i in edited},
+        "deleted_rows": [int(positions[i]) for i in deleted],
+        "added_rows": added,
+    }
+    return result, full_delta
+
+
+def carry_scores(prev_scores, full_delta):
+    """
+    沿用未變動列的分數：被編輯與新增的列分數清為空值 (待下次評分)，被刪除的列一併移除。
+    回傳與 apply_page 結果列數相同的陣列。
+    """
+    scores = np.asarray(prev_scores, dtype=float).copy()
+    scores[list(full_delta["edited_rows"])] = np.nan
+    scores = np.delete(scores, full_delta["deleted_rows"])
+    return np.concatenate([scores, np.full(len(full_delta["added_rows"]), np.nan)])
@@ -0,0 +1,579 @@
+import glob
+import hashlib
+import itertools
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import openpyxl
+import pandas as pd
+import cube
+import jobs
+import scorer
+import storage
+import views
+from schema import CASE_ID
+
+# --- 1. 路徑配置 ---
+RAW_DIR = os.path.join(storage.BASE_DIR, "inputs_raw_cases")
+MANIFEST_FILE = os.path.join(storage.OUTPUT_DIR, "ingest_manifest.json")
+CACHE_DIR = os.path.join(storage.OUTPUT_DIR, "ingest_cache")
+
+KEY_COL = "案件名稱"
+
+# 平行解析的 worker 數 (0 或未設定 = CPU 核心數)；設為 1 即改回逐檔解析
+MAX_WORKERS = int(os.environ.get("OMMS_INGEST_WORKERS", "0")) or None
+
+# 待解析檔案合計小於此大小 (MB) 時逐檔解析：小型活頁簿的解析時間遠小於啟動子程序的成本
+PARALLEL_MIN_BYTES = int(float(os.environ.get("OMMS_PARALLEL_MIN_MB", "4")) * 1024 * 1024)
+
+# 超過此大小 (MB) 的 .xlsx 改用 openpyxl 唯讀模式串流解析，每次只持有 CHUNK_ROWS 列
+STREAM_THRESHOLD_BYTES = int(os.environ.get("OMMS_STREAM_THRESHOLD_MB", "20")) * 1024 * 1024
+CHUNK_ROWS = 5000
+
+
+# --- 2. 檔案清單與指紋 ---
+def list_raw_files(folder=RAW_DIR):
+    files = glob.glob(os.path.join(folder, "*.xls*"))
+    return sorted(f for f in files if not os.path.basename(f).startswith("~$"))
+
+
+def content_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest():
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, encoding="utf-8") as fh:
+            return json.load(fh)
+    return {"files": {}}
+
+
+def save_manifest(manifest):
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh, ensure_ascii=False, indent=2)
+    storage.atomic_write(MANIFEST_FILE, write)
+
+
+def plan(manifest, files):
+    """
+    比對清單與目前檔案，回傳 (新增或變更的檔案, 未變更的檔案)。
+    size 與 mtime 皆相同時視為未變更，不必計算雜湊；
+    僅 mtime 變動但內容雜湊相同時只更新清單紀錄。
+    """
+    changed, unchanged = [], []
+    for path in files:
+        stat = os.stat(path)
+        entry = manifest["files"].get(os.path.basename(path))
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            unchanged.append(path)
+            continue
+        sha = content_hash(path)
+        if entry and entry["sha256"] == sha and os.path.exists(_cache_path(sha)):
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            unchanged.append(path)
+        else:
+            changed.append((path, sha))
+    return changed, unchanged
+
+
+# --- 3. 解析 (可平行) 與快取 ---
+def read_raw_file(path, sheet_name=0):
+    df = pd.read_excel(path, sheet_name=sheet_name, header=0)
+    df.columns = df.columns.str.strip()
+    return df.dropna(how='all')
+
+
+def _typed_chunk(rows, columns):
+    """將 openpyxl 的列資料轉為 DataFrame，型別推斷比照 pd.read_excel (全空欄位 / 含空值整數欄 → float)。"""
+    df = pd.DataFrame.from_records([row[:len(columns)] for row in rows], columns=columns)
+    for col in df.columns[df.dtypes == object]:
+        kind = pd.api.types.infer_dtype(df[col], skipna=True)
+        if kind in ("empty", "integer", "floating", "mixed-integer-float"):
+            df[col] = pd.to_numeric(df[col]).astype(float) if kind == "empty" else pd.to_numeric(df[col])
+        elif kind in ("datetime", "date"):
+            df[col] = pd.to_datetime(df[col])
+    return df.dropna(how='all')
+
+
+def iter_excel_chunks(path, chunksize=CHUNK_ROWS, sheet_name=0):
+    """
+    串流讀取大型活頁簿：
+    1. 以 openpyxl read_only 模式逐列迭代，不建立整份工作表的 DOM。
+    2. 每累積 chunksize 列產生一個已去除欄名空白、移除全空列的 DataFrame。
+    """
+    book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = book.worksheets[sheet_name] if isinstance(sheet_name, int) else book[sheet_name]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c).strip() if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunksize:
+                yield _typed_chunk(buffer, columns)
+                buffer = []
+        if buffer:
+            yield _typed_chunk(buffer, columns)
+    finally:
+        book.close()
+
+
+def iter_frame_chunks(df, chunksize=CHUNK_ROWS):
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+def _should_stream(path):
+    return path.lower().endswith((".xlsx", ".xlsm")) and os.path.getsize(path) > STREAM_THRESHOLD_BYTES
+
+
+def _parse_task(task):
+    # 需為模組層級函式，才能交給子程序執行
+    path, sheet, spool_dir = task
+    start = time.perf_counter()
+    if _should_stream(path):
+        # 大型活頁簿逐批寫入暫存分段檔，只把路徑交回主程序，不在 worker 中合併整份資料
+        result = storage.ChunkSpool(os.path.join(spool_dir, uuid.uuid4().hex))
+        try:
+            for chunk in iter_excel_chunks(path, sheet_name=sheet):
+                result.append(chunk)
+        except BaseException:
+            # 解析失敗時刪除已寫出的分段，不留下孤立的暫存資料夾
+            result.close()
+            raise
+    else:
+        result = read_raw_file(path, sheet)
+    return result, time.perf_counter() - start
+
+
+def _sheet_names(path):
+    with pd.ExcelFile(path) as book:
+        return book.sheet_names
+
+
+def parse_files(paths, max_workers=MAX_WORKERS, sheet_name=0, progress=None):
+    """
+    將多個活頁簿的解析分散到 ProcessPoolExecutor：
+    1. sheet_name=None 時每個工作表各自成為一個工作單位，其餘只讀取指定工作表。
+    2. 結果依輸入檔案順序 (工作表依活頁簿順序) 回傳，與 worker 完成先後無關。
+    3. 回傳 [(path, 解析結果, 解析秒數)]；progress(完成比例, 檔名) 於每個工作單位完成時呼叫。
+    4. 只有一個工作單位、或檔案合計小於 PARALLEL_MIN_BYTES 時不啟動 process pool，直接逐檔解析。
+    5. 任一工作單位失敗時刪除所有已寫出的暫存分段後再拋出例外。
+    解析結果一般為 DataFrame；超過 STREAM_THRESHOLD_BYTES 的活頁簿為 storage.ChunkSpool (分段暫存)，
+    以 iter_chunks 逐批讀取，用畢須 close()。
+    """
+    spool_dir = os.path.join(CACHE_DIR, "spool")
+    tasks = []
+    for path in paths:
+        sheets = _sheet_names(path) if sheet_name is None else [sheet_name]
+        tasks.extend((path, sheet, spool_dir) for sheet in sheets)
+    if not tasks:
+        return []
+
+    results, futures = [], []
+
+    def collect(outputs):
+        for result in outputs:
+            results.append(result)
+            if progress:
+                progress(len(results) / len(tasks), os.path.basename(tasks[len(results) - 1][0]))
+
+    try:
+        if not use_pool(paths, len(tasks), max_workers):
+            collect(_parse_task(task) for task in tasks)
+        else:
+            workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+            with ProcessPoolExecutor(max_workers=workers, mp_context=jobs.process_context()) as pool:
+                futures = [pool.submit(_parse_task, task) for task in tasks]
+                try:
+                    collect(future.result() for future in futures)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+    except BaseException:
+        # 任一工作單位失敗時，其他已完成工作單位 (含尚未取回結果者) 的暫存分段一併刪除
+        finished = [f.result() for f in futures[len(results):]
+                    if f.done() and not f.cancelled() and f.exception() is None]
+        for item, _ in results + finished:
+            if isinstance(item, storage.ChunkSpool):
+                item.close()
+        raise
+
+    grouped = {path: ([], 0.0) for path in paths}
+    for (path, _, _), (item, seconds) in zip(tasks, results):
+        items, total = grouped[path]
+        items.append(item)
+        grouped[path] = (items, total + seconds)
+    return [(path, _combine(items), seconds) for path, (items, seconds) in grouped.items()]
+
+
+def use_pool(paths, n_tasks, max_workers=MAX_WORKERS):
+    """parse_files 是否以 process pool 平行解析。"""
+    if max_workers == 1 or n_tasks < 2:
+        return False
+    return sum(os.path.getsize(path) for path in set(paths)) >= PARALLEL_MIN_BYTES
+
+
+def _combine(items):
+    """同一活頁簿多個工作表的解析結果合併 (同一檔案的各工作表是否串流一致)。"""
+    if len(items) == 1:
+        return items[0]
+    if isinstance(items[0], storage.ChunkSpool):
+        return storage.ChunkSpool.merge(items)
+    return pd.concat(items, ignore_index=True)
+
+
+def iter_chunks(item, chunksize=CHUNK_ROWS):
+    """逐批走訪解析結果：ChunkSpool 依分段讀回，DataFrame 依 chunksize 切分。"""
+    if isinstance(item, storage.ChunkSpool):
+        return item.chunks()
+    return iter_frame_chunks(item, chunksize)
+
+
+def _close(parsed):
+    for item in parsed.values():
+        if isinstance(item, storage.ChunkSpool):
+            item.close()
+
+
+def _cache_path(sha):
+    return os.path.join(CACHE_DIR, sha[:16] + storage.file_backend().suffix)
+
+
+def _record_file(manifest, path, sha, item):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    backend = storage.file_backend()
+    if isinstance(item, storage.ChunkSpool):
+        # 串流解析的結果逐批附加寫入快取 (Parquet 為 row group)
+        storage.atomic_write(_cache_path(sha), lambda tmp: backend.write_chunks(item, tmp))
+    else:
+        storage.atomic_write(_cache_path(sha), lambda tmp: backend.write(item, tmp))
+    rows, cases = 0, []
+    for chunk in iter_chunks(item):
+        rows += len(chunk)
+        if KEY_COL in chunk.columns:
+            cases += chunk[KEY_COL].dropna().astype(str).tolist()
+    stat = os.stat(path)
+    previous = manifest["files"].get(os.path.basename(path), {})
+    manifest["files"][os.path.basename(path)] = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha,
+        "rows": rows,
+        "cases": cases,
+    }
+    return previous.get("cases", [])
+
+
+def _iter_cached(manifest, path, chunksize=CHUNK_ROWS):
+    """逐批讀取解析快取；舊版快取沒有資料期間欄，讀取時依檔名補上。"""
+    entry = manifest["files"][os.path.basename(path)]
+    for chunk in storage.file_backend().read_chunks(_cache_path(entry["sha256"]), chunksize):
+        yield cube.tag_period(chunk, path)
+
+
+def _iter_source(parsed, manifest, path):
+    return iter_chunks(parsed[path]) if path in parsed else _iter_cached(manifest, path)
+
+
+# --- 4. 穩定案件編號 ---
+def assign_case_ids(df, manifest=None, reserved=(), seen=None):
+    """
+    為缺少案件編號的列配發編號 (清單中的 case_ids 對照與 next_case_id 計數器)：
+    1. 已有編號的列保留原編號，並以目前的案件名稱更新對照 (改名後重新匯入仍沿用)。
+    2. 缺編號的列依案件名稱沿用對照中的編號，重新匯入或重設後重建皆不變；
+       同名案件只有第一筆能沿用，其餘視為新案件。
+    3. 其餘由計數器遞增配發，已刪除案件的編號不會被重複使用。
+    reserved 為其他資料列已使用的編號 (例如 upsert 時主檔中保留的案件)，沿用時一併避開。
+    分批配發時 seen 為先前批次已出現的案件名稱 (set，就地加入本批名稱)，對照仍以第一筆為準。
+    未傳入 manifest 時自行讀取並寫回清單 (主頁編輯器新增列時使用)。
+    """
+    own = manifest is None
+    if own:
+        manifest = load_manifest()
+    mapping = manifest.setdefault("case_ids", {})
+    next_id = manifest.get("next_case_id", max(mapping.values(), default=0) + 1)
+
+    out = df.copy()
+    if CASE_ID not in out.columns:
+        out.insert(0, CASE_ID, pd.NA)
+    ids = np.array(pd.to_numeric(out[CASE_ID], errors='coerce'), dtype=float)
+    names = out[KEY_COL].astype(str).to_numpy() if KEY_COL in out.columns else np.full(len(out), "")
+    missing = np.isnan(ids)
+    if missing.any():
+        reused = np.array(pd.Series(names[missing]).map(mapping), dtype=float)
+        # 沿用的編號不可與表中其他列 (或同批的同名案件) 重複
+        kept = np.concatenate([np.asarray(reserved, dtype=float), ids[~missing]])
+        taken = pd.Series(np.concatenate([kept, reused]))
+        clash = taken.duplicated(keep='first').to_numpy()[len(kept):]
+        reused[clash] = np.nan
+        fresh = np.isnan(reused)
+        reused[fresh] = np.arange(next_id, next_id + fresh.sum())
+        next_id += int(fresh.sum())
+        ids[missing] = reused
+    next_id = max(next_id, int(np.nanmax(ids)) + 1 if len(ids) else next_id)
+    out[CASE_ID] = pd.array(ids, dtype="Float64").astype("Int32")
+
+    # 更新 名稱 → 編號 對照 (同名以第一筆為準)
+    named = pd.Series(ids.astype(int), index=names)
+    named = named[~named.index.duplicated(keep='first') & (named.index != "") & (named.index != "nan")]
+    if seen is not None:
+        named = named[~named.index.isin(seen)]
+        seen.update(named.index)
+    mapping.update({name: int(i) for name, i in named.items()})
+    manifest["next_case_id"] = int(next_id)
+    if own:
+        save_manifest(manifest)
+    return out
+
+
+def ensure_case_ids(master=None, manifest=None):
+    """
+    既有主檔 (舊版或使用者新增列) 缺少案件編號時補齊並寫回；只配發編號，不解析原始檔。
+    舊版 ROI / 分工 / 指派資料表缺少案件編號時一併依主檔補上並寫回。
+    """
+    if master is None:
+        master = storage.read_table("master_data")
+    if not master.empty and (CASE_ID not in master.columns or master[CASE_ID].isna().any()):
+        master = storage.write_table("master_data", assign_case_ids(master, manifest))
+    if not master.empty:
+        storage.backfill_case_ids(master)
+    return master
+
+
+# --- 5. 增量匯入主流程 ---
+def _parse_changed(changed, report, max_workers, progress=None):
+    parsed = parse_files([path for path, _ in changed], max_workers=max_workers, progress=progress)
+    report["timings"] = {os.path.basename(path): round(seconds, 3) for path, _, seconds in parsed}
+    return {path: _tag_period(item, path) for path, item, _ in parsed}
+
+
+def _tag_period(item, path):
+    if isinstance(item, storage.ChunkSpool):
+        item.tag(cube.PERIOD_COL, cube.period_of(path))
+        return item
+    return cube.tag_period(item, path)
+
+
+def _with_case_ids(chunks, manifest, reserved=(), used=None, seen=None):
+    """
+    逐批配發案件編號 (移除全空列)；已配發的編號累積為後續批次的 reserved，結果與整批配發相同。
+    分成多組批次配發時 (例如增量匯入逐期間寫入)，傳入同一組 used (編號陣列的 list) 與 seen 延續狀態。
+    """
+    used = [np.asarray(reserved, dtype=float)] if used is None else used
+    seen = set() if seen is None else seen
+    for chunk in chunks:
+        chunk = chunk.dropna(how='all')
+        if chunk.empty:
+            continue
+        chunk = assign_case_ids(chunk, manifest, reserved=np.concatenate(used), seen=seen)
+        used.append(chunk[CASE_ID].to_numpy(dtype=float))
+        yield chunk
+
+
+def _backfill_periods(master, manifest):
+    """舊版主檔的列沒有資料期間：依清單中各檔的案件名稱補上 (同名案件以較新的檔案為準)。"""
+    if KEY_COL not in master.columns:
+        return master
+    periods = {}
+    for name in sorted(manifest["files"]):
+        periods.update(dict.fromkeys(manifest["files"][name].get("cases", []), cube.period_of(name)))
+    missing = master[cube.PERIOD_COL].isna() if cube.PERIOD_COL in master.columns else pd.Series(True, index=master.index)
+    if not missing.any():
+        return master
+    master = master.copy()
+    filled = master[KEY_COL].astype(str).map(periods)
+    master[cube.PERIOD_COL] = master[cube.PERIOD_COL].where(~missing, filled) if cube.PERIOD_COL in master.columns else filled
+    return master
+
+
+def refresh_cube(folder=RAW_DIR, manifest=None, parsed=None, periods=None, since=None):
+    """
+    由各原始檔的解析結果 (本次解析或解析快取) 彙總 case_cube：
+    1. periods 為需重算的期間 (新增 / 變更檔案、或指派變更的案件所屬期間)，只替換這些期間的切片。
+    2. periods 為 None 時重建整個立方體 (重設匯入、首次建立)。
+    3. since 為指派關聯表寫入前的版本：其他期間仍為該版本彙總的列直接標記為目前版本 (見 cube.write)。
+    同一期間有多個檔案時合併彙總。
+    """
+    manifest = manifest or load_manifest()
+    parsed = parsed or {}
+    by_period = {}
+    for path in list_raw_files(folder):
+        entry = manifest["files"].get(os.path.basename(path))
+        if path in parsed or (entry and os.path.exists(_cache_path(entry["sha256"]))):
+            by_period.setdefault(cube.period_of(path), []).append(path)
+    targets = sorted(by_period) if periods is None else sorted(set(periods) & set(by_period))
+    relation = storage.read_table("assignments")
+    version = storage.current_version("assignments")
+    slices = {}
+    for period in targets:
+        chunks = itertools.chain.from_iterable(_iter_source(parsed, manifest, path) for path in by_period[period])
+        slices[period] = cube.period_slice(period, chunks, manifest.get("case_ids", {}), relation, version)
+    bump = None if since is None else (since, -1 if version is None else int(version))
+    cube.write(slices, full=periods is None, bump=bump)
+    return slices
+
+
+def refresh_cube_cases(case_ids, since, folder=RAW_DIR):
+    """
+    指派關聯表寫入後呼叫 (assignments.save_case、optimizer.save_proposal)：
+    只重算這些案件出現過的期間，其他期間沿用並標記為新的指派版本，不必重建整個立方體。
+    since 為寫入前的指派關聯表版本；版本恰好前進一版 (期間無其他寫入) 才沿用其他期間，
+    否則其他期間維持過期，由總覽頁以背景工作 (refresh_stale_cube) 重算。立方體尚未建立時不處理。
+    """
+    if not storage.exists(cube.CUBE):
+        return {}
+    manifest = load_manifest()
+    ids = {int(i) for i in pd.to_numeric(pd.Series(list(case_ids)), errors='coerce').dropna()}
+    # 立方體以名稱 → 編號對照 (清單的 case_ids) 連結指派，依對照找出這些案件的名稱與所屬期間
+    names = {name for name, case_id in manifest.get("case_ids", {}).items() if case_id in ids}
+    periods = {cube.period_of(name) for name, entry in manifest["files"].items()
+               if names.intersection(entry.get("cases", []))}
+    version = storage.current_version("assignments")
+    consecutive = version is not None and version == (since or 0) + 1
+    return refresh_cube(folder, manifest, periods=periods,
+                        since=(-1 if since is None else int(since)) if consecutive else None)
+
+
+def refresh_stale_cube(folder=RAW_DIR):
+    """
+    重算指派版本落後的期間 (例如回復指派關聯表、或寫入時未經 refresh_cube_cases)；
+    立方體不存在時整個建立。總覽頁發現立方體過期時以背景工作呼叫，不在頁面執行時寫入。
+    """
+    data = storage.read_table(cube.CUBE)
+    if data.empty or "指派版本" not in data.columns:
+        return refresh_cube(folder)
+    return refresh_cube(folder, periods=cube.stale_periods(data))
+
+
+def sync(folder=RAW_DIR, max_workers=MAX_WORKERS, rebuild=False, progress=None):
+    """
+    增量匯入 inputs_raw_cases：
+    1. 主檔不存在 (首次) 或 rebuild=True (重設)：未變更的檔案直接讀取解析快取，
+       只解析新增/變更的檔案後重建主檔；重建完成才覆寫，期間其他頁面仍讀得到舊主檔。
+    2. 主檔已存在：僅將新增/變更檔案的案件以「資料期間 + 案件名稱」upsert 進主檔，
+       變更檔案中已移除的案件一併刪除；其他期間的同名案件保留 (與重建結果相同)。
+       若主檔已評分，新案件會一併評分。
+    3. 每列標記來源檔的資料期間，並只重新彙總新增/變更檔案所屬期間的 case_cube 切片。
+    新增/變更檔案經 parse_files 平行解析；配發編號、評分與寫入快取 / 主檔皆逐批進行，
+    大型活頁簿不會在記憶體中合併成單一 DataFrame。
+    回傳 (主檔 DataFrame, 匯入摘要 dict，含各檔解析秒數)。
+    progress(進度 0~1, 說明) 供背景工作回報進度 (見 jobs.py)。
+    """
+    def step(fraction, message):
+        if progress:
+            progress(fraction, message)
+
+    manifest = load_manifest()
+    files = list_raw_files(folder)
+    step(0.05, "比對匯入清單")
+    changed, unchanged = plan(manifest, files)
+    report = {"parsed": [os.path.basename(p) for p, _ in changed], "reused": len(unchanged)}
+    # 解析占整體進度的 5% ~ 75%
+    parsed = _parse_changed(changed, report, max_workers,
+                            progress=lambda done, name: step(0.05 + 0.7 * done, f"解析 {name}"))
+    step(0.8, "更新主檔")
+    try:
+        if rebuild or not storage.exists("master_data"):
+            master = _rebuild(folder, manifest, files, changed, parsed, rebuild)
+        else:
+            master = _upsert(folder, manifest, changed, parsed)
+    finally:
+        _close(parsed)
+    return master, report
+
+
+def _rebuild(folder, manifest, files, changed, parsed, rebuild):
+    changed_sha = dict(changed)
+    for path in files:
+        if path in changed_sha:
+            _record_file(manifest, path, changed_sha[path], parsed[path])
+    if not files:
+        if rebuild:
+            storage.delete_table("master_data")
+            refresh_cube(folder, manifest, parsed)
+        save_manifest(manifest)
+        return pd.DataFrame()
+    chunks = itertools.chain.from_iterable(_iter_source(parsed, manifest, path) for path in files)
+    storage.write_table_chunks("master_data", _with_case_ids(chunks, manifest))
+    master = storage.read_table("master_data")
+    views.refresh(master)
+    refresh_cube(folder, manifest, parsed)
+    save_manifest(manifest)
+    return master
+
+
+def _upsert(folder, manifest, changed, parsed):
+    master = ensure_case_ids(storage.read_table("master_data"), manifest)
+    if manifest["files"] and not master.empty and cube.PERIOD_COL not in master.columns:
+        # 舊版主檔只補一次資料期間，之後新增的列由匯入時標記
+        master = storage.write_table("master_data", _backfill_periods(master, manifest))
+    if not changed:
+        save_manifest(manifest)
+        return master
+
+    # 既有主檔但尚無清單：視為主檔已涵蓋現有檔案，只建立基準紀錄不覆寫使用者編輯
+    baseline = not manifest["files"]
+    stale = set()
+    for path, sha in changed:
+        period = cube.period_of(path)
+        old_cases = _record_file(manifest, path, sha, parsed[path])
+        new_cases = manifest["files"][os.path.basename(path)]["cases"]
+        stale.update((period, name) for name in old_cases + new_cases)
+    if baseline:
+        save_manifest(manifest)
+        return master
+
+    # 主檔只在記憶體中篩出保留的列 (取已使用的編號、欄位與序號)，不整表寫回
+    kept = _backfill_periods(master, manifest)
+    if KEY_COL in kept.columns and cube.PERIOD_COL in kept.columns:
+        keys = pd.MultiIndex.from_arrays([kept[cube.PERIOD_COL].astype(str), kept[KEY_COL].astype(str)])
+        kept = kept[~keys.isin(list(stale))]
+    used = [kept[CASE_ID].dropna().to_numpy(dtype=float) if CASE_ID in kept.columns else np.array([])]
+    seen = set()
+    seq = None
+    if '序號' in kept.columns:
+        seq = itertools.count(int(pd.to_numeric(kept['序號'], errors='coerce').max()) + 1 if len(kept) else 1)
+    template = kept.iloc[:0].drop(columns=['序號', '複雜度評分'], errors='ignore')
+
+    # 依期間刪除變更檔案的舊案件 (資料期間 + 案件名稱) 並逐批寫入新列，其他列不動
+    by_period = {}
+    for path, _ in changed:
+        by_period.setdefault(cube.period_of(path), []).append(path)
+    for period, paths in sorted(by_period.items()):
+        incoming = itertools.chain.from_iterable(iter_chunks(parsed[path]) for path in paths)
+        # 重新匯入的案件依名稱沿用原編號
+        incoming = _with_case_ids((chunk.drop(columns=[CASE_ID], errors='ignore') for chunk in incoming),
+                                  manifest, used=used, seen=seen)
+        if '複雜度評分' in kept.columns:
+            # 補齊主檔欄位後再逐批評分 (單月檔案可能缺少部分欄位)
+            incoming = scorer.score_chunks(pd.concat([template, chunk]) for chunk in incoming)
+        names = sorted(name for stale_period, name in stale if stale_period == period)
+        storage.replace_rows("master_data", {cube.PERIOD_COL: period, KEY_COL: names}, _numbered(incoming, seq))
+    master = storage.read_table("master_data")
+    if '複雜度評分' in kept.columns:
+        views.refresh(master)
+    refresh_cube(folder, manifest, parsed, set(by_period) if storage.exists(cube.CUBE) else None)
+    # 主檔寫入成功後才更新清單，避免中途失敗造成檔案被誤判為已匯入
+    save_manifest(manifest)
+    return master
+
+
+def _numbered(chunks, seq):
+    """新列接續主檔的序號 (seq 為 itertools.count，跨期間連續)；主檔沒有序號欄 (seq 為 None) 時原樣傳回。"""
+    for chunk in chunks:
+        if seq is not None:
+            chunk = chunk.assign(序號=list(itertools.islice(seq, len(chunk))))
+        yield chunk
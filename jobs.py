@@ -0,0 +1,134 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 1. 背景工作配置 ---
+# 匯入與評分在背景執行緒執行，Streamlit 腳本只負責送出工作與輪詢進度
+MAX_WORKERS = int(os.environ.get("OMMS_JOB_WORKERS", "2"))
+
+# 工作表只保留最近的紀錄，避免長時間執行的程序無限累積
+MAX_HISTORY = 50
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# 可跨 session 共用的工作類型：重複執行結果相同 (匯入只依原始檔與清單)，執行中時直接沿用既有工作；
+# 其他工作 (評分) 帶有各 session 自己的編輯內容，只在同一 session 內沿用
+SHARED_KINDS = ("ingest",)
+
+# 模組層級：同一個 Streamlit 程序內所有 session 共用同一組 worker 與工作表
+_POOL = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="omms-job")
+_JOBS = {}
+_LOCK = threading.Lock()
+_IDS = itertools.count(1)
+
+
+class Job:
+    """
+    單一背景工作的狀態：
+    1. status 依序為 queued → running → done / failed。
+    2. progress (0~1) 與 message 由工作函式透過 report 回報，頁面輪詢顯示。
+    3. 完成後結果存於 result，失敗時 error 為例外訊息、trace 為完整堆疊。
+    4. session 為送出工作的 Streamlit session 識別碼 (None 代表不屬於任何 session)。
+    """
+
+    def __init__(self, job_id, kind, session=None):
+        self.id = job_id
+        self.kind = kind
+        self.session = session
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.trace = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def report(self, progress, message=""):
+        with _LOCK:
+            self.progress = min(max(float(progress), 0.0), 1.0)
+            if message:
+                self.message = message
+
+
+def process_context():
+    """
+    子程序啟動方式：匯入 / 批次評分會在背景執行緒裡開 ProcessPoolExecutor，
+    fork 可能複製到被其他執行緒鎖住的狀態而卡死，因此改用 forkserver (Windows 為 spawn)。
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+# --- 2. 送出與查詢 ---
+def _run(job, fn, args, kwargs):
+    with _LOCK:
+        job.status, job.started = RUNNING, time.time()
+    try:
+        result = fn(job.report, *args, **kwargs)
+    except Exception as exc:
+        with _LOCK:
+            job.status, job.error, job.trace = FAILED, str(exc), traceback.format_exc()
+            job.finished = time.time()
+        return
+    with _LOCK:
+        job.status, job.result, job.progress = DONE, result, 1.0
+        job.finished = time.time()
+
+
+def submit(kind, fn, *args, session=None, **kwargs):
+    """
+    送出背景工作並回傳 Job；fn 的第一個參數為進度回報函式 report(progress, message)。
+    同類工作尚在執行時直接回傳既有的工作，不重複執行：
+    SHARED_KINDS (ingest) 不分 session 沿用；其他類型只沿用同一 session 送出的工作，
+    避免另一個 session 拿到別人的評分結果而遺失自己的編輯。
+    """
+    with _LOCK:
+        for job in _JOBS.values():
+            if job.kind == kind and job.active and (kind in SHARED_KINDS or job.session == session):
+                return job
+        job = Job(next(_IDS), kind, session)
+        _JOBS[job.id] = job
+        for old in sorted(_JOBS)[:-MAX_HISTORY]:
+            if not _JOBS[old].active:
+                del _JOBS[old]
+    _POOL.submit(_run, job, fn, args, kwargs)
+    return job
+
+
+def get(job_id):
+    with _LOCK:
+        return _JOBS.get(job_id)
+
+
+def active(kind=None, session=None):
+    """回傳尚未結束的工作 (可依類型、送出的 session 篩選)。"""
+    with _LOCK:
+        return [job for job in _JOBS.values() if job.active and (kind is None or job.kind == kind)
+                and (session is None or job.session == session)]
+
+
+def blocking(session):
+    """session 須等待的工作：自己送出的工作，以及會重寫主檔的共用工作 (SHARED_KINDS)。"""
+    with _LOCK:
+        return [job for job in _JOBS.values() if job.active and (job.session == session or job.kind in SHARED_KINDS)]
+
+
+def history():
+    with _LOCK:
+        return sorted(_JOBS.values(), key=lambda job: job.id, reverse=True)
@@ -1,8 +1,18 @@
 import streamlit as st
 import pandas as pd
-import glob
+import numpy as np
 import os
+import copy
+import time
+import uuid
 import scorer  # 確保同層級有 scorer.py 檔案
+import storage
+import ingest
+import schema
+import jobs
+import views
+import editor
+import perf
 
 # --- 1. 定義語系對照表 ---
 LANG_PACKAGE = {
@@ -10,6 +20,10 @@ LANG_PACKAGE = {
         "page_title": "營運管理系統",
         "diag_header": "🔍 資料診斷資訊",
         "total_rows": "總筆數",
+        "ingest_report": "原始檔匯入：解析 {parsed} 個 ({seconds:.2f}s)、沿用 {reused} 個",
+        "cache_stats": "資料快取：命中 {hits} / 未命中 {misses}",
+        "mem_toggle": "📐 顯示記憶體用量報告",
+        "mem_total": "記憶體：{after:.2f} MB (文字型別 {before:.2f} MB)",
         "reset_btn": "🗑️ 重設資料 (重新匯入 Excel)",
         "no_data": "目前暫無資料",
         "main_title": "⚖️ 案件主檔明細",
@@ -24,16 +38,42 @@ LANG_PACKAGE = {
         "btn_save": "💾 僅儲存編輯內容",
         "msg_score_done": "評分已完成！各分頁報表已同步更新。",
         "msg_save_done": "編輯內容已儲存！",
+        "warn_unrecognized": "⚠️ 下列欄位有無法辨識的值，已保留原輸入 (評分時視為「否」或 0)，請修正：{}",
         "rank_subheader": "案件複雜度排名預覽",
         "col_rank": "排名",
         "col_score": "複雜度評分",
         "btn_download": "📥 下載完整評分報表 (CSV)",
-        "warn_no_score": "⚠️ 尚未產生評分，請至編輯區執行評分。"
+        "warn_no_score": "⚠️ 尚未產生評分，請至編輯區執行評分。",
+        "export_btn": "📤 匯出 Excel 備份",
+        "msg_export_done": "已匯出 {} 個 Excel 檔至 outputs 資料夾。",
+        "job_kinds": {"ingest": "原始檔匯入", "score": "評分"},
+        "job_running": "⏳ 背景{kind}中 ({elapsed:.0f}s)：{message}",
+        "job_busy": "背景工作執行中，完成前暫停評分與存檔。",
+        "job_failed": "❌ 背景{kind}失敗：{error}",
+        "msg_ingest_done": "原始檔匯入完成，已載入最新資料。",
+        "rollback_header": "🕘 主檔版本回復",
+        "rollback_sel": "選擇版本",
+        "rollback_current": "(目前)",
+        "rollback_btn": "↩️ 回復到此版本",
+        "msg_rollback_done": "已回復至 v{}。",
+        "filter_types": "案件類型",
+        "filter_score": "複雜度評分區間",
+        "filter_search": "搜尋案件名稱",
+        "sort_label": "排序",
+        "sort_options": {"seq": "序號", "score_desc": "評分 (高→低)", "score_asc": "評分 (低→高)", "name": "案件名稱"},
+        "page_size": "每頁筆數",
+        "page_no": "頁次",
+        "page_info": "符合 {rows} 筆，第 {page} / {pages} 頁",
+        "edit_locked": "有尚未儲存的編輯，儲存或評分後才能切換篩選與頁面。"
     },
     "English": {
         "page_title": "Operation Management System",
         "diag_header": "🔍 Data Diagnostics",
         "total_rows": "Total Records",
+        "ingest_report": "Raw file ingestion: {parsed} parsed ({seconds:.2f}s), {reused} reused",
+        "cache_stats": "Data cache: {hits} hits / {misses} misses",
+        "mem_toggle": "📐 Show memory usage report",
+        "mem_total": "Memory: {after:.2f} MB (text dtypes {before:.2f} MB)",
         "reset_btn": "🗑️ Reset Data (Re-import Excel)",
         "no_data": "No Data Available",
         "main_title": "⚖️ Case Master Details",
@@ -48,11 +88,33 @@ LANG_PACKAGE = {
         "btn_save": "💾 Save Changes Only",
         "msg_score_done": "Scoring completed! All reports synchronized.",
         "msg_save_done": "Changes saved successfully!",
+        "warn_unrecognized": "⚠️ These columns contain unrecognized values, kept as entered (scored as \"No\" or 0). Please correct: {}",
         "rank_subheader": "Complexity Ranking Preview",
         "col_rank": "Rank",
         "col_score": "Complexity Score",
         "btn_download": "📥 Download Full Report (CSV)",
-        "warn_no_score": "⚠️ No scores generated. Please run scoring in the editor."
+        "warn_no_score": "⚠️ No scores generated. Please run scoring in the editor.",
+        "export_btn": "📤 Export Excel Backup",
+        "msg_export_done": "Exported {} Excel file(s) to the outputs folder.",
+        "job_kinds": {"ingest": "ingestion", "score": "scoring"},
+        "job_running": "⏳ Background {kind} running ({elapsed:.0f}s): {message}",
+        "job_busy": "A background job is running; scoring and saving resume when it finishes.",
+        "job_failed": "❌ Background {kind} failed: {error}",
+        "msg_ingest_done": "Raw file ingestion finished; latest data loaded.",
+        "rollback_header": "🕘 Master Data Versions",
+        "rollback_sel": "Select version",
+        "rollback_current": "(current)",
+        "rollback_btn": "↩️ Roll back to this version",
+        "msg_rollback_done": "Rolled back to v{}.",
+        "filter_types": "Case type",
+        "filter_score": "Complexity range",
+        "filter_search": "Search case name",
+        "sort_label": "Sort by",
+        "sort_options": {"seq": "Seq", "score_desc": "Score (high→low)", "score_asc": "Score (low→high)", "name": "Case name"},
+        "page_size": "Rows per page",
+        "page_no": "Page",
+        "page_info": "{rows} matching rows, page {page} / {pages}",
+        "edit_locked": "Unsaved edits on this page; save or run scoring before changing filters or pages."
     }
 }
 
@@ -60,13 +122,13 @@ LANG_PACKAGE = {
 # 為避免 StreamlitSetPageConfigMustBeFirstCommandError
 # 我們先暫時設定一個固定的 Title，或從 Session State 抓取
 st.set_page_config(page_title="營運管理系統", layout="wide")
+# 各階段量測 (側邊欄效能診斷面板與 outputs/perf_log.jsonl)
+rec = perf.Recorder("main")
 
 # --- 3. 系統路徑與配置 ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
 target_folder = os.path.join(current_dir, "inputs_raw_cases")
-output_folder = os.path.join(current_dir, "outputs")
-MASTER_FILE = os.path.join(output_folder, "master_data.xlsx")
-os.makedirs(output_folder, exist_ok=True)
+os.makedirs(storage.OUTPUT_DIR, exist_ok=True)
 
 # 語系選擇器
 if 'lang' not in st.session_state:
@@ -77,33 +139,123 @@ with st.sidebar:
     
 t = LANG_PACKAGE[st.session_state.lang]
 
-# --- 4. 資料初始化邏輯 (完全保留) ---
+# --- 4. 資料初始化邏輯 (背景工作依匯入清單增量處理) ---
+# 背景工作以 session 識別碼區分，評分工作只會沿用同一 session 自己送出的工作
+if 'session_key' not in st.session_state:
+    st.session_state.session_key = uuid.uuid4().hex
+
+def start_job(kind, fn, *args):
+    st.session_state.job_id = jobs.submit(kind, fn, *args, session=st.session_state.session_key).id
+
+def ingest_job(report, rebuild=False):
+    # 只解析新增或變更的原始檔，其餘沿用清單中的解析快取
+    df, summary = ingest.sync(target_folder, rebuild=rebuild, progress=report)
+    summary["rebuild"] = rebuild
+    return df, summary
+
 def load_initial_data():
-    if os.path.exists(MASTER_FILE):
-        return pd.read_excel(MASTER_FILE)
-    
-    files = glob.glob(os.path.join(target_folder, "*.xls*"))
-    all_data = []
-    for f in files:
-        if os.path.basename(f).startswith("~$"): continue
-        temp_df = pd.read_excel(f, header=0)
-        temp_df.columns = temp_df.columns.str.strip() 
-        all_data.append(temp_df)
-    
-    if all_data:
-        df_raw = pd.concat(all_data, ignore_index=True).dropna(how='all')
-        df_raw.to_excel(MASTER_FILE, index=False)
-        return df_raw
-    return pd.DataFrame()
+    # 先顯示最後一次寫入的主檔 (舊版主檔先補上案件編號)，匯入在背景進行，完成後再換上新資料
+    df = ingest.ensure_case_ids()
+    start_job("ingest", ingest_job)
+    return df
 
+rec.begin("load")
+if 'editor_rev' not in st.session_state:
+    st.session_state.editor_rev = 0
 if 'df' not in st.session_state:
     st.session_state.df = load_initial_data()
+rec.rows(len(st.session_state.df))
+
+# --- 4.1 評分工具：僅重算編輯過的列 (scorer.rescore_edits) ---
+def with_case_ids(df):
+    # 編輯器新增的列於存檔 / 評分時才配發案件編號
+    if schema.CASE_ID in df.columns and df[schema.CASE_ID].notna().all():
+        return df
+    return ingest.assign_case_ids(df)
+
+def score_job(report, prev_df, edited, delta):
+    """背景評分：先嘗試只重算編輯過的列，否則完整評分，寫入主檔後回傳新排名。"""
+    report(0.1, "配發案件編號")
+    edited = with_case_ids(edited)
+    report(0.2, "評分")
+    df_ranked = scorer.rescore_edits(prev_df, edited, delta)
+    if df_ranked is None:
+        clean_data = scorer.clean_for_scoring(edited).reset_index(drop=True)
+        df_ranked = scorer.calculate_complexity(clean_data)
+    
+    if '序號' in df_ranked.columns:
+        df_ranked = df_ranked.drop(columns=['序號'])
+    df_ranked.insert(0, '序號', range(1, len(df_ranked) + 1))
+    report(0.8, "寫入主檔")
+    df_ranked = storage.write_table("master_data", df_ranked)
+    report(0.9, "更新總覽檢視")
+    views.refresh(df_ranked)
+    return df_ranked
+
+def save_edits(prev_df, edited, delta):
+    """
+    僅儲存 (不評分)：未變動列沿用原分數，被編輯 / 新增的列分數清空，待下次評分時增量重算。
+    沒有增刪列時只 upsert 被編輯的列，不重寫整張主檔。寫入後一併更新總覽檢視。
+    """
+    edited = with_case_ids(edited)
+    if '複雜度評分' in prev_df.columns:
+        edited['複雜度評分'] = editor.carry_scores(prev_df['複雜度評分'], delta)
+    if not (delta["deleted_rows"] or delta["added_rows"]):
+        if not delta["edited_rows"]:
+            return storage.read_table("master_data")
+        storage.upsert_rows("master_data", edited.iloc[list(delta["edited_rows"])])
+        saved = storage.read_table("master_data")
+    else:
+        edited.insert(0, '序號', range(1, len(edited) + 1))
+        saved = storage.write_table("master_data", edited)
+    views.refresh(saved)
+    return saved
+
+# --- 4.2 背景工作：輪詢進度，完成後才換上新資料 ---
+def apply_job_result(job):
+    # 背景執行緒不能操作 session_state，結果一律在腳本執行緒換入
+    if job.kind == "ingest":
+        df, summary = job.result
+        st.session_state.ingest_report = summary
+        if not (summary["parsed"] or summary["rebuild"] or st.session_state.df.empty):
+            return
+        st.session_state.df = df
+        st.session_state.job_notice = t["msg_ingest_done"]
+    else:
+        st.session_state.df = job.result
+        st.session_state.job_notice = t["msg_score_done"]
+    # 換新的編輯器 key，讓編輯差異從新的資料重新累計
+    st.session_state.editor_rev += 1
+
+@st.fragment(run_every=1)
+def job_monitor():
+    job = jobs.get(st.session_state.get("job_id"))
+    if job is None:
+        return
+    kind = t["job_kinds"].get(job.kind, job.kind)
+    if job.active:
+        st.progress(job.progress, text=t["job_running"].format(kind=kind, elapsed=job.elapsed, message=job.message))
+        return
+    st.session_state.job_id = None
+    if job.status == jobs.DONE:
+        apply_job_result(job)
+    else:
+        st.session_state.job_error = t["job_failed"].format(kind=kind, error=job.error)
+    st.rerun()
+
+# 只有自己的工作 (與重寫主檔的匯入) 會暫停本 session 的評分與存檔
+busy = bool(jobs.blocking(st.session_state.session_key))
 
 # --- 5. 側邊欄：診斷資訊 ---
+rec.begin("render:sidebar")
 with st.sidebar:
     st.header(t["diag_header"])
     if not st.session_state.df.empty:
         st.write(f"**{t['total_rows']}:** {len(st.session_state.df)}")
+        st.caption(t["cache_stats"].format(**storage.cache_stats()))
+        if 'ingest_report' in st.session_state:
+            report = st.session_state.ingest_report
+            st.caption(t["ingest_report"].format(parsed=len(report["parsed"]), reused=report["reused"], seconds=sum(report["timings"].values())))
         
         null_series = st.session_state.df.isnull().sum()
         null_df = null_series[null_series > 0].reset_index()
@@ -112,16 +264,48 @@ with st.sidebar:
             null_df.insert(0, t["col_seq"], range(1, len(null_df) + 1))
             st.dataframe(null_df, hide_index=True, use_container_width=True)
         
+        if st.checkbox(t["mem_toggle"]):
+            mem_df = schema.memory_report(schema.to_display(st.session_state.df), st.session_state.df)
+            st.caption(t["mem_total"].format(before=mem_df["原始 KB"].sum() / 1024, after=mem_df["正規化 KB"].sum() / 1024))
+            st.dataframe(mem_df, hide_index=True, use_container_width=True)
+        
         st.divider()
-        if st.button(t["reset_btn"], use_container_width=True):
-            if os.path.exists(MASTER_FILE): os.remove(MASTER_FILE)
-            st.session_state.df = pd.DataFrame()
+        if st.button(t["reset_btn"], use_container_width=True, disabled=busy):
+            # 背景重建主檔，完成前各頁面仍讀取現有主檔
+            start_job("ingest", ingest_job, True)
             st.rerun()
+        if st.button(t["export_btn"], use_container_width=True):
+            st.success(t["msg_export_done"].format(len(storage.export_all_excel())))
+        
+        # 每次寫入都保留版本檔，回復只需把版本目錄指回舊版
+        history = storage.versions("master_data")
+        if len(history) > 1:
+            with st.expander(t["rollback_header"]):
+                current = storage.current_version("master_data")
+                labels = {v: f"v{v} · {time.strftime('%m-%d %H:%M', time.localtime(saved))}" + (f" {t['rollback_current']}" if v == current else "")
+                          for v, saved in history}
+                target_version = st.selectbox(t["rollback_sel"], list(labels)[::-1], format_func=labels.get)
+                if st.button(t["rollback_btn"], use_container_width=True, disabled=busy or target_version == current):
+                    st.session_state.df = storage.rollback("master_data", target_version)
+                    views.refresh(st.session_state.df)
+                    st.session_state.editor_rev += 1
+                    st.session_state.job_notice = t["msg_rollback_done"].format(target_version)
+                    st.rerun()
     else:
         st.warning(t["no_data"])
+    # 效能診斷面板於本次執行結束時填入
+    perf_slot = st.container()
 
 # --- 6. 主要工作區 ---
 st.title(t["main_title"])
+if st.session_state.get("job_id"):
+    job_monitor()
+if "job_notice" in st.session_state:
+    st.success(st.session_state.pop("job_notice"))
+if "job_error" in st.session_state:
+    st.error(st.session_state.pop("job_error"))
+if busy:
+    st.caption(t["job_busy"])
 tab1, tab2 = st.tabs([t["tab_edit"], t["tab_rank"]])
 
 with tab1:
@@ -129,59 +313,97 @@ with tab1:
     if st.session_state.df.empty:
         st.info(t["info_msg"])
     else:
-        df_for_edit = st.session_state.df.copy()
-        if '複雜度評分' in df_for_edit.columns:
-            df_for_edit = df_for_edit.drop(columns=['複雜度評分'])
-        if '序號' in df_for_edit.columns:
-            df_for_edit = df_for_edit.drop(columns=['序號'])
-        df_for_edit.insert(0, '序號', range(1, len(df_for_edit) + 1))
+        master = st.session_state.df
+        rec.begin("compute:filter", rows=len(master))
+        scores = pd.to_numeric(master['複雜度評分'], errors='coerce') if '複雜度評分' in master.columns else pd.Series(dtype=float)
+        score_bounds = (int(np.floor(scores.min())), int(np.ceil(scores.max()))) if scores.notna().any() else None
+
+        # 篩選 / 排序 / 分頁狀態：先補預設值並夾回有效範圍，再計算本頁 (元件依 key 讀回同一組值)
+        st.session_state.setdefault("edit_types", [])
+        st.session_state.setdefault("edit_search", "")
+        st.session_state.setdefault("edit_sort", "seq")
+        st.session_state.setdefault("edit_page_size", editor.DEFAULT_PAGE_SIZE)
+        st.session_state.setdefault("edit_page", 1)
+        if score_bounds:
+            lo, hi = st.session_state.get("edit_score", score_bounds)
+            st.session_state.edit_score = (min(max(lo, score_bounds[0]), score_bounds[1]), max(min(hi, score_bounds[1]), score_bounds[0]))
+        type_options = sorted(master['案件類型'].dropna().astype(str).unique()) if '案件類型' in master.columns else []
+        st.session_state.edit_types = [x for x in st.session_state.edit_types if x in type_options]
+
+        positions = editor.select_rows(master, st.session_state.edit_types,
+                                       st.session_state.edit_score if score_bounds else None,
+                                       st.session_state.edit_search, st.session_state.edit_sort)
+        size = st.session_state.edit_page_size
+        n_pages = editor.page_count(len(positions), size)
+        st.session_state.edit_page = min(st.session_state.edit_page, n_pages)
+        page = st.session_state.edit_page
+        page_pos = editor.page_rows(positions, page, size)
+
+        view = (tuple(st.session_state.edit_types), st.session_state.get("edit_score"), st.session_state.edit_search,
+                st.session_state.edit_sort, size, page)
+        editor_key = f"data_editor_main_{st.session_state.editor_rev}_{abs(hash(view))}"
+        pending = any(st.session_state.get(editor_key, {}).get(k) for k in ("edited_rows", "added_rows", "deleted_rows"))
+
+        f1, f2, f3 = st.columns(3)
+        f1.multiselect(t["filter_types"], type_options, key="edit_types", disabled=pending)
+        if score_bounds and score_bounds[0] < score_bounds[1]:
+            f2.slider(t["filter_score"], score_bounds[0], score_bounds[1], key="edit_score", disabled=pending)
+        f3.text_input(t["filter_search"], key="edit_search", disabled=pending)
+        p1, p2, p3 = st.columns(3)
+        p1.selectbox(t["sort_label"], list(editor.SORTS), format_func=t["sort_options"].get, key="edit_sort", disabled=pending)
+        p2.selectbox(t["page_size"], editor.PAGE_SIZES, key="edit_page_size", disabled=pending)
+        p3.number_input(t["page_no"], min_value=1, max_value=n_pages, step=1, key="edit_page", disabled=pending)
+        st.caption(t["page_info"].format(rows=len(positions), page=page, pages=n_pages))
+        if pending:
+            st.caption(t["edit_locked"])
+
+        rec.begin("render:editor", rows=len(page_pos))
+        # 是/否、計數欄位有無法辨識的值時整欄保留為文字 (見 schema.unrecognized_values)，提示使用者修正
+        unrecognized = schema.unrecognized_values(master)
+        if unrecognized:
+            st.warning(t["warn_unrecognized"].format("; ".join(f"{col}: {', '.join(values[:5])}" for col, values in unrecognized.items())))
+        # 編輯器只放入本頁；沿用 是/否 文字與一般文字欄，存檔時再由 storage 正規化型別
+        df_for_edit = schema.to_display(master.iloc[page_pos]).drop(columns=['複雜度評分', '序號'], errors='ignore')
+        df_for_edit.insert(0, '序號', page_pos + 1)
         
         # 顯示時翻譯標題
         edited_df_raw = st.data_editor(
-            df_for_edit.rename(columns={"序號": t["col_seq"], "個體數": t["col_entities"], "系統數": t["col_systems"]}), 
+            df_for_edit.reset_index(drop=True).rename(columns={"序號": t["col_seq"], "個體數": t["col_entities"], "系統數": t["col_systems"]}), 
             num_rows="dynamic", 
             use_container_width=True,
             hide_index=True,
             column_config={
                 t["col_seq"]: st.column_config.NumberColumn(t["col_seq"], disabled=True),
+                schema.CASE_ID: st.column_config.NumberColumn(schema.CASE_ID, disabled=True),
             },
-            key="data_editor_main"
+            key=editor_key
         )
         
-        # 反向還原中文 Key 以利 scorer 運算
-        reverse_map = {t["col_seq"]: "序號", t["col_entities"]: "個體數", t["col_systems"]: "系統數"}
-        temp_edited = edited_df_raw.rename(columns=reverse_map)
-        temp_edited = temp_edited.drop(columns=['序號']) if '序號' in temp_edited.columns else temp_edited
+        def edited_master():
+            # 反向還原中文 Key，將本頁編輯套回全表，並換算全表位置的編輯差異供增量評分
+            reverse_map = {t["col_seq"]: "序號", t["col_entities"]: "個體數", t["col_systems"]: "系統數"}
+            page_edited = edited_df_raw.rename(columns=reverse_map).drop(columns=['序號'], errors='ignore')
+            base = schema.to_display(master).drop(columns=['複雜度評分', '序號'], errors='ignore').reset_index(drop=True)
+            delta = copy.deepcopy(dict(st.session_state.get(editor_key, {})))
+            return editor.apply_page(base, page_pos, page_edited, delta)
         
         col1, col2 = st.columns(2)
         with col1:
-            if st.button(t["btn_run"], use_container_width=True):
-                clean_data = temp_edited.copy()
-                num_cols = clean_data.select_dtypes(include=['number']).columns
-                clean_data[num_cols] = clean_data[num_cols].fillna(0)
-                obj_cols = clean_data.select_dtypes(include=['object', 'string']).columns
-                clean_data[obj_cols] = clean_data[obj_cols].fillna("")
-                clean_data = clean_data.reset_index(drop=True)
-                df_ranked = scorer.calculate_complexity(clean_data)
-                
-                if '序號' in df_ranked.columns:
-                    df_ranked = df_ranked.drop(columns=['序號'])
-                df_ranked.insert(0, '序號', range(1, len(df_ranked) + 1))
-                st.session_state.df = df_ranked
-                df_ranked.to_excel(MASTER_FILE, index=False)
-                st.success(t["msg_score_done"])
+            if st.button(t["btn_run"], use_container_width=True, disabled=busy):
+                temp_edited, delta = edited_master()
+                # 評分與寫檔交給背景工作，畫面繼續顯示目前的排名直到完成
+                start_job("score", score_job, master, temp_edited, delta)
                 st.rerun()
                 
         with col2:
-            if st.button(t["btn_save"], use_container_width=True):
-                save_data = temp_edited.copy()
-                save_data.insert(0, '序號', range(1, len(save_data) + 1))
-                st.session_state.df = save_data
-                save_data.to_excel(MASTER_FILE, index=False)
+            if st.button(t["btn_save"], use_container_width=True, disabled=busy):
+                st.session_state.df = save_edits(master, *edited_master())
+                st.session_state.editor_rev += 1
                 st.success(t["msg_save_done"])
 
 with tab2:
     st.subheader(t["rank_subheader"])
+    rec.begin("render:ranking", rows=len(st.session_state.df))
     if not st.session_state.df.empty:
         display_df = st.session_state.df.copy()
         if '複雜度評分' in display_df.columns:
@@ -200,4 +422,6 @@ with tab2:
             st.download_button(label=t["btn_download"], data=csv_data, file_name="Complexity_Report.csv", mime="text/csv")
         else:
             st.warning(t["warn_no_score"])
-            st.dataframe(display_df.rename(columns={"序號": t["col_seq"]}), hide_index=True, use_container_width=True)
\ No newline at end of file
+            st.dataframe(display_df.rename(columns={"序號": t["col_seq"]}), hide_index=True, use_container_width=True)
+
+rec.finish(perf_slot)
@@ -0,0 +1,195 @@
+import heapq
+import os
+import time
+import numpy as np
+import pandas as pd
+import ingest
+import storage
+import views
+from schema import CASE_ID
+
+# --- 1. 自動指派配置 ---
+# 人員名單 (staff_list) 的產能欄位：1.0 為標準產能，0.5 代表只能承擔一半負荷；未填視為 1.0
+CAPACITY_COL = "產能"
+
+# 每案 Staff 人數依風險層級 (低 / 中 / 高) 決定，PM 每案一人
+STAFF_PER_TIER = (1, 2, 3)
+
+# 區域搜尋的時間上限 (秒) 與每次嘗試的低負荷候選人數
+TIME_LIMIT = float(os.environ.get("OMMS_OPTIMIZER_SECONDS", "0.5"))
+CANDIDATES = 8
+
+
+def roster_capacity(roster, role):
+    """回傳 (姓名陣列, 產能陣列)；同名只取第一筆，產能 <= 0 或缺值視為 1.0。"""
+    people = roster[roster['角色類型'] == role].dropna(subset=['姓名']).drop_duplicates(subset='姓名')
+    if CAPACITY_COL in people.columns:
+        capacity = pd.to_numeric(people[CAPACITY_COL], errors='coerce').to_numpy(dtype=float)
+    else:
+        capacity = np.ones(len(people))
+    capacity = np.where(np.isfinite(capacity) & (capacity > 0), capacity, 1.0)
+    return people['姓名'].astype(str).to_numpy(), capacity
+
+
+# --- 2. 單一角色的負荷平衡 ---
+class Balancer:
+    """
+    最小化「最大相對負荷」(負荷 ÷ 產能)：
+    1. assign：依複雜度由大到小 (LPT) 逐案指派，以 heap 取出目前相對負荷最低的 k 人平分該案負荷。
+    2. improve：區域搜尋，反覆把最高負荷者的一個指派移給低負荷者 (同一案不重複指派同一人)，
+       直到無法再降低最高負荷或超過時間上限。先只嘗試負荷最低的 CANDIDATES 人，
+       找不到可降低的移動時再檢查所有人，確認已收斂才停止。
+    """
+
+    def __init__(self, capacity, base_load=None):
+        self.capacity = np.asarray(capacity, dtype=float)
+        n = len(self.capacity)
+        self.load = np.zeros(n) if base_load is None else np.asarray(base_load, dtype=float).copy()
+        self.slot_case, self.slot_person, self.slot_weight = [], [], []
+        self.slots_of = [[] for _ in range(n)]
+        self.cases_of = [set() for _ in range(n)]
+        self._heap = [(self.load[i] / self.capacity[i], i) for i in range(n)]
+        heapq.heapify(self._heap)
+
+    def _add(self, case, person, weight):
+        slot = len(self.slot_case)
+        self.slot_case.append(case)
+        self.slot_person.append(person)
+        self.slot_weight.append(weight)
+        self.slots_of[person].append(slot)
+        self.cases_of[person].add(case)
+        self.load[person] += weight
+
+    def assign(self, case, weight, k):
+        k = min(k, len(self.capacity))
+        picked = [heapq.heappop(self._heap)[1] for _ in range(k)]
+        for person in picked:
+            self._add(case, person, weight / k)
+            heapq.heappush(self._heap, (self.load[person] / self.capacity[person], person))
+
+    def improve(self, time_limit=TIME_LIMIT):
+        if len(self.capacity) < 2:
+            return 0
+        deadline = time.perf_counter() + time_limit
+        moves = 0
+        while time.perf_counter() < deadline:
+            norm = self.load / self.capacity
+            top = int(np.argmax(norm))
+            n_low = min(CANDIDATES, len(norm) - 1)
+            best = self._best_move(top, norm, np.argpartition(norm, n_low)[:n_low + 1])
+            if best is None and n_low + 1 < len(norm):
+                best = self._best_move(top, norm, np.arange(len(norm)))
+            if best is None:
+                break
+            self._move(best[1], best[2])
+            moves += 1
+        return moves
+
+    def _best_move(self, top, norm, people):
+        """最高負荷者的各指派移給 people 中任一人後，最能降低兩人較高負荷的移動 (無可降低時回傳 None)。"""
+        best = None
+        for slot in self.slots_of[top]:
+            weight, case = self.slot_weight[slot], self.slot_case[slot]
+            for person in people:
+                if person == top or case in self.cases_of[person]:
+                    continue
+                after = max(norm[top] - weight / self.capacity[top], norm[person] + weight / self.capacity[person])
+                if after < norm[top] - 1e-9 and (best is None or after < best[0]):
+                    best = (after, slot, int(person))
+        return best
+
+    def _move(self, slot, person):
+        old, case, weight = self.slot_person[slot], self.slot_case[slot], self.slot_weight[slot]
+        self.slots_of[old].remove(slot)
+        self.cases_of[old].discard(case)
+        self.load[old] -= weight
+        self.slot_person[slot] = person
+        self.slots_of[person].append(slot)
+        self.cases_of[person].add(case)
+        self.load[person] += weight
+
+    def max_load(self):
+        return float((self.load / self.capacity).max()) if len(self.capacity) else 0.0
+
+
+# --- 3. 指派建議 ---
+def _base_load(names, relation, dist, scores, role):
+    """保留的既有指派所帶來的起始負荷 (PM 為複雜度總和、Staff 為複雜度 × 占比)。"""
+    load = pd.Series(0.0, index=names)
+    if role == "PM" and relation is not None and not relation.empty:
+        pms = relation[relation['角色'] == 'PM']
+        load = load.add(pms[CASE_ID].map(scores).groupby(pms['姓名']).sum(), fill_value=0)
+    if role == "Staff" and dist is not None and not dist.empty:
+        weighted = dist[CASE_ID].map(scores) * pd.to_numeric(dist['占比'], errors='coerce') / 100
+        load = load.add(weighted.groupby(dist['負責人']).sum(), fill_value=0)
+    return load.reindex(names).fillna(0).to_numpy(dtype=float)
+
+
+def propose(master, roster, case_ids=None, relation=None, dist=None, time_limit=TIME_LIMIT):
+    """
+    產生 PM / Staff 指派與分工占比建議：
+    1. case_ids 為待指派案件 (預設全部)；relation / dist 為保留不動的既有指派，其負荷計入起始負荷。
+    2. PM 每案一人；Staff 人數依風險層級 (STAFF_PER_TIER)，占比平分。
+    3. 回傳 relation (指派關聯)、distribution (分工占比)、loads (每人負荷) 與 stats (平衡前後最大相對負荷)。
+    """
+    cases = master[[CASE_ID, '案件名稱', '複雜度評分']].dropna(subset=[CASE_ID])
+    if case_ids is not None:
+        cases = cases[cases[CASE_ID].isin(case_ids)]
+    cases = cases.sort_values('複雜度評分', ascending=False, kind='stable')
+    scores = master.drop_duplicates(subset=CASE_ID).set_index(CASE_ID)['複雜度評分'].astype(float)
+    weights = pd.to_numeric(cases['複雜度評分'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    staff_k = np.asarray(STAFF_PER_TIER)[views.risk_codes(cases['複雜度評分'])]
+    start = time.perf_counter()
+
+    rel_rows, dist_rows, loads, stats = [], [], [], {}
+    for role in ("PM", "Staff"):
+        names, capacity = roster_capacity(roster, role)
+        if not len(names):
+            continue
+        balancer = Balancer(capacity, _base_load(names, relation, dist, scores, role))
+        for pos in range(len(cases)):
+            balancer.assign(pos, weights[pos], 1 if role == "PM" else int(staff_k[pos]))
+        greedy = balancer.max_load()
+        moves = balancer.improve(time_limit)
+        stats[role] = {"greedy_max": round(greedy, 2), "max": round(balancer.max_load(), 2), "moves": moves}
+
+        slot_case = np.asarray(balancer.slot_case, dtype=int)
+        slot_names = names[np.asarray(balancer.slot_person, dtype=int)] if len(slot_case) else np.array([], dtype=object)
+        rel_rows.append(pd.DataFrame({CASE_ID: cases[CASE_ID].to_numpy()[slot_case],
+                                      '案件名稱': cases['案件名稱'].to_numpy()[slot_case],
+                                      '姓名': slot_names, '角色': role}))
+        if role == "Staff":
+            # 占比取兩位小數平分，尾差補在每案第一位，使每案合計恰為 100
+            share = np.floor(100 / np.minimum(staff_k, len(names)) * 100) / 100
+            slot_share = share[slot_case]
+            first = np.unique(slot_case, return_index=True)[1]
+            slot_share[first] += (100 - share * np.minimum(staff_k, len(names)))[slot_case[first]]
+            dist_rows.append(pd.DataFrame({CASE_ID: cases[CASE_ID].to_numpy()[slot_case],
+                                           '案件名稱': cases['案件名稱'].to_numpy()[slot_case],
+                                           '負責人': slot_names, '占比': slot_share.round(2)}))
+        loads.append(pd.DataFrame({'姓名': names, '角色': role, CAPACITY_COL: capacity,
+                                   '負荷': balancer.load.round(2), '相對負荷': (balancer.load / capacity).round(2)}))
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    empty_dist = pd.DataFrame(columns=[CASE_ID, '案件名稱', '負責人', '占比'])
+    return {
+        "relation": pd.concat(rel_rows, ignore_index=True) if rel_rows else pd.DataFrame(columns=[CASE_ID, '案件名稱', '姓名', '角色']),
+        "distribution": pd.concat(dist_rows, ignore_index=True) if dist_rows else empty_dist,
+        "loads": pd.concat(loads, ignore_index=True) if loads else pd.DataFrame(columns=['姓名', '角色', CAPACITY_COL, '負荷', '相對負荷']),
+        "stats": stats,
+    }
+
+
+def save_proposal(proposal, relation, dist):
+    """
+    將建議寫回指派關聯表與分工占比：建議涵蓋的案件整案替換，其餘案件的既有列保留。
+    relation / dist 為目前的完整資料表。
+    """
+    cases = set(proposal["relation"][CASE_ID])
+    keep_rel = relation[~relation[CASE_ID].isin(cases)] if not relation.empty else relation
+    keep_dist = dist[~dist[CASE_ID].isin(cases)] if not dist.empty else dist
+    since = storage.current_version("assignments")
+    storage.write_table("assignments", pd.concat([keep_rel, proposal["relation"]], ignore_index=True))
+    # 彙總立方體只重算建議涵蓋案件所屬的期間
+    ingest.refresh_cube_cases(cases, since)
+    storage.write_table("workload_distribution", pd.concat([keep_dist, proposal["distribution"]], ignore_index=True))
@@ -1,7 +1,13 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import os
+import storage
+import views
+import charts
+import cube
+import ingest
+import jobs
+import perf
 
 # --- 1. 語言配置字典 ---
 PAGE_LANG = {
@@ -26,6 +32,19 @@ PAGE_LANG = {
         "bar_avg_line": "平均線",
         "scatter_title": "🔍 異常案件偵測 (資源投入 vs 複雜度)",
         "scatter_x_label": "資源投入量 (個體 + 實際系統)",
+        "scatter_density": "案件密度",
+        "trend_title": "📅 月度趨勢與期間比較",
+        "trend_dim": "細分維度",
+        "trend_dims": {"案件類型": "案件類型", "風險層級": "風險層級", "PM": "PM"},
+        "trend_count": "各期間案件數",
+        "trend_avg": "各期間平均複雜度",
+        "trend_period": "資料期間",
+        "trend_no_data": "ℹ️ 尚無可彙總的原始檔歷史 (inputs_raw_cases)。",
+        "trend_refreshing": "⏳ 指派已變更，彙總正在背景更新，重新整理頁面即可看到最新的 PM 分布。",
+        "compare_title": "期間比較",
+        "compare_base": "基期",
+        "compare_target": "比較期",
+        "compare_single": "ℹ️ 目前只有一個資料期間，新增下個月的原始檔後即可比較。",
         "footer_guide": "<b>💡 管理指引：</b><br>- <b>高風險案件 (27↑)：</b> 需指派資深人員 (Senior) 負責。<br>- <b>散佈圖異常值：</b> 若案件位於左上方（低資源、高複雜度），應評估資源分配合理性。",
         "risk_levels": ["高 (High Risk)", "中 (Medium Risk)", "低 (Low Risk)"]
     },
@@ -50,6 +69,19 @@ PAGE_LANG = {
         "bar_avg_line": "Average",
         "scatter_title": "🔍 Anomaly Detection (Resources vs Complexity)",
         "scatter_x_label": "Resource Input (Entities + Systems)",
+        "scatter_density": "Case density",
+        "trend_title": "📅 Monthly Trend & Period Comparison",
+        "trend_dim": "Breakdown",
+        "trend_dims": {"案件類型": "Case Type", "風險層級": "Risk Level", "PM": "PM"},
+        "trend_count": "Cases per Period",
+        "trend_avg": "Avg Complexity per Period",
+        "trend_period": "Period",
+        "trend_no_data": "ℹ️ No raw file history (inputs_raw_cases) to aggregate yet.",
+        "trend_refreshing": "⏳ Assignments changed; the aggregate is refreshing in the background. Reload to see the latest PM breakdown.",
+        "compare_title": "Period Comparison",
+        "compare_base": "Base period",
+        "compare_target": "Compare period",
+        "compare_single": "ℹ️ Only one period so far; add next month's raw file to compare.",
         "footer_guide": "<b>💡 Guidelines:</b><br>- <b>High Risk (27↑):</b> Senior staff assigned.<br>- <b>Scatter Plot:</b> Top-left outliers (low resource/high complexity) need review.",
         "risk_levels": ["High Risk", "Medium Risk", "Low Risk"]
     }
@@ -61,44 +93,69 @@ t = PAGE_LANG[curr_lang]
 
 # 1. 系統配置
 st.set_page_config(page_title=t["page_title"], layout="wide")
+rec = perf.Recorder("case_overview")
 
-current_dir = os.path.dirname(os.path.abspath(__file__))
-output_folder = os.path.join(os.path.dirname(current_dir), "outputs")
-MASTER_FILE = os.path.join(output_folder, "master_data.xlsx")
+@rec.timed("load", rows=lambda frames: len(frames[views.CASE_VIEW]) if frames else 0)
+def load_views():
+    """
+    讀取評分時物化的總覽檢視 (同一 snapshot)；主檔尚未評分時回傳 None。
+    檢視缺少或落後於主檔時 (例如其他程式寫入主檔) 本次由同一 snapshot 的主檔在記憶體中彙總顯示，
+    寫回交給背景工作，頁面執行時不寫入資料表。
+    """
+    snap = storage.snapshot()
+    stats = storage.read_table(views.STATS_VIEW, snap)
+    if views.is_stale(stats, snap):
+        jobs.submit("views", lambda report: views.refresh())
+        master = storage.read_table("master_data", snap)
+        if master.empty or '複雜度評分' not in master.columns:
+            return None
+        return views.build(master, snap.get("master_data"))
+    return {name: storage.read_table(name, snap)
+            for name in (views.CASE_VIEW, views.STATS_VIEW, views.COUNTS_VIEW, views.TOP_VIEW)}
 
-def load_data():
-    if os.path.exists(MASTER_FILE):
-        return pd.read_excel(MASTER_FILE)
-    return pd.DataFrame()
+@rec.timed("load:cube")
+def load_cube():
+    """
+    讀取資料期間彙總立方體，回傳 (立方體, 是否過期)。
+    指派變更時由寫入端只重算受影響的期間；仍有過期的期間 (例如回復指派) 或尚未建立時，
+    交給背景工作重算，本次先顯示現有的彙總。
+    """
+    snap = storage.snapshot()
+    data = storage.read_table(cube.CUBE, snap)
+    stale = cube.is_stale(data, snap)
+    if stale:
+        jobs.submit("cube", lambda report: ingest.refresh_stale_cube())
+    return data, stale
 
-df = load_data()
+frames = load_views()
 
 # 2. 標題
 st.title(t["main_title"])
 
-if df.empty or '複雜度評分' not in df.columns:
+if frames is None:
     st.warning(t["warn_no_data"])
 else:
     # --- A. 風險層級定義 ---
     with st.expander(t["expander_title"], expanded=False):
         st.table(pd.DataFrame(t["risk_table"]))
 
-    # 資料處理
-    def classify_risk(score):
-        if score >= 27: return t["risk_levels"][0]
-        elif score >= 14: return t["risk_levels"][1]
-        else: return t["risk_levels"][2]
-
-    df['風險層級'] = df['複雜度評分'].apply(classify_risk)
-    df['個體數'] = pd.to_numeric(df['個體數'], errors='coerce').fillna(0)
-    df['實際系統數'] = pd.to_numeric(df['(系統)已考量共用情況之實際系統數'], errors='coerce').fillna(df['系統數'])
-    df['調整後資源總量'] = df['個體數'] + df['實際系統數']
+    rec.begin("compute")
+    # 資料處理：風險層級於檢視中存為整數代碼 (0 低 / 1 中 / 2 高)，此處只對照語系標籤
+    risk_label = {views.HIGH: t["risk_levels"][0], views.MEDIUM: t["risk_levels"][1], views.LOW: t["risk_levels"][2]}
+    df = frames[views.CASE_VIEW]
+    df['風險層級'] = df['風險層級'].map(risk_label)
+    stats = frames[views.STATS_VIEW].iloc[0]
+    counts = frames[views.COUNTS_VIEW]
+    type_counts = counts[counts['維度'] == '案件類型']
+    risk_counts = counts[counts['維度'] == '風險層級'].assign(類別=lambda c: c['類別'].astype(int).map(risk_label))
+    top_10 = frames[views.TOP_VIEW]
 
     # --- B. 診斷指標 ---
+    rec.begin("render:charts")
     col1, col2, col3 = st.columns(3)
-    col1.metric(t["metric_total"], len(df))
-    col2.metric(t["metric_avg"], f"{df['複雜度評分'].mean():.1f}")
-    col3.metric(t["metric_high"], len(df[df['風險層級'] == t["risk_levels"][0]]))
+    col1.metric(t["metric_total"], int(stats['總案件數']))
+    col2.metric(t["metric_avg"], f"{stats['平均複雜度']:.1f}")
+    col3.metric(t["metric_high"], int(stats['高風險案件數']))
 
     st.divider()
 
@@ -119,14 +176,14 @@ else:
     c1, c2 = st.columns(2)
     
     with c1:
-        fig_type = px.pie(df, names='案件類型', title=t["pie_type_name"], hole=0.4)
+        fig_type = px.pie(type_counts, names='類別', values='件數', title=t["pie_type_name"], hole=0.4)
         fig_type.update_traces(textinfo='percent') 
         st.plotly_chart(update_fig_layout(fig_type), use_container_width=True)
         
     with c2:
         fig_risk = px.pie(
-            df, names='風險層級', title=t["pie_risk_name"],
-            color='風險層級',
+            risk_counts, names='類別', values='件數', title=t["pie_risk_name"],
+            color='類別',
             color_discrete_map={t["risk_levels"][0]: "#ef553b", t["risk_levels"][1]: "#fecb52", t["risk_levels"][2]: "#636efa"},
             hole=0.4
         )
@@ -135,30 +192,73 @@ else:
 
     # 第二排：長條圖
     st.subheader(t["bar_top_title"])
-    top_10 = df.nlargest(10, '複雜度評分')
     fig_bar = px.bar(
         top_10, x='案件名稱', y='複雜度評分', 
         color='複雜度評分', color_continuous_scale='Reds',
         text='複雜度評分'
     )
-    fig_bar.add_hline(y=df['複雜度評分'].mean(), line_dash="dash", line_color="blue", annotation_text=t["bar_avg_line"])
+    fig_bar.add_hline(y=stats['平均複雜度'], line_dash="dash", line_color="blue", annotation_text=t["bar_avg_line"])
     fig_bar.update_layout(margin=dict(l=20, r=20, t=50, b=50))
     st.plotly_chart(fig_bar, use_container_width=True)
 
     # 第三排：散佈圖
     st.subheader(t["scatter_title"])
-    fig_scatter = px.scatter(
-        df, x='調整後資源總量', y='複雜度評分',
-        size='複雜度評分', color='風險層級',
-        hover_name='案件名稱',
-        labels={'調整後資源總量': t["scatter_x_label"]},
-        color_discrete_map={t["risk_levels"][0]: "#ef553b", t["risk_levels"][1]: "#fecb52", t["risk_levels"][2]: "#636efa"}
+    rec.begin("render:scatter", rows=len(df))
+    # 案件量大時只保留「高風險且資源投入偏低」(資源量後 25%) 的案件為個別點，其餘以密度呈現
+    resources = df['調整後資源總量']
+    outliers = (df['複雜度評分'] >= views.RISK_BINS[1]) & (resources <= resources.quantile(0.25))
+    fig_scatter = charts.cached_figure(
+        ("overview_scatter", int(stats['來源版本']), curr_lang),
+        lambda: update_fig_layout(charts.adaptive_scatter(
+            df, x='調整後資源總量', y='複雜度評分',
+            outliers=outliers, priority=df['複雜度評分'], density_name=t["scatter_density"],
+            size='複雜度評分', color='風險層級',
+            hover_name='案件名稱',
+            labels={'調整後資源總量': t["scatter_x_label"]},
+            color_discrete_map={t["risk_levels"][0]: "#ef553b", t["risk_levels"][1]: "#fecb52", t["risk_levels"][2]: "#636efa"}
+        ), height=500)
     )
-    st.plotly_chart(update_fig_layout(fig_scatter, height=500), use_container_width=True)
-    
+    st.plotly_chart(fig_scatter, use_container_width=True)
+
+    # 第四排：月度趨勢 (只讀彙總立方體，不重掃歷史案件)
+    st.subheader(t["trend_title"])
+    cube_df, cube_stale = load_cube()
+    rec.begin("render:trend")
+    if cube_stale and not cube_df.empty:
+        st.caption(t["trend_refreshing"])
+    if cube_df.empty:
+        st.info(t["trend_no_data"])
+    else:
+        by = st.radio(t["trend_dim"], list(t["trend_dims"]), format_func=t["trend_dims"].get, horizontal=True)
+        if by == '風險層級':
+            cube_df['風險層級'] = cube_df['風險層級'].astype(int).map(risk_label)
+        by_period = cube.trend(cube_df, by)
+        overall = cube.trend(cube_df)
+        c3, c4 = st.columns(2)
+        with c3:
+            fig_trend = px.line(by_period, x=cube.PERIOD_COL, y='案件數', color=by, markers=True,
+                                title=t["trend_count"], labels={cube.PERIOD_COL: t["trend_period"]})
+            st.plotly_chart(fig_trend, use_container_width=True)
+        with c4:
+            fig_avg = px.bar(overall, x=cube.PERIOD_COL, y='平均複雜度', text='平均複雜度',
+                             title=t["trend_avg"], labels={cube.PERIOD_COL: t["trend_period"]})
+            st.plotly_chart(fig_avg, use_container_width=True)
+
+        st.markdown(f"**{t['compare_title']}**")
+        periods = list(overall[cube.PERIOD_COL])
+        if len(periods) < 2:
+            st.info(t["compare_single"])
+        else:
+            c5, c6 = st.columns(2)
+            base = c5.selectbox(t["compare_base"], periods, index=len(periods) - 2)
+            target = c6.selectbox(t["compare_target"], periods, index=len(periods) - 1)
+            st.dataframe(cube.compare(cube_df, base, target, by), use_container_width=True, hide_index=True)
+
     # 底部說明
     st.markdown(f"""
     <div style="font-size:12px; color: #888; margin-top: 10px; border-top: 1px solid #eee; padding-top: 10px;">
     {t["footer_guide"]}
     </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    """, unsafe_allow_html=True)
+
+rec.finish()
@@ -1,7 +1,13 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import os
+import storage
+import ingest
+import workload
+import assignments
+import optimizer
+import perf
+from schema import CASE_ID
 
 # --- 1. 語言配置字典 ---
 PAGE_LANG = {
@@ -14,7 +20,7 @@ PAGE_LANG = {
         "msg_save_list": "名單同步成功！",
         "main_title": "👥 人力配置合理性分析",
         "warn_no_master": "⚠️ 請先確保主數據中有案件名稱與複雜度資訊。",
-        "tabs": ["🎯 1. 案件指派", "✏️ 2. 分工比例填報", "📈 3. 負荷診斷報表"],
+        "tabs": ["🎯 1. 案件指派", "✏️ 2. 分工比例填報", "📈 3. 負荷診斷報表", "🤖 4. 自動指派建議"],
         "assign_header": "📝 案件團隊配置",
         "sel_proj": "📌 選擇專案",
         "sel_pm": "🆔 指派 PM",
@@ -51,7 +57,23 @@ PAGE_LANG = {
         "col_weighted": "加權負荷",
         "col_avg_complex": "平均複雜度",
         "col_total_complex": "總加權複雜度",
-        "col_case_count": "案件總數"
+        "col_case_count": "案件總數",
+        "col_capacity": "產能",
+        "report_dist_incomplete": "⚠️ 有 {} 個案件的分工占比尚未達 100%，其 Staff 加權負荷可能低估。",
+        "opt_header": "🤖 負荷平衡指派建議",
+        "opt_logic": "依複雜度由高到低逐案指派給目前「負荷 ÷ 產能」最低的人員，再以區域搜尋搬移指派以降低最高負荷。PM 每案 1 位；Staff 依風險層級 低 / 中 / 高 分別 1 / 2 / 3 位並平分占比。產能請於側邊欄名單設定 (1.0 為標準)。",
+        "opt_scope": "指派範圍",
+        "opt_scope_options": {"unassigned": "只排尚未指派的案件 (保留現有指派)", "all": "全部案件重新指派"},
+        "btn_opt_run": "⚙️ 產生指派建議",
+        "opt_none": "目前沒有需要指派的案件。",
+        "opt_no_roster": "名單中沒有 PM 或 Staff，請先於側邊欄維護人員名單。",
+        "opt_metric": "{} 最高相對負荷",
+        "opt_metric_delta": "貪婪初解 {:.2f}",
+        "opt_elapsed": "計算時間 {:.2f} 秒，共 {} 案",
+        "opt_chart_title": "建議後每人相對負荷 (負荷 ÷ 產能)",
+        "opt_preview": "📋 建議指派明細",
+        "btn_opt_apply": "✅ 套用建議 (寫入指派與分工占比)",
+        "msg_opt_applied": "已套用 {} 個案件的指派建議！"
     },
     "English": {
         "page_title": "Manpower Allocation & Stress Diagnosis",
@@ -62,7 +84,7 @@ PAGE_LANG = {
         "msg_save_list": "Roster synchronized!",
         "main_title": "👥 Case Allocation & Diagnosis",
         "warn_no_master": "⚠️ Please ensure Master Data has case names and complexity scores.",
-        "tabs": ["🎯 1. Assignment", "✏️ 2. Workload Split", "📈 3. Diagnosis Report"],
+        "tabs": ["🎯 1. Assignment", "✏️ 2. Workload Split", "📈 3. Diagnosis Report", "🤖 4. Auto Assignment"],
         "assign_header": "📝 Team Configuration",
         "sel_proj": "📌 Select Project",
         "sel_pm": "🆔 Assign PM",
@@ -99,7 +121,23 @@ PAGE_LANG = {
         "col_weighted": "Weighted Load",
         "col_avg_complex": "Avg Complexity",
         "col_total_complex": "Total Weighted Complexity",
-        "col_case_count": "Total Cases"
+        "col_case_count": "Total Cases",
+        "col_capacity": "Capacity",
+        "report_dist_incomplete": "⚠️ {} cases have splits below 100%; their Staff weighted load may be understated.",
+        "opt_header": "🤖 Load-Balanced Assignment Proposal",
+        "opt_logic": "Cases are assigned from the most to the least complex, each to whoever currently has the lowest load ÷ capacity; a local search then moves assignments to lower the peak load. One PM per case; 1 / 2 / 3 Staff for low / medium / high risk with equal splits. Set capacity in the sidebar roster (1.0 = standard).",
+        "opt_scope": "Scope",
+        "opt_scope_options": {"unassigned": "Unassigned cases only (keep current assignments)", "all": "Reassign all cases"},
+        "btn_opt_run": "⚙️ Generate Proposal",
+        "opt_none": "No cases need assignment.",
+        "opt_no_roster": "The roster has no PM or Staff; maintain it in the sidebar first.",
+        "opt_metric": "{} peak relative load",
+        "opt_metric_delta": "greedy {:.2f}",
+        "opt_elapsed": "Computed in {:.2f}s for {} cases",
+        "opt_chart_title": "Relative load per person after proposal (load ÷ capacity)",
+        "opt_preview": "📋 Proposed Assignments",
+        "btn_opt_apply": "✅ Apply Proposal (write assignments & splits)",
+        "msg_opt_applied": "Applied the proposal to {} cases!"
     }
 }
 
@@ -107,128 +145,119 @@ PAGE_LANG = {
 curr_lang = st.session_state.get("lang", "繁體中文")
 t = PAGE_LANG[curr_lang]
 
-# 2. 系統路徑與檔案配置 (保留原邏輯)
-current_dir = os.path.dirname(os.path.abspath(__file__))
-output_folder = os.path.join(os.path.dirname(current_dir), "outputs")
-if not os.path.exists(output_folder): os.makedirs(output_folder)
-
-MASTER_FILE = os.path.join(output_folder, "master_data.xlsx")
-ROI_FILE = os.path.join(output_folder, "roi_data.xlsx")
-STAFF_LIST_FILE = os.path.join(output_folder, "staff_list.xlsx")
-DIST_FILE = os.path.join(output_folder, "workload_distribution.xlsx")
+rec = perf.Recorder("loading_analysis")
 
+# 2. 資料表配置 (經由 storage 讀寫)
+@rec.timed("load")
 def load_and_fix_data():
-    m_df = pd.read_excel(MASTER_FILE) if os.path.exists(MASTER_FILE) else pd.DataFrame()
+    # 同一次執行的所有資料表讀取釘選在同一組版本，不會混到其他 session 寫入中的資料
+    snap = storage.snapshot()
+    m_df = storage.read_table("master_data", snap)
+    if not m_df.empty and (CASE_ID not in m_df.columns or m_df[CASE_ID].isna().any()):
+        # 舊版主檔尚未配發案件編號 (尚未開啟主頁)：先補齊並寫回，再以新版本重新讀取
+        ingest.ensure_case_ids(m_df)
+        snap = storage.snapshot()
+        m_df = storage.read_table("master_data", snap)
     if not m_df.empty and '案件類型' not in m_df.columns:
         m_df['案件類型'] = "Unclassified" if curr_lang == "English" else "未分類"
         
-    r_df = pd.read_excel(ROI_FILE) if os.path.exists(ROI_FILE) else pd.DataFrame()
-    
-    if os.path.exists(DIST_FILE):
-        d_df = pd.read_excel(DIST_FILE)
-        if d_df.empty or '案件名稱' not in d_df.columns:
-            d_df = pd.DataFrame(columns=['案件名稱', '負責人', '占比'])
-    else:
-        d_df = pd.DataFrame(columns=['案件名稱', '負責人', '占比'])
+    r_df = storage.read_table("roi_data", snap)
     
-    if os.path.exists(STAFF_LIST_FILE):
-        s_list_df = pd.read_excel(STAFF_LIST_FILE)
+    if storage.exists("staff_list"):
+        s_list_df = storage.read_table("staff_list", snap)
     else:
         s_list_df = pd.DataFrame([{"角色類型": "PM", "姓名": "Barry"}, {"角色類型": "Staff", "姓名": "Ariel"}])
+    if optimizer.CAPACITY_COL not in s_list_df.columns:
+        s_list_df[optimizer.CAPACITY_COL] = 1.0
     
-    for df in [m_df, r_df]:
-        for col in ['PM名單', 'Staff名單']:
-            if col in df.columns:
-                df[col] = df[col].astype(str).replace(['nan', 'None', '0.0', '0', ''], "")
+    # 指派改存於 assignments 關聯表；舊版 roi_data 的逗號名單只在第一次載入時轉換
+    a_df = assignments.load_relation(r_df, snap)
     
     pm_pool = s_list_df[s_list_df['角色類型'] == 'PM']['姓名'].dropna().unique().tolist()
     staff_pool = s_list_df[s_list_df['角色類型'] == 'Staff']['姓名'].dropna().unique().tolist()
         
-    return m_df, r_df, d_df, pm_pool, staff_pool, s_list_df
+    return m_df, r_df, a_df, pm_pool, staff_pool, s_list_df, snap
 
 # --- 頁面初始設定 ---
 st.set_page_config(page_title=t["page_title"], layout="wide")
-master_df, roi_df, dist_df, PM_POOL, STAFF_POOL, S_LIST_DF = load_and_fix_data()
+master_df, roi_df, assign_df, PM_POOL, STAFF_POOL, S_LIST_DF, SNAP = load_and_fix_data()
+rec.begin("compute:index", rows=len(assign_df))
+# 指派索引與分工占比完成度索引皆跨執行保留，釘選版本與索引版本不同時才重建
+assign_idx = st.session_state.get("assign_idx")
+if assign_idx is None or assign_idx.version is None or assign_idx.version != SNAP["assignments"]:
+    assign_idx = assignments.AssignmentIndex(assign_df, SNAP["assignments"])
+    st.session_state.assign_idx = assign_idx
 
-def to_list(val): return [n.strip() for n in str(val).split(',')] if val and str(val) not in ["nan", ""] else []
+dist_tracker = st.session_state.get("dist_tracker")
+if dist_tracker is None or dist_tracker.version is None or dist_tracker.version != SNAP["workload_distribution"]:
+    # 分工占比表只在索引版本落後時讀取；版本相同的重新執行直接由索引還原
+    d_df = storage.read_table("workload_distribution", SNAP)
+    if d_df.empty or CASE_ID not in d_df.columns:
+        d_df = pd.DataFrame(columns=[CASE_ID, '案件名稱', '負責人', '占比'])
+    dist_tracker = assignments.DistributionTracker(d_df, SNAP["workload_distribution"])
+    st.session_state.dist_tracker = dist_tracker
+dist_df = dist_tracker.frame()
 
 # --- A. 側邊欄：人員名單維護 ---
+rec.begin("render:sidebar", rows=len(S_LIST_DF))
 with st.sidebar:
     st.header(t["sidebar_header"])
     st.subheader(t["pm_list"])
-    pm_data = S_LIST_DF[S_LIST_DF['角色類型'] == 'PM'][['姓名']].reset_index(drop=True)
-    edited_pms = st.data_editor(pm_data.rename(columns={"姓名": t["col_name"]}), num_rows="dynamic", use_container_width=True, key="pm_editor", hide_index=True)
+    roster_cols = {"姓名": t["col_name"], optimizer.CAPACITY_COL: t["col_capacity"]}
+    capacity_config = {t["col_capacity"]: st.column_config.NumberColumn(t["col_capacity"], min_value=0.1, step=0.1, default=1.0)}
+    pm_data = S_LIST_DF[S_LIST_DF['角色類型'] == 'PM'][list(roster_cols)].reset_index(drop=True)
+    edited_pms = st.data_editor(pm_data.rename(columns=roster_cols), num_rows="dynamic", use_container_width=True, key="pm_editor", hide_index=True, column_config=capacity_config)
     
     st.subheader(t["staff_list"])
-    staff_data = S_LIST_DF[S_LIST_DF['角色類型'] == 'Staff'][['姓名']].reset_index(drop=True)
-    edited_staffs = st.data_editor(staff_data.rename(columns={"姓名": t["col_name"]}), num_rows="dynamic", use_container_width=True, key="staff_editor", hide_index=True)
+    staff_data = S_LIST_DF[S_LIST_DF['角色類型'] == 'Staff'][list(roster_cols)].reset_index(drop=True)
+    edited_staffs = st.data_editor(staff_data.rename(columns=roster_cols), num_rows="dynamic", use_container_width=True, key="staff_editor", hide_index=True, column_config=capacity_config)
     
     if st.button(t["btn_save_list"], use_container_width=True):
-        final_pms = edited_pms.rename(columns={t["col_name"]: "姓名"}).dropna().copy(); final_pms['角色類型'] = 'PM'
-        final_sts = edited_staffs.rename(columns={t["col_name"]: "姓名"}).dropna().copy(); final_sts['角色類型'] = 'Staff'
-        pd.concat([final_pms, final_sts], ignore_index=True).to_excel(STAFF_LIST_FILE, index=False)
+        reverse_cols = {v: k for k, v in roster_cols.items()}
+        final_pms = edited_pms.rename(columns=reverse_cols).dropna(subset=["姓名"]).copy(); final_pms['角色類型'] = 'PM'
+        final_sts = edited_staffs.rename(columns=reverse_cols).dropna(subset=["姓名"]).copy(); final_sts['角色類型'] = 'Staff'
+        final_list = pd.concat([final_pms, final_sts], ignore_index=True)
+        final_list[optimizer.CAPACITY_COL] = final_list[optimizer.CAPACITY_COL].fillna(1.0)
+        storage.write_table("staff_list", final_list)
         st.success(t["msg_save_list"]); st.rerun()
 
 # --- B. 主要內容區 ---
 st.title(t["main_title"])
 
-if master_df.empty:
+if master_df.empty or CASE_ID not in master_df.columns:
     st.warning(t["warn_no_master"])
 else:
-    combined_df = master_df[['案件名稱', '案件類型', '複雜度評分']].copy()
+    rec.begin("compute:overview", rows=len(master_df))
+    combined_df = master_df[[CASE_ID, '案件名稱', '案件類型', '複雜度評分']].copy()
+    # 案件編號 → 名稱 / 選單標籤 (hash 索引，O(1) 查詢)
+    case_names = dict(zip(combined_df[CASE_ID], combined_df['案件名稱']))
+    case_labels = dict(zip(combined_df[CASE_ID], "[" + combined_df['案件類型'].astype(str) + "] " + combined_df['案件名稱'].astype(str)))
     
-    if not roi_df.empty:
-        # 1. 自動清洗欄位名稱，去除不可見的空格或換行
-        roi_df.columns = roi_df.columns.astype(str).str.strip()
-        
-        # 2. 定義目標欄位
-        target_cols = ['案件名稱', 'PM名單', 'Staff名單']
-        
-        # 3. 檢查哪些欄位是真的存在的
-        existing_cols = [c for c in target_cols if c in roi_df.columns]
-        
-        # 4. 如果最重要的 '案件名稱' 存在，才進行合併
-        if '案件名稱' in existing_cols:
-            combined_df = pd.merge(combined_df, roi_df[existing_cols], on='案件名稱', how='left').fillna("")
-            
-            # 5. 如果缺了 PM 或 Staff 欄位，手動補齊空值，避免後續繪圖程式碼出錯
-            for col in ['PM名單', 'Staff名單']:
-                if col not in combined_df.columns:
-                    combined_df[col] = ""
-        else:
-            # 如果連 '案件名稱' 都不見了，代表 Excel 結構完全不對
-            st.error(f"❌ 關鍵錯誤：在 ROI 資料中找不到 '案件名稱' 欄位。目前偵測到的欄位有：{roi_df.columns.tolist()}")
-            combined_df['PM名單'], combined_df['Staff名單'] = "", ""
-    else:
-        # 如果 roi_df 是空的，給予預設空值
-        combined_df['PM名單'], combined_df['Staff名單'] = "", ""
+    # PM名單 / Staff名單 僅為總覽表顯示用，由指派關聯表組回字串
+    name_strings = assignments.to_strings(assign_df, combined_df[CASE_ID])
+    combined_df['PM名單'] = name_strings['PM名單'].to_numpy()
+    combined_df['Staff名單'] = name_strings['Staff名單'].to_numpy()
 
-    tab_assign, tab_dist, tab_report = st.tabs(t["tabs"])
+    # 已指派 Staff 但分工占比未達 100% 的案件 (依主檔順序)，分工與報表頁簽共用
+    missing_ids = dist_tracker.incomplete(assign_idx.staffed_cases())
+    missing_projs = combined_df.loc[combined_df[CASE_ID].isin(missing_ids), CASE_ID].tolist()
+
+    tab_assign, tab_dist, tab_report, tab_opt = st.tabs(t["tabs"])
 
     # 1. 案件指派
     with tab_assign:
+        rec.begin("render:assign")
         st.subheader(t["assign_header"])
-        proj_options = combined_df.apply(lambda x: f"[{x['案件類型']}] {x['案件名稱']}", axis=1).tolist()
-        proj_mapping = dict(zip(proj_options, combined_df['案件名稱']))
-        sel_option = st.selectbox(t["sel_proj"], proj_options)
-        target = proj_mapping[sel_option]
-        
-        row_data = combined_df[combined_df['案件名稱'] == target].iloc[0]
+        target = st.selectbox(t["sel_proj"], combined_df[CASE_ID].tolist(), format_func=case_labels.get)
         
         c1, c2 = st.columns(2)
         with c1:
-            new_pms = st.multiselect(t["sel_pm"], PM_POOL, default=[n for n in to_list(row_data['PM名單']) if n in PM_POOL])
+            new_pms = st.multiselect(t["sel_pm"], PM_POOL, default=[n for n in assign_idx.members(target, "PM") if n in PM_POOL])
         with c2:
-            new_sts = st.multiselect(t["sel_staff"], STAFF_POOL, default=[n for n in to_list(row_data['Staff名單']) if n in STAFF_POOL])
+            new_sts = st.multiselect(t["sel_staff"], STAFF_POOL, default=[n for n in assign_idx.members(target, "Staff") if n in STAFF_POOL])
         
         if st.button(t["btn_assign"]):
-            if roi_df.empty or target not in roi_df['案件名稱'].values:
-                new_row = pd.DataFrame([{'案件名稱': target, 'PM名單': ",".join(new_pms), 'Staff名單': ",".join(new_sts)}])
-                roi_df = pd.concat([roi_df, new_row], ignore_index=True)
-            else:
-                roi_df.loc[roi_df['案件名稱'] == target, 'PM名單'] = ",".join(new_pms)
-                roi_df.loc[roi_df['案件名稱'] == target, 'Staff名單'] = ",".join(new_sts)
-            roi_df.to_excel(ROI_FILE, index=False); st.success(f"{target} {t['assign_msg']}"); st.rerun()
+            assignments.save_case(target, case_names[target], {"PM": new_pms, "Staff": new_sts}); st.success(f"{case_names[target]} {t['assign_msg']}"); st.rerun()
 
         st.divider()
         st.subheader(t["assign_overview"])
@@ -239,31 +268,28 @@ else:
 
     # 2. 分工比例填報
     with tab_dist:
+        rec.begin("render:dist")
         st.subheader(t["dist_header"])
-        has_staff_projs = combined_df[combined_df['Staff名單'] != ""]['案件名稱'].tolist()
-        filled_projs = dist_df.groupby('案件名稱')['占比'].sum()
-        completed_projs = filled_projs[abs(filled_projs - 100) < 0.1].index.tolist()
-        missing_projs = [p for p in has_staff_projs if p not in completed_projs]
-        
         if missing_projs:
             st.error(t["dist_missing"].format(len(missing_projs)))
-            st.write(", ".join(missing_projs))
+            st.write(", ".join(case_names[p] for p in missing_projs))
         else:
             st.success(t["dist_success"])
         
         st.divider()
         st.subheader(t["dist_header"])
-        sel_proj = st.selectbox(t["sel_proj"], combined_df['案件名稱'].tolist(), key="dist_sel")
-        current_staff_str = roi_df.loc[roi_df['案件名稱'] == sel_proj, 'Staff名單'].values if not roi_df.empty and sel_proj in roi_df['案件名稱'].values else []
-        current_staffs = to_list(current_staff_str[0]) if len(current_staff_str) > 0 else []
+        sel_proj = st.selectbox(t["sel_proj"], combined_df[CASE_ID].tolist(), format_func=case_names.get, key="dist_sel")
+        current_staffs = assign_idx.members(sel_proj, "Staff")
         
         if not current_staffs:
             st.info(t["dist_info"])
         else:
-            exist_dist = dist_df[dist_df['案件名稱'] == sel_proj] if not dist_df.empty else pd.DataFrame()
+            # 既有分工由常駐索引查詢 (O(該案列數))，不必每次重跑對整張分工表 groupby
+            exist_shares = assign_idx.shares(sel_proj, dist_tracker)
             init_df = pd.DataFrame({'負責人': current_staffs})
-            if not exist_dist.empty:
-                init_df = pd.merge(init_df, exist_dist[['負責人', '占比']], on='負責人', how='left').fillna(0)
+            if sel_proj in dist_tracker.shares:
+                init_df['占比'] = [exist_shares[name] for name in current_staffs]
+                init_df = init_df.fillna(0)
             else:
                 init_df['占比'] = (100 / len(current_staffs))
             
@@ -273,10 +299,12 @@ else:
             st.write(t["dist_total"].format(total_pct))
             
             if st.button(t["btn_save_dist"], disabled=(abs(total_pct - 100) > 0.01)):
-                temp_dist = dist_df[dist_df['案件名稱'] != sel_proj] if not dist_df.empty else pd.DataFrame(columns=['案件名稱', '負責人', '占比'])
                 new_data = edited_df_ui.rename(columns={t["col_owner"]: "負責人", t["col_ratio"]: "占比"}).copy()
-                new_data['案件名稱'] = sel_proj
-                pd.concat([temp_dist, new_data], ignore_index=True).to_excel(DIST_FILE, index=False)
+                new_data[CASE_ID] = sel_proj
+                new_data['案件名稱'] = case_names[sel_proj]
+                # 只替換此案件的分工列，其他案件不重寫
+                storage.replace_rows("workload_distribution", {CASE_ID: sel_proj}, new_data[[CASE_ID, '案件名稱', '負責人', '占比']])
+                dist_tracker.update(sel_proj, new_data.set_index('負責人')['占比'], storage.current_version("workload_distribution"))
                 st.success(t["assign_msg"]); st.rerun()
 
     # 3. 負荷診斷報表
@@ -284,18 +312,15 @@ else:
         with st.expander(t["report_logic_title"], expanded=False):
             st.info(t["report_logic_text"])
 
-        if not roi_df.empty:
-            pm_perf = []
-            for _, row in combined_df.iterrows():
-                pms = to_list(row['PM名單'])
-                for p in pms:
-                    if p: pm_perf.append({'PM': p, '案件名稱': row['案件名稱'], '案件類型': row['案件類型'], '複雜度': row['複雜度評分']})
+        # 一次算出 PM / Staff 的案件數、總 (平均) 複雜度與加權負荷
+        with rec.stage("compute:workload", rows=len(assign_df) + len(dist_df)):
+            load = workload.compute_workload(combined_df, dist_df, assign_df)
+        rec.begin("render:report")
+
+        if not assign_df.empty:
+            pm_stats_df, pm_summary = load["pm_detail"], load["pm_summary"]
             
-            if pm_perf:
-                pm_stats_df = pd.DataFrame(pm_perf)
-                pm_summary = pm_stats_df.groupby('PM').agg(count=('案件名稱', 'count'), sum=('複雜度', 'sum')).reset_index()
-                pm_summary['avg'] = (pm_summary['sum'] / pm_summary['count']).round(2)
-                pm_summary = pm_summary.sort_values(by='avg', ascending=False)
+            if not pm_stats_df.empty:
                 
                 st.subheader(t["pm_diag_title"])
                 fig_pm = px.bar(
@@ -331,12 +356,12 @@ else:
 
         st.divider()
         st.subheader(t["staff_diag_title"])
+        if missing_projs:
+            st.warning(t["report_dist_incomplete"].format(len(missing_projs)))
         if dist_df.empty:
             st.info("💡 No data.")
         else:
-            analysis_df = pd.merge(dist_df, master_df[['案件名稱', '案件類型', '複雜度評分']], on='案件名稱', how='left')
-            analysis_df['加權負荷'] = (analysis_df['複雜度評分'] * (analysis_df['占比'] / 100)).round(2)
-            stats = analysis_df.groupby('負責人').agg(count=('案件名稱', 'count'), sum=('加權負荷', 'sum')).reset_index().round(2).sort_values(by='sum', ascending=True)
+            analysis_df, stats = load["staff_detail"], load["staff_summary"]
 
             fig = px.bar(
                 stats, x='sum', y='負責人', orientation='h',
@@ -358,3 +383,59 @@ else:
             person_detail.index += 1
 
             st.table(person_detail)
+
+    # 4. 自動指派建議
+    with tab_opt:
+        st.subheader(t["opt_header"])
+        st.info(t["opt_logic"])
+        scope = st.radio(t["opt_scope"], list(t["opt_scope_options"]), format_func=t["opt_scope_options"].get, horizontal=True)
+
+        if st.button(t["btn_opt_run"]):
+            with rec.stage("compute:optimizer", rows=len(master_df)):
+                if scope == "unassigned":
+                    # 只排尚未有任何指派的案件，現有指派與分工占比的負荷計入起始負荷
+                    assigned = set(assign_df[CASE_ID].dropna()) if not assign_df.empty else set()
+                    target_ids = [c for c in combined_df[CASE_ID] if c not in assigned]
+                    st.session_state.opt_proposal = optimizer.propose(master_df, S_LIST_DF, target_ids, assign_df, dist_df)
+                else:
+                    st.session_state.opt_proposal = optimizer.propose(master_df, S_LIST_DF)
+
+        rec.begin("render:optimizer")
+        proposal = st.session_state.get("opt_proposal")
+        if proposal is not None:
+            proposed_ids = proposal["relation"][CASE_ID].unique()
+            if proposal["loads"].empty:
+                st.warning(t["opt_no_roster"])
+            elif not len(proposed_ids):
+                st.info(t["opt_none"])
+            else:
+                stats = proposal["stats"]
+                m_cols = st.columns(3)
+                for col, role in zip(m_cols, ("PM", "Staff")):
+                    if role in stats:
+                        col.metric(t["opt_metric"].format(role), f"{stats[role]['max']:.2f}",
+                                   delta=t["opt_metric_delta"].format(stats[role]["greedy_max"]), delta_color="off")
+                m_cols[2].caption(t["opt_elapsed"].format(stats["seconds"], len(proposed_ids)))
+
+                loads = proposal["loads"].sort_values('相對負荷')
+                fig_opt = px.bar(
+                    loads, x='相對負荷', y='姓名', color='角色', orientation='h',
+                    title=t["opt_chart_title"], height=max(300, len(loads) * 25)
+                )
+                st.plotly_chart(fig_opt, use_container_width=True)
+
+                st.write(t["opt_preview"])
+                preview = combined_df[combined_df[CASE_ID].isin(proposed_ids)][[CASE_ID, '案件類型', '案件名稱', '複雜度評分']]
+                preview = preview.merge(assignments.to_strings(proposal["relation"], preview[CASE_ID]), on=CASE_ID)
+                st.dataframe(preview.drop(columns=[CASE_ID]).rename(columns={
+                    "案件類型": t["col_case_type"], "案件名稱": t["col_case_name"], "複雜度評分": t["col_complexity"],
+                    "PM名單": t["col_pm"], "Staff名單": t["col_staff"]
+                }), use_container_width=True, hide_index=True)
+
+                if st.button(t["btn_opt_apply"], type="primary"):
+                    # 寫回需保留分工表的完整列 (含案件名稱)，套用時才讀取
+                    optimizer.save_proposal(proposal, assign_df, storage.read_table("workload_distribution", SNAP))
+                    del st.session_state.opt_proposal
+                    st.success(t["msg_opt_applied"].format(len(proposed_ids))); st.rerun()
+
+rec.finish()
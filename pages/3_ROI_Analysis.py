@@ -1,7 +1,13 @@
 import streamlit as st
 import pandas as pd
-import os
-import plotly.express as px
+import numpy as np
+import json
+import storage
+import ingest
+import charts
+import roi
+import perf
+from schema import CASE_ID
 
 # --- 1. 語言配置字典 ---
 PAGE_LANG = {
@@ -33,8 +39,10 @@ PAGE_LANG = {
         "plot_y": "金額 (萬)",
         "avg_price_line": "平均報價",
         "avg_diff_line": "平均難度",
+        "plot_density": "案件密度",
         "decision_header": "🚩 管理決策建議",
         "warn_raise_price": "⚠️ **應提高報價案件**",
+        "raise_by": "建議調升 {:.1f} 萬",
         "success_no_issue": "✅ 暫無異常案件。",
         "star_cases": "💎 **優質核心案件**",
         "matrix_info": "💡 請先在頁簽 1 填寫報價金額後即可查看分析矩陣。"
@@ -67,8 +75,10 @@ PAGE_LANG = {
         "plot_y": "Amount (10k)",
         "avg_price_line": "Avg Price",
         "avg_diff_line": "Avg Difficulty",
+        "plot_density": "Case density",
         "decision_header": "🚩 Management Suggestions",
         "warn_raise_price": "⚠️ **Underpriced Cases**",
+        "raise_by": "raise by {:.1f}",
         "success_no_issue": "✅ No anomalies found.",
         "star_cases": "💎 **Premium Core Cases**",
         "matrix_info": "💡 Please fill in prices in Tab 1 to view the matrix."
@@ -81,39 +91,49 @@ t = PAGE_LANG[curr_lang]
 
 # 1. 系統配置
 st.set_page_config(page_title=t["page_title"], layout="wide")
-
-current_dir = os.path.dirname(os.path.abspath(__file__))
-output_folder = os.path.join(os.path.dirname(current_dir), "outputs")
-MASTER_FILE = os.path.join(output_folder, "master_data.xlsx")
-ROI_FILE = os.path.join(output_folder, "roi_data.xlsx")
+rec = perf.Recorder("roi_analysis")
 
 # 2. 資料載入
+@rec.timed("load")
 def load_data():
-    master_df = pd.read_excel(MASTER_FILE).copy() if os.path.exists(MASTER_FILE) else pd.DataFrame()
-    roi_df = pd.read_excel(ROI_FILE).copy() if os.path.exists(ROI_FILE) else pd.DataFrame()
-    return master_df, roi_df
+    # 兩張表釘選在同一組版本讀取
+    snap = storage.snapshot()
+    master_df = storage.read_table("master_data", snap)
+    if not master_df.empty and (CASE_ID not in master_df.columns or master_df[CASE_ID].isna().any()):
+        # 舊版主檔尚未配發案件編號 (尚未開啟主頁)：先補齊並寫回，再以新版本重新讀取
+        ingest.ensure_case_ids(master_df)
+        snap = storage.snapshot()
+        master_df = storage.read_table("master_data", snap)
+    roi_df = storage.read_table("roi_data", snap)
+    return master_df, roi_df, snap
 
 st.title(t["main_title"])
-master_df, roi_df = load_data()
+master_df, roi_df, snap = load_data()
 
-if master_df.empty:
+if master_df.empty or CASE_ID not in master_df.columns:
     st.warning(t["warn_no_master"])
 else:
     # 3. 資料整合與同步
-    sync_data = master_df[['案件名稱', '複雜度評分']].copy()
-    if not roi_df.empty:
+    rec.begin("compute:sync", rows=len(master_df))
+    sync_data = master_df[[CASE_ID, '案件名稱', '複雜度評分']].copy()
+    sync_data['最終報價(萬)'] = float('nan')
+    sync_data['預計工時'] = float('nan')
+    if not roi_df.empty and CASE_ID in roi_df.columns:
         if '最終報價' in roi_df.columns and '最終報價(萬)' not in roi_df.columns:
             roi_df = roi_df.rename(columns={'最終報價': '最終報價(萬)'})
-        valid_cols = [c for c in ['案件名稱', '最終報價(萬)', '預計工時'] if c in roi_df.columns]
-        sync_data = pd.merge(sync_data, roi_df[valid_cols], on='案件名稱', how='left')
+        valid_cols = [c for c in ['最終報價(萬)', '預計工時'] if c in roi_df.columns]
+        # 以案件編號為索引對齊 (同一編號只取最後一筆，不會因重複案件名稱而放大列數)
+        roi_by_id = roi_df.drop_duplicates(subset=CASE_ID, keep='last').set_index(CASE_ID)
+        sync_data[valid_cols] = roi_by_id[valid_cols].reindex(sync_data[CASE_ID]).to_numpy()
     
-    sync_data['最終報價(萬)'] = sync_data['最終報價(萬)'].fillna(0.0)
-    sync_data['預計工時'] = sync_data['預計工時'].fillna(0.0)
+    sync_data['最終報價(萬)'] = sync_data['最終報價(萬)'].astype(float).fillna(0.0)
+    sync_data['預計工時'] = sync_data['預計工時'].astype(float).fillna(0.0)
 
     # --- 建立頁簽 ---
     tab1, tab2 = st.tabs(t["tabs"])
 
     with tab1:
+        rec.begin("render:editor", rows=len(sync_data))
         st.subheader(t["tab1_header"])
         
         missing_price = sync_data[sync_data['最終報價(萬)'] <= 0]['案件名稱'].tolist()
@@ -134,6 +154,7 @@ else:
                 "最終報價(萬)": t["col_price"], "預計工時": t["col_hours"]
             }),
             column_config={
+                CASE_ID: None,
                 t["col_name"]: st.column_config.Column(disabled=True),
                 t["col_complexity"]: st.column_config.NumberColumn(t["col_complexity"], disabled=True),
                 t["col_price"]: st.column_config.NumberColumn(t["col_price"], min_value=0, format="%f"),
@@ -151,7 +172,11 @@ else:
                     t["col_name"]: "案件名稱", t["col_complexity"]: "複雜度評分",
                     t["col_price"]: "最終報價(萬)", t["col_hours"]: "預計工時"
                 })
-                save_df.to_excel(ROI_FILE, index=False)
+                # 只寫入編輯過的列與 ROI 表尚未建立的案件
+                edited_pos = [int(i) for i in st.session_state.get("roi_editor", {}).get("edited_rows", {})]
+                known = roi_df[CASE_ID] if CASE_ID in roi_df.columns else pd.Series(dtype=object)
+                changed = save_df.index.isin(save_df.index[edited_pos]) | ~save_df[CASE_ID].isin(known)
+                storage.upsert_rows("roi_data", save_df[changed])
                 st.success(t["msg_save_success"])
                 st.rerun()
             except PermissionError:
@@ -159,23 +184,15 @@ else:
 
     with tab2:
         # 還原 Key 以進行計算
-        calc_df = edited_df.rename(columns={
-            t["col_name"]: "案件名稱", t["col_complexity"]: "複雜度評分",
-            t["col_price"]: "最終報價(萬)", t["col_hours"]: "預計工時"
-        }).copy()
-        
-        calc_df['投報率'] = calc_df.apply(
-            lambda x: round(x['最終報價(萬)'] / x['複雜度評分'], 2) if x['複雜度評分'] > 0 else 0, axis=1
-        )
-        
+        with rec.stage("compute:roi", rows=len(edited_df)):
+            calc_df, roi_stats = roi.analyze(edited_df.rename(columns={
+                t["col_name"]: "案件名稱", t["col_complexity"]: "複雜度評分",
+                t["col_price"]: "最終報價(萬)", t["col_hours"]: "預計工時"
+            }))
+        rec.begin("render:list")
+        avg_roi, avg_price, avg_complexity = roi_stats["avg_roi"], roi_stats["avg_price"], roi_stats["avg_complexity"]
         active_mask = calc_df['最終報價(萬)'] > 0
-        avg_roi = calc_df.loc[active_mask, '投報率'].mean() if active_mask.any() else 0
-        avg_price = calc_df.loc[active_mask, '最終報價(萬)'].mean() if active_mask.any() else 0
-        avg_complexity = calc_df['複雜度評分'].mean()
-
-        calc_df['商務評價'] = calc_df['投報率'].apply(
-            lambda x: t["eval_high"] if x >= avg_roi and x > 0 else t["eval_low"]
-        )
+        calc_df['商務評價'] = np.where(calc_df['高於平均'], t["eval_high"], t["eval_low"])
 
         st.subheader(t["list_header"])
         st.info(t["roi_standard"].format(avg_roi))
@@ -193,31 +210,48 @@ else:
         st.divider()
 
         if active_mask.any():
+            rec.begin("render:matrix", rows=int(active_mask.sum()))
             st.subheader(t["matrix_header"])
             plot_df = calc_df[active_mask].copy()
-            fig = px.scatter(
-                plot_df, x='複雜度評分', y='最終報價(萬)',
-                size='投報率', color='商務評價',
-                text='案件名稱', hover_name='案件名稱',
-                color_discrete_map={t["eval_high"]: "#00CC96", t["eval_low"]: "#EF553B"},
-                labels={'複雜度評分': t["plot_x"], '最終報價(萬)': t["plot_y"]},
-                height=500
-            )
-            # 輔助線翻譯
-            fig.add_hline(y=avg_price, line_dash="dash", annotation_text=t["avg_price_line"])
-            fig.add_vline(x=avg_complexity, line_dash="dash", annotation_text=t["avg_diff_line"])
-            st.plotly_chart(fig, use_container_width=True)
+            bad_mask = calc_df['象限'] == roi.RAISE_PRICE
+            star_mask = calc_df['象限'] == roi.STAR
+
+            def build_matrix():
+                # 案件量大時只有應提高報價 / 優質核心案件保留個別點與名稱標籤，其餘以密度呈現
+                fig = charts.adaptive_scatter(
+                    plot_df, x='複雜度評分', y='最終報價(萬)',
+                    outliers=(bad_mask | star_mask)[active_mask],
+                    priority=(plot_df['投報率'] - avg_roi).abs(), density_name=t["plot_density"],
+                    size='投報率', color='商務評價',
+                    text='案件名稱', hover_name='案件名稱',
+                    color_discrete_map={t["eval_high"]: "#00CC96", t["eval_low"]: "#EF553B"},
+                    labels={'複雜度評分': t["plot_x"], '最終報價(萬)': t["plot_y"]},
+                    height=500
+                )
+                # 輔助線翻譯
+                fig.add_hline(y=avg_price, line_dash="dash", annotation_text=t["avg_price_line"])
+                fig.add_vline(x=avg_complexity, line_dash="dash", annotation_text=t["avg_diff_line"])
+                return fig
+
+            # 未存檔的編輯也會改變圖表，快取鍵含資料版本與編輯內容
+            edits = json.dumps(st.session_state.get("roi_editor", {}).get("edited_rows", {}), sort_keys=True, default=str)
+            matrix_key = ("roi_matrix", snap["master_data"], snap["roi_data"], edits, curr_lang)
+            st.plotly_chart(charts.cached_figure(matrix_key, build_matrix), use_container_width=True)
 
             st.subheader(t["decision_header"])
-            bad_cases = calc_df[(calc_df['複雜度評分'] > avg_complexity) & (calc_df['最終報價(萬)'] < avg_price) & active_mask]
+            bad_cases = calc_df[bad_mask]
             col1, col2 = st.columns(2)
             with col1:
                 if not bad_cases.empty:
-                    st.error(f"{t['warn_raise_price']}\n\n" + "\n".join([f"- {name}" for name in bad_cases['案件名稱']]))
+                    st.error(f"{t['warn_raise_price']}\n\n" + "\n".join(
+                        [f"- {name} ({t['raise_by'].format(gap)})" if gap > 0 else f"- {name}"
+                         for name, gap in zip(bad_cases['案件名稱'], bad_cases['價差(萬)'])]))
                 else: st.success(t["success_no_issue"])
             with col2:
-                star_cases = calc_df[(calc_df['複雜度評分'] < avg_complexity) & (calc_df['最終報價(萬)'] > avg_price)]
+                star_cases = calc_df[star_mask]
                 if not star_cases.empty:
                     st.success(f"{t['star_cases']}\n\n" + "\n".join([f"- {name}" for name in star_cases['案件名稱']]))
         else:
-            st.info(t["matrix_info"])
\ No newline at end of file
+            st.info(t["matrix_info"])
+
+rec.finish()
@@ -1,6 +1,11 @@
 import streamlit as st
 import pandas as pd
-import os
+import storage
+import ingest
+import roi
+import simulation
+import perf
+from schema import CASE_ID
 
 # --- 1. 語言配置字典 ---
 PAGE_LANG = {
@@ -29,7 +34,23 @@ PAGE_LANG = {
         "pm_ok_msg": "✅ **PM 結論**：管理編制目前尚屬充足。",
         "staff_hire_msg": "🚨 **Staff 結論**：缺口 {} 人，執行端壓力過大。",
         "staff_ok_msg": "✅ **Staff 結論**：執行端人力配置合理。",
-        "unit_score": "分"
+        "unit_score": "分",
+        "sim_header": "🎲 What-if 情境模擬 (蒙地卡羅)",
+        "sim_caption": "依案件量成長、複雜度漂移與個人產能的不確定性抽樣 {:,} 組情境，估算各百分位數下的需求人數。",
+        "sim_growth": "案件量成長率 (平均 %)",
+        "sim_growth_sd": "成長率不確定性 (標準差 %)",
+        "sim_drift": "複雜度漂移 (平均 %)",
+        "sim_drift_sd": "漂移不確定性 (標準差 %)",
+        "sim_capacity_sd": "個人產能變異 (標準差 %)",
+        "sim_scenarios": "模擬情境數",
+        "sim_target": "規劃信心水準",
+        "sim_metric": "{} 需求人數 ({})",
+        "sim_gap": "缺口 {:+.1f} 人",
+        "sim_total": "📋 各角色需求人數百分位數",
+        "sim_by_type": "📋 各案件類型需求人數百分位數",
+        "col_current": "現有人數",
+        "col_role": "角色",
+        "col_case_type": "案件類型"
     },
     "English": {
         "page_title": "Budget & Recruitment Planning",
@@ -56,7 +77,23 @@ PAGE_LANG = {
         "pm_ok_msg": "✅ **PM Conclusion**: Management capacity is sufficient.",
         "staff_hire_msg": "🚨 **Staff Conclusion**: Shortage of {} person(s). High pressure.",
         "staff_ok_msg": "✅ **Staff Conclusion**: Execution capacity is balanced.",
-        "unit_score": "pts"
+        "unit_score": "pts",
+        "sim_header": "🎲 What-if Simulation (Monte Carlo)",
+        "sim_caption": "Samples {:,} scenarios of case-volume growth, complexity drift and per-person capacity to estimate headcount needs at each percentile.",
+        "sim_growth": "Case volume growth (mean %)",
+        "sim_growth_sd": "Growth uncertainty (sd %)",
+        "sim_drift": "Complexity drift (mean %)",
+        "sim_drift_sd": "Drift uncertainty (sd %)",
+        "sim_capacity_sd": "Capacity variation (sd %)",
+        "sim_scenarios": "Scenarios",
+        "sim_target": "Planning confidence",
+        "sim_metric": "{} headcount needed ({})",
+        "sim_gap": "gap {:+.1f}",
+        "sim_total": "📋 Headcount Percentiles by Role",
+        "sim_by_type": "📋 Headcount Percentiles by Case Type",
+        "col_current": "Current",
+        "col_role": "Role",
+        "col_case_type": "Case Type"
     }
 }
 
@@ -65,31 +102,39 @@ curr_lang = st.session_state.get("lang", "繁體中文")
 t = PAGE_LANG[curr_lang]
 
 # 1. 配置與資料載入
-current_dir = os.path.dirname(os.path.abspath(__file__))
-output_folder = os.path.join(os.path.dirname(current_dir), "outputs")
-MASTER_FILE = os.path.join(output_folder, "master_data.xlsx")
-ROI_FILE = os.path.join(output_folder, "roi_data.xlsx")
-STAFF_LIST_FILE = os.path.join(output_folder, "staff_list.xlsx")
-
 st.set_page_config(page_title=t["page_title"], layout="wide")
+rec = perf.Recorder("budget_planning")
 
 st.title(t["main_title"])
 
 # 檢查必要檔案
-if not all(os.path.exists(f) for f in [MASTER_FILE, ROI_FILE]):
+if not all(storage.exists(name) for name in ["master_data", "roi_data"]):
     st.warning(t["warn_no_data"])
 else:
     # 2. 整合數據邏輯
-    m_df = pd.read_excel(MASTER_FILE)
-    r_df = pd.read_excel(ROI_FILE)
-    s_list_df = pd.read_excel(STAFF_LIST_FILE) if os.path.exists(STAFF_LIST_FILE) else pd.DataFrame()
+    rec.begin("load")
+    snap = storage.snapshot()
+    m_df = storage.read_table("master_data", snap)
+    if not m_df.empty and (CASE_ID not in m_df.columns or m_df[CASE_ID].isna().any()):
+        # 舊版主檔尚未配發案件編號 (尚未開啟主頁)：先補齊並寫回，再以新版本重新讀取
+        ingest.ensure_case_ids(m_df)
+        snap = storage.snapshot()
+        m_df = storage.read_table("master_data", snap)
+    r_df = storage.read_table("roi_data", snap)
+    s_list_df = storage.read_table("staff_list", snap)
+    if CASE_ID not in m_df.columns or CASE_ID not in r_df.columns:
+        # 主檔尚未配發案件編號 (首次匯入仍在背景執行)
+        st.warning(t["warn_no_data"])
+        st.stop()
     
-    budget_df = pd.merge(m_df[['案件名稱', '複雜度評分']], 
-                         r_df[['案件名稱', '最終報價(萬)', '預計工時']], 
-                         on='案件名稱', how='left').fillna(0)
-    budget_df['單位產值'] = (budget_df['最終報價(萬)'] / budget_df['複雜度評分']).replace([float('inf')], 0).fillna(0)
+    rec.begin("compute:budget", rows=len(m_df))
+    # 以案件編號為索引 join，ROI 同一編號只取最後一筆
+    roi_by_id = r_df.drop_duplicates(subset=CASE_ID, keep='last').set_index(CASE_ID)[['最終報價(萬)', '預計工時']]
+    budget_df = m_df[[CASE_ID, '案件名稱', '複雜度評分']].join(roi_by_id, on=CASE_ID).fillna(0)
+    budget_df['單位產值'] = roi.unit_value(budget_df['最終報價(萬)'], budget_df['複雜度評分'])
 
     # --- A. 版面優化：評估基準區塊 ---
+    rec.begin("render:budget")
     with st.container(border=True):
         st.markdown(t["logic_header"])
         logic_col1, logic_col2 = st.columns(2)
@@ -131,8 +176,8 @@ else:
         curr_pm_cnt, curr_staff_cnt = 5, 2
 
     total_load = budget_df['複雜度評分'].sum()
-    req_pm = round(total_load / 40.0, 1)
-    req_staff = round(total_load / 50.0, 1)
+    required = simulation.required_headcount(total_load)
+    req_pm, req_staff = required["PM"], required["Staff"]
 
     result_pm_col, result_staff_col = st.columns(2)
 
@@ -156,4 +201,43 @@ else:
         if req_staff > curr_staff_cnt:
             st.error(t["staff_hire_msg"].format(round(req_staff - curr_staff_cnt, 1)))
         else:
-            st.success(t["staff_ok_msg"])
\ No newline at end of file
+            st.success(t["staff_ok_msg"])
+    st.divider()
+
+    # --- C. What-if 情境模擬 ---
+    st.subheader(t["sim_header"])
+    sim_c1, sim_c2, sim_c3 = st.columns(3)
+    with sim_c1:
+        growth_mean = st.slider(t["sim_growth"], -30, 100, 10, step=5)
+        growth_sd = st.slider(t["sim_growth_sd"], 0, 50, 10)
+    with sim_c2:
+        drift_mean = st.slider(t["sim_drift"], -20, 50, 0)
+        drift_sd = st.slider(t["sim_drift_sd"], 0, 30, 5)
+    with sim_c3:
+        capacity_sd = st.slider(t["sim_capacity_sd"], 0, 30, 10)
+        n_scenarios = st.select_slider(t["sim_scenarios"], [10_000, 50_000, 100_000], value=simulation.DEFAULT_SCENARIOS)
+    target_pct = st.radio(t["sim_target"], [f"P{p}" for p in simulation.PERCENTILES], index=1, horizontal=True)
+    st.caption(t["sim_caption"].format(n_scenarios))
+
+    # 以案件類型彙總目前負荷，模擬只在 (情境數 × 類型數) 的陣列上運算
+    with rec.stage("compute:simulation", rows=n_scenarios):
+        loads_by_type = simulation.loads_by_type(m_df)
+        sim = simulation.simulate(loads_by_type, (growth_mean / 100, growth_sd / 100), (drift_mean / 100, drift_sd / 100),
+                                  capacity_sd / 100, n_scenarios)
+        totals = simulation.percentiles(sim["samples"])
+    rec.begin("render:simulation")
+    totals.insert(0, t["col_current"], [curr_pm_cnt, curr_staff_cnt])
+
+    sim_pm_col, sim_staff_col = st.columns(2)
+    for col, role in zip((sim_pm_col, sim_staff_col), simulation.ROLES):
+        need = totals.loc[role, target_pct]
+        col.metric(t["sim_metric"].format(role, target_pct), f"{need:.1f}",
+                   delta=t["sim_gap"].format(need - totals.loc[role, t["col_current"]]), delta_color="inverse")
+
+    st.write(t["sim_total"])
+    st.dataframe(totals.rename_axis(t["col_role"]).reset_index(), hide_index=True, use_container_width=True)
+    st.write(t["sim_by_type"])
+    st.dataframe(sim["by_type"].rename(columns={"案件類型": t["col_case_type"], "角色": t["col_role"]}),
+                 hide_index=True, use_container_width=True)
+
+rec.finish()
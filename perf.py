@@ -0,0 +1,213 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+import pandas as pd
+import streamlit as st
+import storage
+
+# --- 1. 效能量測配置 ---
+# 每次頁面執行的分段量測附加一列到 JSON lines 記錄檔，供離線分析；設 OMMS_PERF_LOG=0 關閉
+LOG_FILE = os.path.join(storage.OUTPUT_DIR, "perf_log.jsonl")
+LOG_ENABLED = os.environ.get("OMMS_PERF_LOG", "1") != "0"
+# 記錄檔超過此大小 (MB) 時改名為 perf_log.jsonl.1 (只保留一份舊檔)
+LOG_MAX_BYTES = int(os.environ.get("OMMS_PERF_LOG_MB", "5")) * 1024 * 1024
+
+# tracemalloc 會拖慢配置密集的運算：預設只在側邊欄開啟效能面板時追蹤記憶體峰值，
+# 設 OMMS_PERF_MEMORY=1 則一律追蹤
+TRACE_MEMORY = os.environ.get("OMMS_PERF_MEMORY", "0") == "1"
+PANEL_KEY = "perf_panel"
+# 同一 session 目前的量測；下一次執行開始時先結束上一次未 finish 的量測
+ACTIVE_KEY = "perf_recorder"
+
+PANEL_LANG = {
+    "繁體中文": {
+        "toggle": "⏱️ 顯示效能診斷",
+        "caption": "本次執行共 {seconds:.2f} 秒；記憶體峰值為該段新增配置的最高值 (近似值，含同時執行的背景工作)。",
+        "no_memory": "勾選後的下一次執行起才會追蹤記憶體峰值。",
+        "columns": {"stage": "階段", "seconds": "秒數", "peak_mb": "記憶體峰值 (MB)", "rows": "列數"},
+    },
+    "English": {
+        "toggle": "⏱️ Show performance diagnostics",
+        "caption": "This run took {seconds:.2f}s; memory peak is the highest new allocation within each stage (approximate, includes background jobs).",
+        "no_memory": "Memory peaks are traced from the next run after enabling.",
+        "columns": {"stage": "Stage", "seconds": "Seconds", "peak_mb": "Memory peak (MB)", "rows": "Rows"},
+    },
+}
+
+# tracemalloc 為整個程序共用：以參考計數啟停，多個 session 同時量測時不互相關閉
+_TRACE_LOCK = threading.Lock()
+_TRACE_USERS = 0
+_LOG_LOCK = threading.Lock()
+
+
+def _acquire_tracing():
+    global _TRACE_USERS
+    with _TRACE_LOCK:
+        if _TRACE_USERS == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _TRACE_USERS += 1
+
+
+def _release_tracing():
+    global _TRACE_USERS
+    with _TRACE_LOCK:
+        _TRACE_USERS -= 1
+        if _TRACE_USERS == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def row_count(value):
+    """量測結果的列數：DataFrame / Series 取長度，tuple / list 取第一個 DataFrame，dict 取各 DataFrame 列數總和。"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return next((len(v) for v in value if isinstance(v, pd.DataFrame)), None)
+    if isinstance(value, dict):
+        frames = [v for v in value.values() if isinstance(v, pd.DataFrame)]
+        return sum(len(v) for v in frames) if frames else None
+    return None
+
+
+# --- 2. 分段量測 ---
+class Recorder:
+    """
+    單次頁面執行的分段量測 (秒數、記憶體峰值、列數)：
+    1. begin(name)：從此處量到下一個分段開始 (適合 Streamlit 腳本中長段的頂層程式碼)。
+    2. stage(name)：context manager，只量 with 區塊內的程式碼。
+    3. timed(name)：decorator，量測函式呼叫並以回傳值記錄列數。
+    各段依序量測、不重疊；開始新的一段時會先結束目前的分段。
+    分段名稱慣例為 load / compute / render，可加冒號註明細項 (例如 render:scatter)。
+    例外、st.stop() 或 st.rerun() 中斷而沒有執行到 finish 時，同一 session 的下一次執行開始
+    (或量測物件被回收) 時釋放 tracemalloc，不會讓整個程序持續追蹤記憶體。
+    """
+
+    def __init__(self, page, memory=None):
+        self.page = page
+        self.memory = (TRACE_MEMORY or bool(st.session_state.get(PANEL_KEY))) if memory is None else memory
+        self.stages = []
+        self.started = time.perf_counter()
+        self._open = None
+        self._finished = False
+        self._release = None
+        if self.memory:
+            _acquire_tracing()
+            self._release = weakref.finalize(self, _release_tracing)
+        previous = st.session_state.get(ACTIVE_KEY)
+        if previous is not None:
+            previous.close()
+        st.session_state[ACTIVE_KEY] = self
+
+    def close(self):
+        """結束目前的分段並釋放 tracemalloc；可重複呼叫。"""
+        self._stop()
+        if self._release is not None:
+            self._release()
+
+    def _start(self, name, rows):
+        self._stop()
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        else:
+            base = None
+        self._open = {"stage": name, "rows": rows, "_start": time.perf_counter(), "_base": base}
+        return self._open
+
+    def _stop(self):
+        record, self._open = self._open, None
+        if record is None:
+            return
+        record["seconds"] = round(time.perf_counter() - record.pop("_start"), 4)
+        base = record.pop("_base")
+        if base is not None and tracemalloc.is_tracing():
+            record["peak_mb"] = round(max(tracemalloc.get_traced_memory()[1] - base, 0) / 2 ** 20, 2)
+        self.stages.append(record)
+
+    def begin(self, name, rows=None):
+        self._start(name, rows)
+
+    def rows(self, n):
+        """補記目前 (或剛結束) 分段的列數。"""
+        target = self._open or (self.stages[-1] if self.stages else None)
+        if target is not None:
+            target["rows"] = int(n)
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        record = self._start(name, rows)
+        try:
+            yield record
+        finally:
+            if self._open is record:
+                self._stop()
+
+    def timed(self, name, rows=row_count):
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name) as record:
+                    result = fn(*args, **kwargs)
+                    record["rows"] = rows(result) if callable(rows) else rows
+                return result
+            return wrapper
+        return decorate
+
+    def frame(self):
+        return pd.DataFrame(self.stages, columns=["stage", "seconds", "peak_mb", "rows"])
+
+    def finish(self, container=None):
+        """
+        結束量測 (頁面腳本最後呼叫)：
+        1. 附加一列紀錄到 LOG_FILE。
+        2. 在 container (預設為側邊欄) 顯示效能診斷面板的開關與本次各段量測。
+        """
+        if self._finished:
+            return
+        self._finished = True
+        total = round(time.perf_counter() - self.started, 4)
+        self.close()
+        if LOG_ENABLED:
+            _append_log({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "page": self.page,
+                         "seconds": total, "memory": self.memory, "stages": self.stages})
+        panel(self, total, container)
+
+
+# --- 3. 記錄檔與側邊欄面板 ---
+def _append_log(record):
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _LOG_LOCK:
+        try:
+            os.makedirs(storage.OUTPUT_DIR, exist_ok=True)
+            if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) > LOG_MAX_BYTES:
+                os.replace(LOG_FILE, LOG_FILE + ".1")
+            with open(LOG_FILE, "a", encoding="utf-8") as fh:
+                fh.write(line)
+        except OSError:
+            # 記錄檔寫入失敗 (例如唯讀目錄) 不影響頁面
+            pass
+
+
+def read_log(path=LOG_FILE):
+    """讀回記錄檔，每個分段一列 (time, page, stage, seconds, peak_mb, rows)，供離線分析。"""
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=["time", "page", "stage", "seconds", "peak_mb", "rows"])
+    with open(path, encoding="utf-8") as fh:
+        runs = [json.loads(line) for line in fh if line.strip()]
+    return pd.json_normalize(runs, record_path="stages", meta=["time", "page"])
+
+
+def panel(recorder, total, container=None):
+    text = PANEL_LANG.get(st.session_state.get("lang", "繁體中文"), PANEL_LANG["繁體中文"])
+    with container if container is not None else st.sidebar:
+        st.session_state[PANEL_KEY] = st.checkbox(text["toggle"], value=bool(st.session_state.get(PANEL_KEY)))
+        if not st.session_state[PANEL_KEY]:
+            return
+        st.dataframe(recorder.frame().rename(columns=text["columns"]), hide_index=True, use_container_width=True)
+        st.caption(text["caption"].format(seconds=total))
+        if not recorder.memory:
+            st.caption(text["no_memory"])
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+# --- 1. 投報率分類代碼 ---
+# 商務決策矩陣的象限：以平均難度 (全案) 與平均報價 (已報價案件) 為界
+RAISE_PRICE = 0   # 難度高於平均、報價低於平均 → 應提高報價
+STAR = 1          # 難度低於平均、報價高於平均 → 優質核心案件
+OTHER = 2
+
+
+def unit_value(prices, scores, decimals=None):
+    """每單位複雜度的產值 (報價 ÷ 複雜度評分)，評分 <= 0 或缺值時為 0；投報率與預算頁的單位產值共用。"""
+    prices = np.asarray(prices, dtype=float)
+    scores = np.asarray(scores, dtype=float)
+    valid = scores > 0
+    ratio = np.divide(prices, scores, out=np.zeros(len(scores)), where=valid)
+    ratio = np.nan_to_num(ratio, nan=0.0)
+    return ratio.round(decimals) if decimals is not None else ratio
+
+
+def _mean(values):
+    return float(values.mean()) if len(values) else 0.0
+
+
+# --- 2. 投報率分析 ---
+def analyze(df, price_col='最終報價(萬)', score_col='複雜度評分'):
+    """
+    一次以陣列運算算出投報率頁需要的全部欄位，回傳 (加欄位後的 DataFrame, 平均值)：
+    1. 投報率 = 報價 ÷ 複雜度 (取兩位小數)；平均投報率 / 平均報價只計已報價 (> 0) 的案件。
+    2. 高於平均：投報率 >= 平均投報率且 > 0。
+    3. 象限：RAISE_PRICE (須已報價) / STAR / OTHER。
+    4. 建議報價：應提高報價的案件以平均投報率 × 複雜度回推，價差 = 建議報價 - 目前報價 (不為負)。
+    """
+    prices = pd.to_numeric(df[price_col], errors='coerce').to_numpy(dtype=float)
+    scores = pd.to_numeric(df[score_col], errors='coerce').to_numpy(dtype=float)
+    ratio = unit_value(prices, scores, decimals=2)
+
+    active = prices > 0
+    avg_roi = _mean(ratio[active])
+    avg_price = _mean(prices[active])
+    finite = scores[~np.isnan(scores)]
+    avg_complexity = _mean(finite) if len(finite) else float('nan')
+
+    quadrant = np.full(len(df), OTHER, dtype=np.int8)
+    quadrant[(scores < avg_complexity) & (prices > avg_price)] = STAR
+    raise_price = (scores > avg_complexity) & (prices < avg_price) & active
+    quadrant[raise_price] = RAISE_PRICE
+
+    suggested = np.where(raise_price, np.round(avg_roi * scores, 2), np.nan)
+    result = df.copy()
+    result['投報率'] = ratio
+    result['高於平均'] = (ratio >= avg_roi) & (ratio > 0)
+    result['象限'] = quadrant
+    result['建議報價(萬)'] = suggested
+    result['價差(萬)'] = np.round(np.clip(suggested - prices, 0, None), 2)
+    stats = {"avg_roi": avg_roi, "avg_price": avg_price, "avg_complexity": avg_complexity,
+             "active": int(active.sum())}
+    return result, stats
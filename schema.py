@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+# --- 1. 案件主檔欄位型別定義 ---
+YES, NO = "是", "否"
+
+# 是/否 欄位 → nullable boolean (True = 是)
+YES_NO_COLS = ['個體是否共用系統', '系統是否客製化', '是否被Q', '是否為PCAOB', '前期負責PM是否更換',
+               'IPO是否首查', 'IPO是否為複雜資安', 'ITAC是否首查', 'GC是否首查', 'Caats是否首查']
+
+# 列舉欄位 → pandas Categorical
+CATEGORY_COLS = ['案件類型', 'IPO送件類型']
+
+# 計數欄位 → 小整數 (nullable Int)
+COUNT_COLS = ['序號', '個體數', '系統數', '(系統)已考量共用情況之實際系統數', 'ITAC題數']
+
+# 穩定案件編號：匯入時配發，主檔 / ROI / 分工 / 指派 共用的連結鍵 (案件名稱可能改名或重複)
+CASE_ID = "案件編號"
+
+# Excel 回存與 fillna 常見的「空值」寫法；是/否 欄位的 0 為舊版 fillna(0) 留下的空值
+_BLANKS = {"", "nan", "None"}
+_YES_NO_BLANKS = _BLANKS | {"0", "0.0"}
+
+
+# --- 2. 正規化 ---
+# 欄位中有無法辨識的值 (例如 是/否 欄填 "Y"、"N/A"，計數欄填 "約10") 時整欄保留原文字，
+# 不以空值取代使用者輸入；評分時仍依「非是即不加分」、「非數值視為 0」處理，編輯器另以 unrecognized_values 提示
+def _clean_text(series, blanks=_BLANKS):
+    text = series.astype(object).where(series.notna())
+    text = text.map(lambda v: v.strip() if isinstance(v, str) else v)
+    return text.where(~text.astype(str).isin(blanks))
+
+
+def _as_text(text):
+    return text.map(lambda v: v if pd.isna(v) else str(v)).astype("str")
+
+
+def _to_yes_no(series):
+    """是/否 文字轉為 nullable boolean；有無法辨識的值時整欄保留為文字。"""
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series.astype("boolean")
+    text = _clean_text(series, _YES_NO_BLANKS)
+    mapped = text.map({YES: True, NO: False})
+    if mapped.notna().sum() < text.notna().sum():
+        return _as_text(text)
+    return mapped.astype("boolean")
+
+
+def _to_category(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    return _clean_text(series).astype("category")
+
+
+def _to_small_int(series):
+    """計數欄位轉為最小可容納的 nullable 整數；有非數值的內容時整欄保留為文字。"""
+    values = pd.to_numeric(series, errors='coerce')
+    if values.isna().sum() > series.isna().sum():
+        text = _clean_text(series)
+        if (values.isna() & text.notna()).any():
+            return _as_text(text)
+    filled = values.dropna()
+    # 含小數 (例如 ITAC 題數 1.5) 則維持浮點數
+    if not np.array_equal(filled, np.round(filled)):
+        return values
+    for dtype in ("Int8", "Int16", "Int32"):
+        info = np.iinfo(dtype.lower())
+        if filled.empty or (filled.min() >= info.min and filled.max() <= info.max):
+            return values.astype(dtype)
+    return values.astype("Int64")
+
+
+def normalize_case_frame(df):
+    """
+    案件主檔型別正規化 (載入 / 寫入時套用)：
+    1. 是/否 欄位轉為 nullable boolean。
+    2. 案件類型、IPO送件類型 轉為 Categorical。
+    3. 個體數、系統數等計數欄位轉為最小可容納的 nullable 整數型別。
+    1、3 遇到無法辨識的值時該欄保留原文字 (見 unrecognized_values)，不會在寫入時被清空。
+    """
+    if df.empty:
+        return df
+    out = df.copy()
+    for col in out.columns.intersection(YES_NO_COLS):
+        out[col] = _to_yes_no(out[col])
+    for col in out.columns.intersection(CATEGORY_COLS):
+        out[col] = _to_category(out[col])
+    for col in out.columns.intersection(COUNT_COLS):
+        out[col] = _to_small_int(out[col])
+    return normalize_case_id(out)
+
+
+def unrecognized_values(df):
+    """是/否 與計數欄位中無法辨識而保留為文字的值 {欄位: [值]}，供編輯器提示。"""
+    found = {}
+    for col in df.columns.intersection(YES_NO_COLS + COUNT_COLS):
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_numeric_dtype(series.dtype):
+            continue
+        if col in YES_NO_COLS:
+            text = _clean_text(series, _YES_NO_BLANKS)
+            bad = text[text.notna() & ~text.isin([YES, NO])]
+        else:
+            text = _clean_text(series)
+            bad = text[text.notna() & pd.to_numeric(text, errors='coerce').isna()]
+        if not bad.empty:
+            found[col] = sorted(set(bad.astype(str)))
+    return found
+
+
+def normalize_case_id(df):
+    """案件編號統一為 nullable Int32，各資料表 join 時鍵的型別一致。"""
+    if df.empty or CASE_ID not in df.columns:
+        return df
+    out = df.copy()
+    out[CASE_ID] = pd.to_numeric(out[CASE_ID], errors='coerce').astype("Int32")
+    return out
+
+
+def link_case_ids(df, master):
+    """
+    以案件名稱對應主檔，為尚無案件編號的舊版資料表補上編號：
+    主檔中同名的案件取第一筆，主檔已不存在的案件編號為空值。
+    """
+    ids = master.drop_duplicates(subset='案件名稱').set_index('案件名稱')[CASE_ID]
+    out = df.copy()
+    out.insert(0, CASE_ID, out['案件名稱'].map(ids))
+    return normalize_case_id(out)
+
+
+def to_display(df):
+    """還原為 Excel / 編輯器使用的文字格式：boolean → 是/否，Categorical → 一般文字欄。"""
+    out = df.copy()
+    for col in out.columns:
+        dtype = out[col].dtype
+        if isinstance(dtype, pd.BooleanDtype) or dtype == bool:
+            out[col] = out[col].astype(object).map({True: YES, False: NO}).where(out[col].notna())
+        elif isinstance(dtype, pd.CategoricalDtype):
+            out[col] = out[col].astype(object)
+    return out
+
+
+# --- 3. 記憶體量測 ---
+def memory_report(before, after):
+    """逐欄比較正規化前後的記憶體用量 (KB)。"""
+    rows = []
+    for col in after.columns:
+        if col not in before.columns:
+            continue
+        b = before[col].memory_usage(index=False, deep=True) / 1024
+        a = after[col].memory_usage(index=False, deep=True) / 1024
+        rows.append({"欄位": col, "原始型別": str(before[col].dtype), "正規化型別": str(after[col].dtype),
+                     "原始 KB": round(b, 1), "正規化 KB": round(a, 1)})
+    report = pd.DataFrame(rows)
+    if not report.empty:
+        report = report.sort_values("原始 KB", ascending=False, ignore_index=True)
+    return report
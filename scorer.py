@@ -1,64 +1,334 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import pandas as pd
 import numpy as np
+import jobs
+import schema
 
-def calculate_complexity(df):
+# 評分規則表 (權重與條件皆於 JSON 維護，新增規則不需修改程式)
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_rules.json")
+
+# 每次矩陣運算處理的列數，避免百萬列時特徵矩陣佔用過多記憶體
+BLOCK_ROWS = 1 << 18
+
+# 低於此列數時 score_batch 直接單程序評分 (行程啟動成本高於收益)
+BATCH_MIN_ROWS = 200_000
+
+
+def load_rules(path=RULES_FILE):
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)["rules"]
+
+
+class ScoringPlan:
+    """
+    由規則表編譯出的向量化評分計畫：
+    1. 每個來源欄位只正規化一次：數值欄 to_numeric 補 0；文字欄先 factorize，
+       strip / 等值 / 包含 判斷只在「唯一值」上執行，再以代碼查表展開成 NumPy 遮罩。
+    2. 每條規則 (contains 的每個選項) 對應特徵矩陣的一欄，分數 = 特徵矩陣 @ 權重向量。
+    3. 缺少的欄位視為空值 (不加分)。
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.features = []   # (kind, column, 參數)
+        weights = []
+        for rule in rules:
+            kind, col = rule["type"], rule["column"]
+            if kind == "numeric":
+                self.features.append(("numeric", col, rule.get("fallback")))
+                weights.append(rule["weight"])
+            elif kind == "equals":
+                self.features.append(("equals", col, str(rule["value"])))
+                weights.append(rule["weight"])
+            elif kind == "contains":
+                values = tuple(str(c["value"]) for c in rule["choices"])
+                # 第一個符合的選項才給分 (同 np.select)，每個選項各佔一欄互斥特徵
+                for idx, choice in enumerate(rule["choices"]):
+                    self.features.append(("contains", col, (values, idx)))
+                    weights.append(choice["weight"])
+            else:
+                raise ValueError(f"未知的評分規則類型：{kind}")
+        self.weights = np.asarray(weights, dtype=float)
+
+    def input_columns(self):
+        """回傳 (數值欄位, 文字欄位) 兩組來源欄位名稱。"""
+        numeric, text = [], []
+        for kind, col, arg in self.features:
+            if kind == "numeric":
+                numeric += [c for c in (col, arg) if c and c not in numeric]
+            elif col not in text:
+                text.append(col)
+        return numeric, text
+
+    # --- 內部工具：數值欄位，空值與非數值補 0 ---
+    @staticmethod
+    def _numeric(df, col):
+        if col not in df.columns:
+            return np.zeros(len(df))
+        return pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+    # --- 內部工具：文字欄位 factorize，回傳 (代碼, 唯一值字串) ---
+    @staticmethod
+    def _factorize(df, col):
+        if col not in df.columns:
+            return np.full(len(df), -1, dtype=np.intp), []
+        series = df[col]
+        # schema 正規化後的欄位可直接取用既有代碼，不必再掃描字串
+        if isinstance(series.dtype, pd.BooleanDtype) or series.dtype == bool:
+            codes = np.where(series.isna(), -1, series.fillna(False).astype(int))
+            return codes, [schema.NO, schema.YES]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series.cat.codes.to_numpy(), [str(c) for c in series.cat.categories]
+        codes, uniques = pd.factorize(series)
+        return codes, [str(u) for u in uniques]
+
+    @staticmethod
+    def _lookup(codes, table):
+        # 空值代碼為 -1，對應查表最後一格 (False)
+        return np.append(table, False)[codes]
+
+    def feature_matrix(self, df):
+        n = len(df)
+        # Fortran order：逐欄寫入特徵時為連續記憶體
+        matrix = np.zeros((n, len(self.features)), order='F')
+        numeric_cache, text_cache = {}, {}
+
+        def numeric(col):
+            if col not in numeric_cache:
+                numeric_cache[col] = self._numeric(df, col)
+            return numeric_cache[col]
+
+        def text(col):
+            if col not in text_cache:
+                text_cache[col] = self._factorize(df, col)
+            return text_cache[col]
+
+        for j, (kind, col, arg) in enumerate(self.features):
+            if kind == "numeric":
+                values = numeric(col)
+                if arg:
+                    # 優先採用主欄位，若為 0 則採計 fallback 欄位
+                    values = np.where(values > 0, values, numeric(arg))
+                matrix[:, j] = values
+            elif kind == "equals":
+                codes, uniques = text(col)
+                table = np.array([u.strip() == arg for u in uniques], dtype=bool)
+                matrix[:, j] = self._lookup(codes, table)
+            else:
+                values, idx = arg
+                codes, uniques = text(col)
+                first = [next((k for k, v in enumerate(values) if v in u), -1) for u in uniques]
+                table = np.array([f == idx for f in first], dtype=bool)
+                matrix[:, j] = self._lookup(codes, table)
+        return matrix
+
+    def score(self, df):
+        scores = np.empty(len(df))
+        for start in range(0, len(df), BLOCK_ROWS):
+            block = df.iloc[start:start + BLOCK_ROWS]
+            scores[start:start + len(block)] = self.feature_matrix(block) @ self.weights
+        return scores
+
+
+def compile_rules(rules=None):
+    return ScoringPlan(load_rules() if rules is None else rules)
+
+
+_DEFAULT_PLAN = None
+
+
+def default_plan():
+    global _DEFAULT_PLAN
+    if _DEFAULT_PLAN is None:
+        _DEFAULT_PLAN = compile_rules()
+    return _DEFAULT_PLAN
+
+
+def calculate_complexity(df, sort=True, plan=None):
     """
     優化版評分邏輯：
-    1. 使用向量化運算 (Vectorization) 確保效能。
+    1. 依 scoring_rules.json 編譯的 ScoringPlan 一次算出所有規則分數。
     2. 自動將空值 (NaN) 視為 0 或 '否'。
     3. 對齊 Excel 的正確欄位名稱。
+    4. sort=False 時保留原列順序 (供分批評分後再合併)。
     """
     df_result = df.copy()
+    df_result['複雜度評分'] = (plan or default_plan()).score(df_result)
 
-    # --- 內部工具：確保數值欄位空值補 0 ---
-    def get_num(col_name):
-        return pd.to_numeric(df_result.get(col_name), errors='coerce').fillna(0)
-
-    # --- 內部工具：判斷「是/否」，空值與非「是」皆不加分 ---
-    def get_bool_score(col_name, points):
-        # 轉為字串並去除前後空格
-        condition = df_result.get(col_name).astype(str).str.strip() == '是'
-        return np.where(condition, points, 0)
-
-    # 1. 規模與系統架構
-    # 邏輯：優先採用「實際系統數」，若為 0 則採計「系統數」
-    actual_sys = get_num('(系統)已考量共用情況之實際系統數')
-    raw_sys = get_num('系統數')
-    final_sys = np.where(actual_sys > 0, actual_sys, raw_sys)
-
-    score = (get_num('個體數') * 2) + (final_sys * 4)
-
-    # 2. 基礎特性與風險
-    # 判斷是否「不共用」系統 (+3)
-    share_cond = df_result.get('個體是否共用系統').astype(str).str.strip() == '否'
-    score += np.where(share_cond, 3, 0)
-    
-    score += get_bool_score('系統是否客製化', 3)
-    score += get_bool_score('是否被Q', 8)
-    score += get_bool_score('是否為PCAOB', 10)
-    score += get_bool_score('前期負責PM是否更換',5)
-
-    # 3. IPO 專項加權
-    ipo_col = df_result.get('IPO送件類型').astype(str)
-    ipo_conditions = [
-        ipo_col.str.contains('上市'),
-        ipo_col.str.contains('上櫃'),
-        ipo_col.str.contains('興櫃')
-    ]
-    ipo_choices = [5, 4, 2]
-    score += np.select(ipo_conditions, ipo_choices, default=0)
-
-    score += get_bool_score('IPO是否為複雜資安', 7)
-    score += get_bool_score('IPO是否首查', 5)
-
-    # 4. ITAC 工作量與各項首查
-    score += (get_num('ITAC題數') * 1.5)
-    score += get_bool_score('ITAC是否首查', 8)
-    score += get_bool_score('GC是否首查', 5)
-    score += get_bool_score('Caats是否首查', 6)
-
-    # 寫入計算結果
-    df_result['複雜度評分'] = score
-    
     # 依分數高低排序並回傳
-    return df_result.sort_values(by='複雜度評分', ascending=False)
\ No newline at end of file
+    if not sort:
+        return df_result
+    return df_result.sort_values(by='複雜度評分', ascending=False)
+
+
+# --- 增量評分 (主頁編輯後只重算變動的列) ---
+def clean_for_scoring(df):
+    """評分前補空值：數值欄位補 0、文字欄位補空字串。"""
+    clean_data = df.copy()
+    num_cols = clean_data.select_dtypes(include=['number']).columns
+    clean_data[num_cols] = clean_data[num_cols].fillna(0)
+    obj_cols = clean_data.select_dtypes(include=['object', 'string']).columns
+    clean_data[obj_cols] = clean_data[obj_cols].fillna("")
+    return clean_data
+
+
+def rescore_edits(prev_df, edited, delta, plan=None):
+    """
+    依 data_editor 的編輯差異 (edited_rows / added_rows / deleted_rows) 增量評分：
+    1. 只清洗並重算被修改與新增的列，其餘沿用上次的分數。
+    2. 未變動的列已依分數排序，新分數以二分搜尋插入既有排名，不做全表排序。
+    無法增量時 (尚未評分、欄位不一致、排名不連續) 回傳 None，改走完整評分。
+    """
+    base_cols = [c for c in prev_df.columns if c not in ('序號', '複雜度評分')]
+    if '複雜度評分' not in prev_df.columns or list(edited.columns) != base_cols:
+        return None
+
+    deleted = set(delta.get("deleted_rows", []))
+    keep = np.array([i for i in range(len(prev_df)) if i not in deleted], dtype=int)
+    new_pos = {old: new for new, old in enumerate(keep)}
+    touched = {new_pos[int(i)] for i in delta.get("edited_rows", {}) if int(i) in new_pos}
+    touched.update(range(len(keep), len(edited)))
+
+    # 先前「僅儲存」而尚未評分的列 (分數為空值) 一併重算
+    prev_scores = prev_df['複雜度評分'].to_numpy(dtype=float)[keep]
+    touched.update(np.flatnonzero(np.isnan(prev_scores)).tolist())
+    touched = np.array(sorted(touched), dtype=int)
+
+    result = edited.reset_index(drop=True)
+    scores = np.zeros(len(result))
+    scores[:len(keep)] = prev_scores
+    untouched = np.setdiff1d(np.arange(len(result)), touched)
+    if np.any(np.diff(scores[untouched]) > 0):
+        return None
+
+    if len(touched):
+        rows = clean_for_scoring(result.iloc[touched])
+        scored = calculate_complexity(rows, sort=False, plan=plan)
+        result.iloc[touched] = rows
+        scores[touched] = scored['複雜度評分'].to_numpy()
+    result['複雜度評分'] = scores
+
+    # 合併排名：touched 依分數遞減排序後插入 untouched 的遞減序列
+    touched = touched[np.argsort(-scores[touched], kind='stable')]
+    positions = np.searchsorted(-scores[untouched], -scores[touched], side='right')
+    order = np.insert(untouched, positions, touched)
+    return result.iloc[order]
+
+
+# --- 多程序批次評分 ---
+def _share_inputs(df, plan):
+    """
+    將所有輸入放進 shared memory (欄 × 列 的 float64 矩陣)：
+    數值欄位為 to_numeric 後的值；boolean / Categorical 欄位直接取代碼，
+    原始文字欄位先 factorize 成代碼 (空值 = -1)，唯一值表很小，隨任務傳遞。
+    大量字串不必 pickle 到子程序，這是多程序評分的主要成本。
+    """
+    numeric_cols, text_cols = plan.input_columns()
+    shared, categories = [], {}
+    for col in numeric_cols:
+        if col in df.columns:
+            shared.append((col, pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)))
+    for col in text_cols:
+        if col not in df.columns:
+            continue
+        series = df[col]
+        if isinstance(series.dtype, pd.BooleanDtype) or series.dtype == bool:
+            codes = np.where(series.isna(), -1, series.fillna(False).astype(int))
+            categories[col] = [schema.NO, schema.YES]
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            categories[col] = list(series.cat.categories)
+        else:
+            codes, uniques = pd.factorize(series)
+            categories[col] = list(uniques)
+        shared.append((col, codes.astype(float)))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(len(shared) * len(df) * 8, 1))
+    matrix = np.ndarray((len(shared), len(df)), dtype=float, buffer=shm.buf)
+    for i, (_, values) in enumerate(shared):
+        matrix[i] = values
+    return shm, [col for col, _ in shared], categories
+
+
+def _score_partition(task):
+    # 需為模組層級函式，才能交給子程序執行
+    shm_name, columns, n_rows, start, stop, categories, rules = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        matrix = np.ndarray((len(columns), n_rows), dtype=float, buffer=shm.buf)
+        data = {}
+        for i, col in enumerate(columns):
+            values = matrix[i, start:stop]
+            if col in categories:
+                data[col] = pd.Categorical.from_codes(values.astype(int), categories=categories[col])
+            else:
+                data[col] = values.copy()
+        scores = compile_rules(rules).score(pd.DataFrame(data))
+    finally:
+        shm.close()
+    order = np.argsort(-scores, kind='stable')
+    return scores, order + start
+
+
+def _merge_runs(runs):
+    """
+    k-way 合併：各分區已依 (-分數) 排序，兩兩以 searchsorted 向量化合併，共 log2(k) 回合。
+    分數相同時較早的分區在前，結果與穩定全域排序一致。
+    """
+    while len(runs) > 1:
+        merged = []
+        for a, b in zip(runs[0::2], runs[1::2]):
+            (a_keys, a_idx), (b_keys, b_idx) = a, b
+            pos_b = np.searchsorted(a_keys, b_keys, side='right') + np.arange(len(b_keys))
+            keys = np.empty(len(a_keys) + len(b_keys))
+            idx = np.empty(len(keys), dtype=a_idx.dtype)
+            mask = np.zeros(len(keys), dtype=bool)
+            mask[pos_b] = True
+            keys[pos_b], idx[pos_b] = b_keys, b_idx
+            keys[~mask], idx[~mask] = a_keys, a_idx
+            merged.append((keys, idx))
+        if len(runs) % 2:
+            merged.append(runs[-1])
+        runs = merged
+    return runs[0][1] if runs else np.array([], dtype=int)
+
+
+def score_batch(df, partitions=None, max_workers=None, plan=None):
+    """
+    百萬列等級的多程序評分 (跨事務所、跨年度合併批次)：
+    1. 數值與已正規化的輸入欄位放入 shared memory，各 worker 直接附掛讀取，不經 pickle 複製。
+    2. 依列切成 partitions 個分區，由 ProcessPoolExecutor 平行評分並各自排序。
+    3. 以 k-way 合併各分區的排序結果取代一次全域 sort_values。
+    回傳與 calculate_complexity 相同格式 (含 複雜度評分，依分數遞減) 的 DataFrame。
+    """
+    plan = plan or default_plan()
+    workers = max_workers or os.cpu_count() or 1
+    if len(df) < BATCH_MIN_ROWS or workers == 1:
+        return calculate_complexity(df, plan=plan)
+
+    partitions = partitions or workers
+    bounds = np.linspace(0, len(df), partitions + 1).astype(int)
+    shm, columns, categories = _share_inputs(df, plan)
+    try:
+        tasks = [(shm.name, columns, len(df), start, stop, categories, plan.rules)
+                 for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=jobs.process_context()) as pool:
+            results = list(pool.map(_score_partition, tasks))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    scores = np.concatenate([s for s, _ in results])
+    order = _merge_runs([(-scores[idx], idx) for _, idx in results])
+    df_result = df.copy()
+    df_result['複雜度評分'] = scores
+    return df_result.iloc[order]
+
+
+def score_chunks(chunks):
+    """逐批評分 (例如 ingest.iter_excel_chunks 的輸出)，每次只持有單一批次的中間運算結果。"""
+    for chunk in chunks:
+        yield calculate_complexity(chunk, sort=False)
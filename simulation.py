@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+# --- 1. 人力需求基準 ---
+# 每人可承擔的總加權複雜度 (與預算頁評估基準一致)
+CAPACITY = {"PM": 40.0, "Staff": 50.0}
+
+ROLES = ("PM", "Staff")
+PERCENTILES = (50, 80, 95)
+DEFAULT_SCENARIOS = 50_000
+
+
+def required_headcount(total_load):
+    """確定性估算：總負荷 ÷ 每人產能 (各角色)。"""
+    return {role: round(total_load / cap, 1) for role, cap in CAPACITY.items()}
+
+
+def loads_by_type(df, type_col='案件類型', score_col='複雜度評分'):
+    """
+    各案件類型目前的總複雜度 (模擬的輸入)：
+    案件類型為 Categorical，先轉回 object 再把空白歸入 "-"，避免 fillna 新增類別時出錯。
+    """
+    if type_col in df.columns:
+        types = df[type_col].astype(object).fillna("-")
+    else:
+        types = pd.Series("-", index=df.index)
+    return pd.to_numeric(df[score_col], errors='coerce').fillna(0).groupby(types).sum()
+
+
+# --- 2. 蒙地卡羅模擬 ---
+def simulate(loads_by_type, growth=(0.0, 0.1), drift=(0.0, 0.05), capacity_sd=0.1,
+             n=DEFAULT_SCENARIOS, seed=0):
+    """
+    以批次陣列運算模擬 n 組情境下的人力需求：
+    1. loads_by_type：各案件類型目前的總複雜度 (Series，index 為案件類型)。
+    2. growth：案件量成長率 (平均, 標準差)，各類型獨立抽樣 (n × 類型數矩陣)。
+    3. drift：複雜度漂移 (平均, 標準差)，同一情境所有類型共用。
+    4. capacity_sd：每人產能的相對標準差，各角色獨立抽樣，下限為基準的 10%。
+    回傳 dict：
+       samples：{角色: 長度 n 的需求人數陣列}
+       by_type：各類型 × 角色 × 百分位數的需求人數表
+    """
+    rng = np.random.default_rng(seed)
+    loads = np.asarray(loads_by_type, dtype=float)
+    volume = np.clip(1 + rng.normal(growth[0], growth[1], (n, len(loads))), 0, None)
+    complexity = np.clip(1 + rng.normal(drift[0], drift[1], (n, 1)), 0, None)
+    scenario_load = loads * volume * complexity
+
+    samples, rows = {}, []
+    for role in ROLES:
+        cap = CAPACITY[role] * np.clip(1 + rng.normal(0, capacity_sd, (n, 1)), 0.1, None)
+        need = scenario_load / cap
+        samples[role] = need.sum(axis=1)
+        type_pct = np.percentile(need, PERCENTILES, axis=0)
+        for i, case_type in enumerate(loads_by_type.index):
+            rows.append({"案件類型": case_type, "角色": role,
+                         **{f"P{p}": round(float(type_pct[j, i]), 1) for j, p in enumerate(PERCENTILES)}})
+    return {"samples": samples, "by_type": pd.DataFrame(rows)}
+
+
+def percentiles(samples):
+    """各角色總需求人數的百分位數表 (列為角色)。"""
+    return pd.DataFrame({f"P{p}": {role: round(float(np.percentile(values, p)), 1) for role, values in samples.items()}
+                         for p in PERCENTILES})
@@ -0,0 +1,1011 @@
+import contextlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import schema
+from schema import CASE_ID
+
+# --- 1. 路徑與資料表配置 ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(BASE_DIR, "outputs")
+
+# 各頁面共用的資料表 (邏輯名稱 = 檔名主體)
+TABLES = ("master_data", "roi_data", "staff_list", "workload_distribution", "assignments")
+
+# 由主檔物化的衍生檢視 (views.py) 與原始檔歷史的彙總立方體 (cube.py)，
+# 與資料表一起釘選版本，但不匯出 Excel 備份
+VIEWS = ("case_view", "overview_stats", "overview_counts", "overview_top", "case_cube")
+
+# 寫入前 (及自無型別格式讀入後) 套用的型別正規化
+SCHEMAS = {
+    "master_data": schema.normalize_case_frame,
+    "roi_data": schema.normalize_case_id,
+    "workload_distribution": schema.normalize_case_id,
+    "assignments": schema.normalize_case_id,
+}
+
+# 以案件編號連結主檔的資料表 (舊版檔案讀入時依案件名稱補上編號)
+LINKED_TABLES = ("roi_data", "workload_distribution", "assignments")
+
+# 檔案型後端每張資料表保留的版本數 (供回復)，更舊的版本檔於寫入後刪除
+KEEP_VERSIONS = int(os.environ.get("OMMS_KEEP_VERSIONS", "10"))
+
+# 分批讀寫 (大型匯入的暫存分段與 row group) 每批的列數
+SPOOL_ROWS = int(os.environ.get("OMMS_SPOOL_ROWS", "5000"))
+
+# 逐列 upsert 使用的主鍵欄位
+KEYS = {
+    "master_data": [CASE_ID],
+    "roi_data": [CASE_ID],
+    "staff_list": ["姓名", "角色類型"],
+    "workload_distribution": [CASE_ID, "負責人"],
+    "assignments": [CASE_ID, "姓名", "角色"],
+}
+
+
+# --- 2. 原子寫入與版本目錄 ---
+def _replace(src, dest, retries=20):
+    # Windows 上目標檔正被讀取時 os.replace 會短暫失敗，稍候重試
+    for attempt in range(retries):
+        try:
+            os.replace(src, dest)
+            return
+        except PermissionError:
+            if attempt == retries - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+
+def atomic_write(path, write):
+    """
+    先以 write(暫存路徑) 寫入同目錄的暫存檔並 fsync，再以 os.replace 換上：
+    同一檔案系統上 replace 為原子操作，讀取端只會看到舊檔或完整的新檔，寫到一半當機也不會留下殘缺檔案。
+    """
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    root, ext = os.path.splitext(path)
+    # 保留副檔名，to_excel / to_parquet 依副檔名判斷格式
+    tmp = f"{root}.{os.getpid()}-{threading.get_ident()}.tmp{ext}"
+    try:
+        write(tmp)
+        with open(tmp, "rb+") as fh:
+            os.fsync(fh.fileno())
+        _replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+def _catalog_path():
+    return os.path.join(OUTPUT_DIR, "CURRENT.json")
+
+
+def _read_catalog():
+    """版本目錄 {後端: {資料表: {"version": 目前版本, "history": [[版本, 寫入時間], ...]}}}。"""
+    path = _catalog_path()
+    for attempt in range(20):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except PermissionError:
+            time.sleep(0.05 * (attempt + 1))
+    raise PermissionError(path)
+
+
+def _write_catalog(catalog):
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(catalog, fh, ensure_ascii=False, indent=2)
+    atomic_write(_catalog_path(), write)
+
+
+_CATALOG_THREAD_LOCK = threading.Lock()
+
+
+@contextlib.contextmanager
+def _catalog_lock(timeout=30):
+    """
+    更新版本目錄的跨程序鎖 (outputs/CURRENT.lock，以 O_EXCL 建立)：
+    同一時間只有一個寫入者能配發版本號；持有者當機留下的鎖檔超過 timeout 秒視為失效。
+    """
+    path = os.path.join(OUTPUT_DIR, "CURRENT.lock")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with _CATALOG_THREAD_LOCK:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > timeout:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"無法取得版本目錄鎖：{path}")
+                time.sleep(0.05)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            yield
+        finally:
+            os.close(fd)
+            os.remove(path)
+
+
+# --- 3. 儲存後端 ---
+class _FileTables:
+    """
+    檔案型後端的資料表存取 (每次寫入產生一個新的版本檔)：
+    1. 版本檔 outputs/snapshots/<表>/<表>.vNNNNNN 以 atomic_write 寫入，寫入後不再修改。
+    2. outputs/CURRENT.json 記錄各表目前版本，同樣原子更新；讀取端先取版本號再讀檔，
+       釘選同一份版本號 (snapshot) 的頁面不會讀到其他 session 寫到一半的資料。
+    3. 回復 (rollback) 只需把目錄指回舊版本，不必複製資料。
+    版本 0 代表舊版直接存放在 outputs 下的單一檔案，第一次寫入後即改為版本檔。
+    """
+
+    def flat_location(self, name):
+        return os.path.join(OUTPUT_DIR, name + self.suffix)
+
+    def version_location(self, name, version):
+        if not version:
+            return self.flat_location(name)
+        return os.path.join(OUTPUT_DIR, "snapshots", name, f"{name}.v{version:06d}{self.suffix}")
+
+    def _entry(self, name, catalog=None):
+        catalog = _read_catalog() if catalog is None else catalog
+        return catalog.get(self.name, {}).get(name)
+
+    def pin(self):
+        """一次讀取版本目錄，回傳各表目前版本 {資料表: 版本}。"""
+        catalog = _read_catalog()
+        return {name: self.current_version(name, catalog) for name in TABLES + VIEWS}
+
+    def current_version(self, name, catalog=None):
+        entry = self._entry(name, catalog)
+        if entry is not None:
+            return entry["version"]
+        return 0 if os.path.exists(self.flat_location(name)) else None
+
+    def versions(self, name):
+        """可回復的版本 [(版本, 寫入時間)]，由舊到新。"""
+        entry = self._entry(name) or {}
+        return [(v, saved) for v, saved in entry.get("history", [])
+                if os.path.exists(self.version_location(name, v))]
+
+    def location(self, name, version=None):
+        if version is None:
+            version = self.current_version(name)
+        return self.version_location(name, version)
+
+    def has(self, name):
+        return self.current_version(name) is not None
+
+    def signature(self, name, version=None):
+        return _file_signature(self.location(name, version))
+
+    def load(self, name, version=None):
+        return self.read(self.location(name, version))
+
+    def save(self, name, df):
+        self._save(name, lambda tmp: self.write(df, tmp))
+
+    def save_chunks(self, name, spool):
+        self._save(name, lambda tmp: self.write_chunks(spool, tmp))
+
+    def _save(self, name, write):
+        with _catalog_lock():
+            catalog = _read_catalog()
+            entry = self._entry(name, catalog) or {"version": 0, "history": []}
+            # 回復後再寫入時版本號仍往上加，不覆蓋較新的版本檔
+            version = max([entry["version"]] + [v for v, _ in entry["history"]]) + 1
+            atomic_write(self.version_location(name, version), write)
+            history = (entry["history"] + [[version, time.time()]])[-KEEP_VERSIONS:]
+            catalog.setdefault(self.name, {})[name] = {"version": version, "history": history}
+            _write_catalog(catalog)
+        # Excel 後端的單一檔案同時是匯出檔，不隨版本化刪除
+        self._prune(name, {v for v, _ in history}, flat=self.name != "excel")
+
+    def rollback(self, name, version):
+        with _catalog_lock():
+            catalog = _read_catalog()
+            entry = self._entry(name, catalog)
+            if entry is None or not os.path.exists(self.version_location(name, version)):
+                raise ValueError(f"{name} 沒有可回復的版本 v{version}")
+            entry["version"] = version
+            _write_catalog(catalog)
+
+    def drop(self, name):
+        with _catalog_lock():
+            catalog = _read_catalog()
+            if catalog.get(self.name, {}).pop(name, None) is not None:
+                _write_catalog(catalog)
+        self._prune(name, set())
+
+    def _prune(self, name, keep, flat=True):
+        """刪除保留範圍外的版本檔 (及舊版單一檔案)；Windows 上仍被開啟的檔案留待下次再刪。"""
+        folder = os.path.join(OUTPUT_DIR, "snapshots", name)
+        paths = [self.flat_location(name)] if flat else []
+        if os.path.isdir(folder):
+            # 其他寫入者尚未換上的暫存檔不可刪除
+            paths += [os.path.join(folder, f) for f in os.listdir(folder)
+                      if f.endswith(self.suffix) and ".tmp" not in f]
+        kept = {self.version_location(name, v) for v in keep}
+        for path in paths:
+            if path not in kept and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class ExcelBackend(_FileTables):
+    """Excel 後端：僅作為無 pyarrow 環境下的備援，以及匯入/匯出格式。"""
+    name = "excel"
+    suffix = ".xlsx"
+    typed = False
+
+    def read(self, path):
+        return pd.read_excel(path)
+
+    def write(self, df, path):
+        schema.to_display(df).to_excel(path, index=False)
+
+    def write_chunks(self, spool, path):
+        # Excel 無法附加寫入，合併後整檔寫出 (僅為無 pyarrow 時的備援)
+        self.write(spool.frame(), path)
+
+    def read_chunks(self, path, chunksize=None):
+        yield self.read(path)
+
+
+class ParquetBackend(_FileTables):
+    """Parquet 欄式後端：以 memory-map 讀取，取代每次重跑時的 XML 解析。"""
+    name = "parquet"
+    suffix = ".parquet"
+    typed = True
+
+    def read(self, path):
+        return pd.read_parquet(path, memory_map=True)
+
+    def write(self, df, path):
+        _arrow_safe(df).to_parquet(path, index=False)
+
+    def write_chunks(self, spool, path):
+        """逐批附加為 row group；各批次已由 ChunkSpool 統一型別，Categorical 的索引一律用 int32。"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for df in spool.chunks():
+                if writer is None:
+                    first = pa.Table.from_pandas(df, preserve_index=False).schema
+                    arrow_schema = pa.schema(
+                        [pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type)) if pa.types.is_dictionary(f.type) else f
+                         for f in first], metadata=first.metadata)
+                    writer = pq.ParquetWriter(path, arrow_schema)
+                writer.write_table(pa.Table.from_pandas(df, schema=arrow_schema, preserve_index=False))
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            self.write(pd.DataFrame(columns=spool.all_columns), path)
+
+    def read_chunks(self, path, chunksize=None):
+        """依 row group 批次讀取，不必一次載入整個檔案。"""
+        import pyarrow.parquet as pq
+        book = pq.ParquetFile(path, memory_map=True)
+        for batch in book.iter_batches(batch_size=chunksize or SPOOL_ROWS):
+            yield batch.to_pandas()
+
+
+class SQLiteBackend:
+    """
+    SQLite 嵌入式資料庫後端 (OMMS_STORAGE=sqlite)：
+    1. 所有資料表存於 outputs/omms.db，WAL 模式下讀取不受寫入阻擋，多個 session 可同時讀。
+    2. 支援依主鍵 upsert 與依條件替換，存檔只寫入變更的列，且每次寫入為單一交易。
+    3. 每張資料表在 _omms_tables 記錄版本號，寫入時於同一交易遞增，作為快取失效依據。
+    """
+    name = "sqlite"
+    suffix = ".db"
+    typed = False
+    META = "_omms_tables"
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(OUTPUT_DIR, "omms" + self.suffix)
+
+    def location(self, name, version=None):
+        return self.path
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # isolation_level=None：交易由 _transaction 明確控制
+        con = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute(f"CREATE TABLE IF NOT EXISTS {self.META} (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        return con
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE 先取得寫入鎖，多個 session 同時存檔時依序執行而非互相覆蓋。"""
+        con = self.connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            yield con
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+
+    def pin(self):
+        """
+        各表目前版本 {資料表: 版本}。SQLite 不保留舊版本，讀取一律為最新一次提交的交易，
+        一致性由交易保證 (WAL 下讀取端看到的是開始讀取時已提交的資料)。
+        """
+        if not os.path.exists(self.path):
+            return {name: None for name in TABLES + VIEWS}
+        con = self.connect()
+        try:
+            rows = dict(con.execute(f"SELECT name, version FROM {self.META}").fetchall())
+        finally:
+            con.close()
+        return {name: rows.get(name) for name in TABLES + VIEWS}
+
+    def current_version(self, name, catalog=None):
+        if not os.path.exists(self.path):
+            return None
+        con = self.connect()
+        try:
+            row = con.execute(f"SELECT version FROM {self.META} WHERE name = ?", (name,)).fetchone()
+        finally:
+            con.close()
+        return row[0] if row else None
+
+    def versions(self, name):
+        return []
+
+    def has(self, name):
+        return self.current_version(name) is not None
+
+    def signature(self, name, version=None):
+        return self.current_version(name)
+
+    def load(self, name, version=None):
+        con = self.connect()
+        try:
+            return pd.read_sql_query(f"SELECT * FROM {_quote(name)} ORDER BY rowid", con)
+        finally:
+            con.close()
+
+    def save(self, name, df):
+        with self._transaction() as con:
+            con.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+            self._ensure_table(con, name, df.columns)
+            self._insert(con, name, df)
+            self._bump(con, name)
+
+    def save_chunks(self, name, spool):
+        """分批整表寫入：與 save 相同在單一交易內完成，但逐批 INSERT。"""
+        with self._transaction() as con:
+            con.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+            self._ensure_table(con, name, spool.all_columns)
+            for df in spool.chunks():
+                self._insert(con, name, df)
+            self._bump(con, name)
+
+    def upsert(self, name, df, key):
+        """
+        已存在的主鍵就地更新 (保留原列順序)，不存在則新增；新欄位以 ALTER TABLE 補上。
+        以主鍵上的 UNIQUE 索引搭配單一 executemany 的 INSERT ... ON CONFLICT DO UPDATE 完成；
+        主鍵含空值的列不會與任何列衝突，一律新增。
+        """
+        with self._transaction() as con:
+            self._ensure_table(con, name, df.columns)
+            self._ensure_unique(con, name, key)
+            cols = ", ".join(_quote(str(c)) for c in df.columns)
+            marks = ", ".join("?" for _ in df.columns)
+            target = ", ".join(_quote(c) for c in key)
+            assign = ", ".join(f"{_quote(str(c))} = excluded.{_quote(str(c))}" for c in df.columns if c not in key)
+            action = f"DO UPDATE SET {assign}" if assign else "DO NOTHING"
+            con.executemany(f"INSERT INTO {_quote(name)} ({cols}) VALUES ({marks}) "
+                            f"ON CONFLICT ({target}) {action}", _sql_rows(df))
+            self._bump(con, name)
+
+    def replace(self, name, where, chunks):
+        """刪除符合 where 的列後逐批寫入 chunks，兩者在同一交易內完成；其他列不動。"""
+        with self._transaction() as con:
+            if con.execute(f"PRAGMA table_info({_quote(name)})").fetchone():
+                self._ensure_table(con, name, list(where))
+                match, params = _sql_where(where)
+                con.execute(f"DELETE FROM {_quote(name)} WHERE {match}", params)
+            for df in chunks:
+                self._ensure_table(con, name, list(df.columns) + [c for c in where if c not in df.columns])
+                self._insert(con, name, df)
+            # 沒有任何批次時仍建立資料表
+            self._ensure_table(con, name, list(where))
+            self._bump(con, name)
+
+    def drop(self, name):
+        if not os.path.exists(self.path):
+            return
+        with self._transaction() as con:
+            con.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+            con.execute(f"DELETE FROM {self.META} WHERE name = ?", (name,))
+
+    def _ensure_table(self, con, name, columns):
+        existing = [r[1] for r in con.execute(f"PRAGMA table_info({_quote(name)})")]
+        if not existing:
+            # 不宣告欄位型別 (SQLite 動態型別)，讀回後再由 schema 正規化
+            con.execute(f"CREATE TABLE {_quote(name)} ({', '.join(_quote(str(c)) for c in columns)})")
+        else:
+            for col in columns:
+                if str(col) not in existing:
+                    con.execute(f"ALTER TABLE {_quote(name)} ADD COLUMN {_quote(str(col))}")
+        key = [c for c in KEYS.get(name, []) if c in list(columns) or c in existing]
+        if key and len(key) == len(KEYS[name]) and not self._index_columns(con, "ux_" + name):
+            con.execute(f"CREATE INDEX IF NOT EXISTS {_quote('ix_' + name)} ON {_quote(name)} "
+                        f"({', '.join(_quote(c) for c in key)})")
+
+    def _ensure_unique(self, con, name, key):
+        """
+        ON CONFLICT 需要主鍵上的 UNIQUE 索引：第一次 upsert 時建立並取代一般索引。
+        一般寫入 (save / replace) 不要求主鍵唯一，故只在 upsert 時建立；既有資料已有重複主鍵時無法依主鍵更新。
+        """
+        index = "ux_" + name
+        if self._index_columns(con, index) == list(key):
+            return
+        con.execute(f"DROP INDEX IF EXISTS {_quote(index)}")
+        try:
+            con.execute(f"CREATE UNIQUE INDEX {_quote(index)} ON {_quote(name)} ({', '.join(_quote(c) for c in key)})")
+        except sqlite3.IntegrityError:
+            raise ValueError(f"{name} 已有重複的主鍵 {list(key)}，無法依主鍵更新") from None
+        con.execute(f"DROP INDEX IF EXISTS {_quote('ix_' + name)}")
+
+    @staticmethod
+    def _index_columns(con, index):
+        return [r[2] for r in con.execute(f"PRAGMA index_info({_quote(index)})")]
+
+    def _insert(self, con, name, df):
+        self._insert_rows(con, name, df.columns, _sql_rows(df))
+
+    def _insert_rows(self, con, name, columns, rows):
+        if not rows:
+            return
+        cols = ", ".join(_quote(str(c)) for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        con.executemany(f"INSERT INTO {_quote(name)} ({cols}) VALUES ({marks})", rows)
+
+    def _bump(self, con, name):
+        con.execute(f"INSERT INTO {self.META} (name, version) VALUES (?, 1) "
+                    "ON CONFLICT(name) DO UPDATE SET version = version + 1", (name,))
+
+
+def _quote(identifier):
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def _sql_where(where):
+    """where ({欄位: 值}) 轉為 SQL 條件；值為 list / tuple / set 時以 json_each 比對其中任一值。"""
+    clauses, params = [], []
+    for col, value in where.items():
+        if isinstance(value, (list, tuple, set)):
+            clauses.append(f"{_quote(col)} IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps([_sql_value(v) for v in value], ensure_ascii=False))
+        else:
+            clauses.append(f"{_quote(col)} IS ?")
+            params.append(_sql_value(value))
+    return " AND ".join(clauses), params
+
+
+def _sql_value(value):
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def _sql_rows(df):
+    """轉為 sqlite3 可綁定的 tuple：是/否 與 Categorical 還原為文字，空值為 NULL。"""
+    out = schema.to_display(df).astype(object)
+    out = out.where(out.notna(), None)
+    for col in out.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            out[col] = out[col].map(lambda v: None if v is None else str(v))
+    return list(out.itertuples(index=False, name=None))
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_backend():
+    """
+    依環境變數 OMMS_STORAGE 選擇主要儲存後端 (parquet / sqlite / excel)。
+    未指定時優先使用 Parquet，缺少 pyarrow 則退回 Excel。
+    """
+    choice = os.environ.get("OMMS_STORAGE", "").strip().lower()
+    if choice == "sqlite":
+        return SQLiteBackend()
+    return file_backend()
+
+
+def file_backend():
+    """單檔格式的後端 (匯入解析快取等非資料表用途)：Parquet，缺少 pyarrow 則為 Excel。"""
+    choice = os.environ.get("OMMS_STORAGE", "").strip().lower()
+    if choice == "excel" or not _has_pyarrow():
+        return ExcelBackend()
+    return ParquetBackend()
+
+
+def _arrow_safe(df):
+    """Arrow 不接受混合型別的 object 欄位 (例如 0 與 '是' 並存)，統一轉為字串並保留空值。"""
+    out = df.copy()
+    out.columns = [str(c) for c in out.columns]
+    for col in out.columns[out.dtypes == object]:
+        if pd.api.types.infer_dtype(out[col], skipna=True).startswith("mixed"):
+            out[col] = out[col].map(lambda v: v if pd.isna(v) else str(v))
+    return out
+
+
+# --- 4. 共用快取 (以 後端 + 資料表 為鍵，檔案型用 mtime + 大小、SQLite 用版本號判斷是否變動) ---
+# 模組層級快取在同一個 Streamlit 程序內跨頁面、跨 session 共用
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+_CACHE_STATS = {"hits": 0, "misses": 0}
+
+# 檔案型後端的「讀取 → 合併 → 寫回」需序列化，避免同一程序內兩個 session 互相覆蓋
+_WRITE_LOCK = threading.RLock()
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _apply_schema(name, df):
+    normalize = SCHEMAS.get(name)
+    return normalize(df) if normalize else df
+
+
+def _cached_read(backend, name, version=None):
+    """資料表 (指定版本) 未變動時直接回傳快取副本，避免重複解析同一份資料。"""
+    if version is None:
+        version = backend.current_version(name)
+    sig = backend.signature(name, version)
+    key = (backend.name, backend.location(name, version), name)
+    with _CACHE_LOCK:
+        entry = _CACHE.get(key)
+        if entry is not None and entry[0] == sig:
+            _CACHE_STATS["hits"] += 1
+            return entry[1].copy()
+    df = backend.load(name, version)
+    if not backend.typed:
+        # 無型別格式讀入後再正規化一次，並連同結果一起快取
+        df = _apply_schema(name, df)
+    with _CACHE_LOCK:
+        _CACHE_STATS["misses"] += 1
+        # 同一資料表只快取最近讀取的版本，避免版本檔累積在記憶體中
+        for old in [k for k in _CACHE if k[0] == backend.name and k[2] == name]:
+            del _CACHE[old]
+        _CACHE[key] = (sig, df)
+    # 回傳副本，呼叫端可自由修改而不污染快取
+    return df.copy()
+
+
+def invalidate(name=None):
+    """清除指定資料表 (或全部) 的快取。"""
+    with _CACHE_LOCK:
+        if name is None:
+            _CACHE.clear()
+            return
+        for key in [k for k in _CACHE if k[2] == name]:
+            _CACHE.pop(key, None)
+
+
+def cache_stats():
+    with _CACHE_LOCK:
+        return dict(_CACHE_STATS, entries=len(_CACHE))
+
+
+# --- 5. 資料表存取 ---
+def table_path(name, backend=None):
+    backend = backend or get_backend()
+    return backend.location(name)
+
+
+def excel_path(name):
+    return os.path.join(OUTPUT_DIR, name + ExcelBackend.suffix)
+
+
+def _legacy_paths(name, backend):
+    """主要後端以外、可自動匯入的舊版檔案 (依優先順序)。"""
+    sources = [ParquetBackend(), ExcelBackend()]
+    return [(src, src.location(name)) for src in sources
+            if src.name != backend.name and os.path.exists(src.location(name))]
+
+
+def exists(name):
+    backend = get_backend()
+    return backend.has(name) or bool(_legacy_paths(name, backend))
+
+
+def snapshot():
+    """
+    釘選目前各資料表的版本 {資料表: 版本}：頁面載入時取一次並傳給每個 read_table，
+    即使其他 session 同時寫入，這次執行讀到的仍是同一時點的一致資料。
+    """
+    return get_backend().pin()
+
+
+def read_table(name, snapshot=None):
+    """
+    讀取資料表：
+    1. 主要後端已有此表時直接讀取 (有傳入 snapshot 時讀取釘選的版本)。
+    2. 否則若有舊版 Parquet / Excel 檔，匯入後轉存為主要格式。
+    3. 皆不存在則回傳空的 DataFrame。
+    """
+    backend = get_backend()
+    pinned = (snapshot or {}).get(name)
+    if pinned is not None:
+        try:
+            return _link_case_ids(name, _cached_read(backend, name, pinned), snapshot)
+        except FileNotFoundError:
+            # 釘選的版本已超出保留範圍而被刪除，改讀目前版本
+            pass
+    if backend.has(name):
+        return _link_case_ids(name, _cached_read(backend, name), snapshot)
+    legacy = _legacy_paths(name, backend)
+    if legacy:
+        src, path = legacy[0]
+        return write_table(name, src.read(path))
+    return pd.DataFrame()
+
+
+def _needs_link(name, df):
+    return name in LINKED_TABLES and not df.empty and CASE_ID not in df.columns and '案件名稱' in df.columns
+
+
+def _link_case_ids(name, df, snapshot=None):
+    """
+    舊版資料表缺少案件編號時，依案件名稱對應主檔補上：
+    讀取時以同一 snapshot 的主檔在記憶體中補上 (不寫回)；寫回見 write_table 與 backfill_case_ids。
+    """
+    if not _needs_link(name, df):
+        return df
+    master = read_table("master_data", snapshot)
+    if CASE_ID not in master.columns:
+        return df
+    return schema.link_case_ids(df, master)
+
+
+def backfill_case_ids(master=None):
+    """
+    將仍缺少案件編號的舊版關聯資料表 (LINKED_TABLES) 依主檔補上並寫回，只發生一次；
+    由主檔配發編號的寫入流程 (ingest.ensure_case_ids) 呼叫。回傳補上編號的資料表。
+    """
+    master = read_table("master_data") if master is None else master
+    if CASE_ID not in master.columns:
+        return []
+    backend = get_backend()
+    linked = []
+    for name in LINKED_TABLES:
+        if not backend.has(name):
+            continue
+        df = _cached_read(backend, name)
+        if _needs_link(name, df):
+            write_table(name, schema.link_case_ids(df, master))
+            linked.append(name)
+    return linked
+
+
+def write_table(name, df):
+    """整表寫入並回傳套用 schema 後實際儲存的 DataFrame (缺少案件編號的關聯資料表於寫入時補上)。"""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    df = _apply_schema(name, _link_case_ids(name, df))
+    with _WRITE_LOCK:
+        get_backend().save(name, df)
+    invalidate(name)
+    return df
+
+
+def write_table_chunks(name, chunks):
+    """
+    分批整表寫入 (大型匯入用，記憶體只保留單一批次)：
+    1. chunks 為 DataFrame 的迭代器，只走訪一次；各批次套用 schema 後先暫存為分段檔 (ChunkSpool)。
+    2. 依所有批次決定共同型別後逐批交給後端：Parquet 以 row group 附加、SQLite 在同一交易內逐批 INSERT；
+       Excel 後端無法附加，合併後整檔寫入。
+    回傳寫入的列數。
+    """
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    spool = ChunkSpool()
+    try:
+        for df in chunks:
+            spool.append(_apply_schema(name, df))
+        with _WRITE_LOCK:
+            get_backend().save_chunks(name, spool)
+    finally:
+        spool.close()
+    invalidate(name)
+    return spool.rows
+
+
+def upsert_rows(name, df, key=None):
+    """
+    依主鍵 (KEYS) 逐列更新或新增：
+    1. SQLite 後端在單一交易內只寫入 df 的列，其餘列不動。
+    2. 檔案型後端退回「讀取 → 依主鍵合併 → 整檔寫回」，結果相同。
+    """
+    key = list(key or KEYS[name])
+    df = _apply_schema(name, df.drop_duplicates(subset=key, keep='last'))
+    backend = get_backend()
+    with _WRITE_LOCK:
+        if hasattr(backend, "upsert") and (backend.has(name) or not _legacy_paths(name, backend)):
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
+            backend.upsert(name, df, key)
+        else:
+            current = read_table(name)
+            write_table(name, _merge_rows(current, df, key))
+    invalidate(name)
+
+
+def replace_rows(name, where, df):
+    """
+    刪除符合 where 的列並寫入 df (例如替換單一案件的指派或分工、增量匯入替換變更檔案的案件)：
+    1. where 為 {欄位: 值}；值為 list / tuple / set 時符合其中任一值即刪除。
+    2. df 可為 DataFrame 或逐批的 DataFrame 迭代器；SQLite 後端在單一交易內刪除並逐批寫入，其餘列不動。
+    3. 檔案型後端退回「讀取 → 刪除符合的列 → 整檔寫回」，結果相同。
+    """
+    chunks = (_apply_schema(name, chunk) for chunk in ([df] if isinstance(df, pd.DataFrame) else df))
+    backend = get_backend()
+    with _WRITE_LOCK:
+        if hasattr(backend, "replace") and (backend.has(name) or not _legacy_paths(name, backend)):
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
+            backend.replace(name, where, chunks)
+        else:
+            current = read_table(name)
+            if not current.empty:
+                mask = pd.Series(True, index=current.index)
+                for col, value in where.items():
+                    if col not in current.columns:
+                        mask &= False
+                    elif isinstance(value, (list, tuple, set)):
+                        mask &= current[col].isin(list(value))
+                    else:
+                        mask &= current[col] == value
+                current = current[~mask]
+            chunks = list(chunks)
+            frames = [f for f in [current] + chunks if not f.empty] or chunks[:1] or [current]
+            write_table(name, pd.concat(frames, ignore_index=True))
+    invalidate(name)
+
+
+def _merge_rows(current, df, key):
+    """以主鍵合併：既有列就地更新、新主鍵附加在最後。"""
+    if current.empty:
+        return df
+    if not set(key).issubset(current.columns):
+        return pd.concat([current, df], ignore_index=True)
+    current = schema.to_display(current)
+    rows = schema.to_display(df).reset_index(drop=True)
+    cur_keys = pd.MultiIndex.from_frame(current[key].astype(object))
+    new_keys = pd.MultiIndex.from_frame(rows[key].astype(object))
+    pos = new_keys.get_indexer(cur_keys)
+    matched = pos >= 0
+    for col in rows.columns.difference(key, sort=False):
+        if col not in current.columns:
+            current[col] = pd.NA
+        values = current[col].astype(object).to_numpy(copy=True)
+        values[matched] = rows[col].astype(object).to_numpy()[pos[matched]]
+        current[col] = values
+    added = rows[~new_keys.isin(cur_keys)]
+    return pd.concat([current, added], ignore_index=True)
+
+
+def versions(name):
+    """可回復的版本 [(版本, 寫入時間)]；SQLite 後端不保留舊版本，回傳空串列。"""
+    return get_backend().versions(name)
+
+
+def current_version(name):
+    return get_backend().current_version(name)
+
+
+def rollback(name, version):
+    """把資料表指回舊版本 (只更新版本目錄，不複製資料)，回傳該版本的資料。"""
+    backend = get_backend()
+    if not hasattr(backend, "rollback"):
+        raise ValueError(f"{backend.name} 後端不支援版本回復")
+    backend.rollback(name, version)
+    invalidate(name)
+    return read_table(name)
+
+
+def delete_table(name):
+    """刪除資料表 (含舊版 Parquet / Excel 檔)，避免重設後又從舊檔匯回。"""
+    backend = get_backend()
+    backend.drop(name)
+    for src, _ in _legacy_paths(name, backend):
+        src.drop(name)
+    invalidate(name)
+
+
+# --- 6. Excel 匯入 / 匯出橋接 ---
+def import_excel(name, path=None):
+    df = pd.read_excel(path or excel_path(name))
+    if not isinstance(get_backend(), ExcelBackend):
+        return write_table(name, df)
+    return _apply_schema(name, df)
+
+
+def export_excel(name, path=None):
+    """將主要儲存的資料表匯出為 Excel，回傳輸出路徑；資料表不存在時回傳 None。"""
+    backend = get_backend()
+    if not backend.has(name):
+        return None
+    df = schema.to_display(_cached_read(backend, name))
+    return atomic_write(path or excel_path(name), lambda tmp: df.to_excel(tmp, index=False))
+
+
+def export_all_excel():
+    return [p for p in (export_excel(name) for name in TABLES) if p]
+
+
+# --- 7. 分批暫存 (大型匯入) ---
+def _dtype_key(dtype):
+    return "category" if isinstance(dtype, pd.CategoricalDtype) else dtype
+
+
+def _is_int(dtype):
+    return dtype != "category" and pd.api.types.is_integer_dtype(dtype)
+
+
+def _common_dtype(dtypes, absent):
+    """
+    各批次同一欄位的共同型別 (dtypes 只計有值的批次；absent 表示有批次缺少此欄或全為空值)：
+    1. 型別都相同時沿用；numpy 整數 / 布林遇到空值時改為浮點數 / nullable boolean (與 pd.concat 相同)。
+    2. 整數混合取最寬的 nullable 整數，數值混合為 float64，布林混合為 boolean。
+    3. 其餘 (例如文字與數值並存) 一律轉為文字，不丟失任何值。
+    """
+    if not dtypes:
+        return "float64"
+    if len(dtypes) == 1:
+        dtype = next(iter(dtypes))
+        if absent and isinstance(dtype, np.dtype) and dtype.kind in "iu":
+            return "float64"
+        if absent and isinstance(dtype, np.dtype) and dtype.kind == "b":
+            return "boolean"
+        return dtype
+    if all(_is_int(d) for d in dtypes):
+        bits = max(np.dtype(getattr(d, "numpy_dtype", d)).itemsize for d in dtypes) * 8
+        return f"Int{bits}"
+    if all(d != "category" and pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d) for d in dtypes):
+        return "float64"
+    if all(d != "category" and pd.api.types.is_bool_dtype(d) for d in dtypes):
+        return "boolean"
+    return "str"
+
+
+def _as_text(series):
+    values = series.astype(object)
+    return values.map(lambda v: v if pd.isna(v) else str(v)).astype("str")
+
+
+class ChunkSpool:
+    """
+    分批暫存 (大型活頁簿串流解析與整表分批寫入共用)：
+    1. append：每個批次寫成一個分段檔 (folder/part-NNNNN)，並記錄各欄位在有值批次中的型別。
+    2. chunks：依所有批次決定共同型別 (_common_dtype) 後逐批讀回，型別一致才能附加寫入同一個檔案。
+    3. tag：讀回時附加的常數欄位 (例如資料期間)。
+    物件本身只含路徑與型別資訊，可由子程序建立後交回主程序，不必 pickle 整份資料。
+    """
+
+    def __init__(self, folder=None):
+        self.folders = [folder or os.path.join(OUTPUT_DIR, "spool", uuid.uuid4().hex)]
+        self.parts, self.columns, self.rows = [], [], 0
+        self.constants = {}
+        self._dtypes, self._present, self._categories = {}, [], {}
+
+    def append(self, df):
+        if df.empty:
+            return
+        os.makedirs(self.folders[0], exist_ok=True)
+        backend = file_backend()
+        path = os.path.join(self.folders[0], f"part-{len(self.parts):05d}{backend.suffix}")
+        backend.write(df, path)
+        self.parts.append(path)
+        self.rows += len(df)
+        self.columns += [c for c in df.columns if c not in self.columns]
+        filled = df.columns[df.notna().any().to_numpy()]
+        for col in filled:
+            self._dtypes.setdefault(col, set()).add(_dtype_key(df[col].dtype))
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                self._categories.setdefault(col, set()).update(df[col].cat.categories)
+        self._present.append(set(filled))
+
+    def tag(self, col, value):
+        self.constants[col] = value
+
+    @property
+    def all_columns(self):
+        return self.columns + [c for c in self.constants if c not in self.columns]
+
+    def dtypes(self):
+        return {col: _common_dtype(self._dtypes.get(col, set()), any(col not in p for p in self._present))
+                for col in self.columns}
+
+    def _category_lists(self):
+        # 各批次的類別聯集並排序，與整批轉為 Categorical 的結果相同
+        lists = {}
+        for col, values in self._categories.items():
+            try:
+                lists[col] = sorted(values)
+            except TypeError:
+                lists[col] = sorted(values, key=str)
+        return lists
+
+    def chunks(self):
+        targets = self.dtypes()
+        categories = self._category_lists()
+        backend = file_backend()
+        for path in self.parts:
+            df = backend.read(path).reindex(columns=self.columns)
+            for col, target in targets.items():
+                current = _dtype_key(df[col].dtype)
+                if target == "category":
+                    values = df[col] if current == "category" else df[col].astype("category")
+                    df[col] = values.cat.set_categories(categories.get(col, []))
+                elif target == "str":
+                    if current == "category" or not pd.api.types.is_string_dtype(df[col]):
+                        df[col] = _as_text(df[col])
+                elif current != target:
+                    df[col] = df[col].astype(target)
+            for col, value in self.constants.items():
+                df[col] = value
+            yield df
+
+    def frame(self):
+        chunks = list(self.chunks())
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=self.all_columns)
+
+    @classmethod
+    def merge(cls, spools):
+        """合併多個暫存 (例如同一活頁簿的多個工作表)，分段依傳入順序排列。"""
+        merged = cls.__new__(cls)
+        merged.folders = [f for s in spools for f in s.folders]
+        merged.parts = [p for s in spools for p in s.parts]
+        merged.columns = []
+        for s in spools:
+            merged.columns += [c for c in s.columns if c not in merged.columns]
+        merged.rows = sum(s.rows for s in spools)
+        merged.constants = {k: v for s in spools for k, v in s.constants.items()}
+        merged._dtypes = {}
+        for s in spools:
+            for col, kinds in s._dtypes.items():
+                merged._dtypes.setdefault(col, set()).update(kinds)
+        merged._present = [p for s in spools for p in s._present]
+        merged._categories = {}
+        for s in spools:
+            for col, values in s._categories.items():
+                merged._categories.setdefault(col, set()).update(values)
+        return merged
+
+    def close(self):
+        for folder in self.folders:
+            shutil.rmtree(folder, ignore_errors=True)
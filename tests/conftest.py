@@ -0,0 +1,34 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+import storage  # noqa: E402
+
+RAW = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "inputs_raw_cases")
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    """把 storage 的輸出目錄指到暫存資料夾，並使用預設 (Parquet) 後端。"""
+    monkeypatch.setattr(storage, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.delenv("OMMS_STORAGE", raising=False)
+    storage.invalidate()
+    yield tmp_path
+    storage.invalidate()
+
+
+@pytest.fixture
+def raw_folder(output_dir, tmp_path_factory, monkeypatch):
+    """複製範例原始檔到暫存資料夾，匯入清單與解析快取也改寫到暫存輸出目錄。"""
+    monkeypatch.setattr(ingest, "MANIFEST_FILE", os.path.join(str(output_dir), "ingest_manifest.json"))
+    monkeypatch.setattr(ingest, "CACHE_DIR", os.path.join(str(output_dir), "ingest_cache"))
+    folder = tmp_path_factory.mktemp("raw")
+    for name in sorted(os.listdir(RAW)):
+        if name.endswith(".xlsx"):
+            shutil.copy(os.path.join(RAW, name), folder / name)
+    return str(folder)
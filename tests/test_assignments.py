@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+import assignments
+from schema import CASE_ID
+
+
+def _relation():
+    return pd.DataFrame({CASE_ID: [1, 1, 1, 2, None], '案件名稱': ["甲", "甲", "甲", "乙", "丙"],
+                         '姓名': ["Barry", "Ariel", "Cindy", "Ariel", "Ariel"],
+                         '角色': ["PM", "Staff", "Staff", "Staff", "Staff"]})
+
+
+def _dist():
+    return pd.DataFrame({CASE_ID: [1, 1, 2], '案件名稱': ["甲", "甲", "乙"],
+                         '負責人': ["Ariel", "Cindy", "Ariel"], '占比': [60.0, 40.0, 50.0]})
+
+
+def test_index_lookups_skip_cases_without_id():
+    idx = assignments.AssignmentIndex(_relation(), version=3)
+    assert idx.version == 3
+    assert idx.members(1, "Staff") == ["Ariel", "Cindy"]
+    assert idx.cases_of("Ariel") == [1, 2]
+    assert idx.staffed_cases() == {1, 2}
+
+
+def test_shares_come_from_tracker_and_follow_updates():
+    idx = assignments.AssignmentIndex(_relation())
+    tracker = assignments.DistributionTracker(_dist(), version=5)
+    assert idx.shares(1, tracker) == {"Ariel": 60.0, "Cindy": 40.0}
+    assert np.isnan(idx.shares(3, tracker).get("Ariel", np.nan))
+    assert tracker.incomplete(idx.staffed_cases()) == {2}
+    frame = tracker.frame()
+    assert frame.groupby("案件編號")["占比"].sum().to_dict() == tracker.sums
+
+    tracker.update(2, pd.Series([100.0], index=["Ariel"]), version=6)
+    assert tracker.frame() is not frame
+    assert tracker.frame().loc[tracker.frame()["案件編號"] == 2, "占比"].tolist() == [100.0]
+    assert tracker.version == 6
+    assert idx.shares(2, tracker) == {"Ariel": 100.0}
+    assert tracker.rows(2).to_dict("list") == {'負責人': ["Ariel"], '占比': [100.0]}
+    assert tracker.incomplete(idx.staffed_cases()) == set()
+
+    # 期間有其他寫入 (版本跳號) 時標記待重建
+    tracker.update(1, pd.Series([50.0], index=["Ariel"]), version=9)
+    assert tracker.version is None
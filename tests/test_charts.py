@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+import charts
+
+
+def test_cached_figure_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(charts, "_FIGURES", charts.OrderedDict())
+    built = []
+
+    def build(key):
+        built.append(key)
+        return go.Figure()
+
+    for key in range(charts.CACHE_SIZE):
+        charts.cached_figure(key, lambda key=key: build(key))
+    first = charts.cached_figure(0, lambda: build("again"))
+    assert built == list(range(charts.CACHE_SIZE))
+    # 超過 16 張時淘汰最久未使用的 (1)，剛讀過的 0 保留
+    charts.cached_figure(charts.CACHE_SIZE, lambda: build(charts.CACHE_SIZE))
+    assert len(charts._FIGURES) == charts.CACHE_SIZE
+    assert 1 not in charts._FIGURES and charts.cached_figure(0, lambda: build("again")) is first
+    charts.cached_figure(1, lambda: build(1))
+    assert built[-1] == 1
+
+
+def _frame(n):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"x": rng.normal(size=n), "y": rng.normal(size=n), "score": np.arange(n)})
+
+
+def test_adaptive_scatter_uses_heatmap_only_above_max_points(monkeypatch):
+    monkeypatch.setattr(charts, "MAX_POINTS", 50)
+    small = charts.adaptive_scatter(_frame(50), "x", "y")
+    assert [type(t) for t in small.data] == [go.Scatter] and len(small.data[0].x) == 50
+
+    df = _frame(51)
+    outliers = df["x"] > 0
+    large = charts.adaptive_scatter(df, "x", "y", outliers=outliers)
+    assert isinstance(large.data[0], go.Heatmap)
+    assert len(large.data[1].x) == outliers.sum()
+
+    # 異常點仍超過門檻時依 priority 取前 MAX_POINTS 筆
+    df = _frame(200)
+    capped = charts.adaptive_scatter(df, "x", "y", outliers=df["x"] > -10, priority=df["score"])
+    assert sorted(capped.data[1].x) == sorted(df["x"].iloc[150:])
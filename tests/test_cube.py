@@ -0,0 +1,48 @@
+import pandas as pd
+
+import assignments
+import cube
+import ingest
+import storage
+
+
+def _sorted(frame):
+    return frame.sort_values(cube.DIMENSIONS).reset_index(drop=True)
+
+
+def _full_rebuild(folder):
+    ingest.refresh_cube(folder)
+    return _sorted(storage.read_table(cube.CUBE))
+
+
+def test_assignment_change_refreshes_only_its_period(raw_folder):
+    ingest.sync(raw_folder, max_workers=1)
+    master = storage.read_table("master_data")
+    case = master[master["資料期間"] == "2026-01"].iloc[0]
+    before = storage.read_table(cube.CUBE)
+
+    assignments.save_case(int(case["案件編號"]), case["案件名稱"], {"PM": ["Barry"], "Staff": []})
+    after = storage.read_table(cube.CUBE)
+
+    assert not cube.is_stale(after, storage.snapshot())
+    assert set(after.loc[after["PM"] == "Barry", cube.PERIOD_COL]) == {"2026-01"}
+    # 其他期間沿用原彙總，只更新指派版本
+    untouched = lambda df: _sorted(df[df[cube.PERIOD_COL] != "2026-01"].drop(columns="指派版本"))
+    pd.testing.assert_frame_equal(untouched(after), untouched(before))
+    pd.testing.assert_frame_equal(_sorted(after), _full_rebuild(raw_folder))
+
+
+def test_refresh_stale_cube_recomputes_only_stale_periods(raw_folder):
+    ingest.sync(raw_folder, max_workers=1)
+    master = storage.read_table("master_data")
+    case = master[master["資料期間"] == "2025-12"].iloc[0]
+    # 不經 save_case 直接寫入 (例如回復)：整個立方體過期，頁面改由背景工作重算
+    storage.write_table("assignments", pd.DataFrame({"案件編號": [case["案件編號"]], "案件名稱": [case["案件名稱"]],
+                                                     "姓名": ["Barry"], "角色": ["PM"]}))
+    stale = storage.read_table(cube.CUBE)
+    assert cube.stale_periods(stale) == {"2025-12", "2026-01"}
+
+    ingest.refresh_stale_cube(raw_folder)
+    refreshed = storage.read_table(cube.CUBE)
+    assert cube.stale_periods(refreshed) == set()
+    pd.testing.assert_frame_equal(_sorted(refreshed), _full_rebuild(raw_folder))
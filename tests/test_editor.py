@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+import editor
+
+
+def _base():
+    return pd.DataFrame({"案件名稱": list("ABCDEFGH"), "複雜度評分": [5.0, 9, 1, 7, 3, 8, 2, 6]})
+
+
+def test_apply_page_maps_page_delta_to_full_table():
+    base = _base()
+    # 依分數遞減的第 1 頁 (每頁 4 列)：B F D H
+    positions = editor.page_rows(editor.select_rows(base, sort="score_desc"), 1, 4)
+    assert base["案件名稱"].iloc[positions].tolist() == list("BFDH")
+
+    # 編輯器回傳：刪除頁內第 1 列 (F)、修改第 2 列 (D)、新增一列
+    page_edited = base.iloc[positions].reset_index(drop=True)
+    page_edited = page_edited.drop(index=1).reset_index(drop=True)
+    page_edited.loc[1, "案件名稱"] = "D2"
+    page_edited = pd.concat([page_edited, pd.DataFrame({"案件名稱": ["I"], "複雜度評分": [np.nan]})],
+                            ignore_index=True)
+    delta = {"edited_rows": {2: {"案件名稱": "D2"}}, "deleted_rows": [1], "added_rows": [{"案件名稱": "I"}]}
+
+    result, full_delta = editor.apply_page(base, positions, page_edited, delta)
+
+    assert result["案件名稱"].tolist() == ["A", "B", "C", "D2", "E", "G", "H", "I"]
+    assert full_delta == {"edited_rows": {3: {"案件名稱": "D2"}}, "deleted_rows": [5],
+                          "added_rows": [{"案件名稱": "I"}]}
+    scores = editor.carry_scores(base["複雜度評分"], full_delta)
+    assert len(scores) == len(result)
+    assert np.isnan(scores[[3, 7]]).all()
+    assert scores[[0, 1, 2, 4, 5, 6]].tolist() == [5, 9, 1, 3, 2, 6]
+
+
+def test_apply_page_without_changes_keeps_table():
+    base = _base()
+    positions = editor.page_rows(editor.select_rows(base, search="c"), 1, 4)
+    page_edited = base.iloc[positions].reset_index(drop=True)
+    result, full_delta = editor.apply_page(base, positions, page_edited, {})
+    pd.testing.assert_frame_equal(result, base)
+    assert full_delta == {"edited_rows": {}, "deleted_rows": [], "added_rows": []}
@@ -0,0 +1,174 @@
+import functools
+import os
+import shutil
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import ingest
+import storage
+
+
+def _stream_everything(monkeypatch):
+    # 門檻設為 0 讓每個檔案都走串流，並把批次縮小到 3 列以確實產生多個批次
+    monkeypatch.setattr(ingest, "STREAM_THRESHOLD_BYTES", 0)
+    monkeypatch.setattr(ingest, "iter_excel_chunks", functools.partial(ingest.iter_excel_chunks, chunksize=3))
+    monkeypatch.setattr(ingest, "CHUNK_ROWS", 3)
+
+
+def _reset(output_dir):
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+    storage.invalidate()
+
+
+def test_streamed_rebuild_matches_in_memory(raw_folder, output_dir, monkeypatch):
+    expected, _ = ingest.sync(raw_folder, max_workers=1)
+    _reset(output_dir)
+    _stream_everything(monkeypatch)
+    actual, _ = ingest.sync(raw_folder, max_workers=1)
+
+    pd.testing.assert_frame_equal(actual, expected)
+    # 串流解析的暫存分段於匯入完成後刪除
+    assert os.listdir(os.path.join(ingest.CACHE_DIR, "spool")) == []
+    # 串流寫入的解析快取可供下一次重建沿用
+    rebuilt, report = ingest.sync(raw_folder, max_workers=1, rebuild=True)
+    assert report["parsed"] == []
+    pd.testing.assert_frame_equal(rebuilt, expected)
+
+
+def test_streamed_upsert_scores_new_cases(raw_folder, output_dir, monkeypatch):
+    late = os.path.join(raw_folder, "cases_202601.xlsx")
+    os.replace(late, late + ".bak")
+    ingest.sync(raw_folder, max_workers=1)
+    master = storage.read_table("master_data")
+    master["複雜度評分"] = 1.0
+    master.insert(0, "序號", range(1, len(master) + 1))
+    storage.write_table("master_data", master)
+
+    _stream_everything(monkeypatch)
+    os.replace(late + ".bak", late)
+    actual, report = ingest.sync(raw_folder, max_workers=1)
+
+    assert report["parsed"] == ["cases_202601.xlsx"]
+    assert list(actual["序號"]) == list(range(1, len(actual) + 1))
+    assert actual["案件編號"].is_unique
+    new = actual[actual["資料期間"] == "2026-01"]
+    assert len(new) == 2 and (new["複雜度評分"] != 1.0).all()
+    assert (actual.loc[actual["資料期間"] == "2025-12", "複雜度評分"] == 1.0).all()
+
+
+def test_upsert_keeps_same_name_from_other_periods(raw_folder, output_dir):
+    ingest.sync(raw_folder, max_workers=1)
+    earlier = pd.read_excel(os.path.join(raw_folder, "cases_202512.xlsx"))
+    # 新月份沿用上月的案件名稱：增量匯入不可刪除上月的列
+    earlier.head(2).to_excel(os.path.join(raw_folder, "cases_202602.xlsx"), index=False)
+    upserted, report = ingest.sync(raw_folder, max_workers=1)
+    assert report["parsed"] == ["cases_202602.xlsx"]
+
+    rebuilt, _ = ingest.sync(raw_folder, max_workers=1, rebuild=True)
+    key = ["資料期間", "案件名稱"]
+    assert len(upserted) == len(rebuilt) == 12
+    pd.testing.assert_frame_equal(upserted.sort_values(key).reset_index(drop=True)[key],
+                                  rebuilt.sort_values(key).reset_index(drop=True)[key])
+    assert upserted["案件編號"].is_unique
+
+
+def _recording(write, calls):
+    def wrapper(name, *args, **kwargs):
+        calls.append(name)
+        return write(name, *args, **kwargs)
+    return wrapper
+
+
+def test_upsert_replaces_only_changed_period_rows(raw_folder, output_dir, monkeypatch):
+    monkeypatch.setenv("OMMS_STORAGE", "sqlite")
+    ingest.sync(raw_folder, max_workers=1)
+    version = storage.current_version("master_data")
+    # 沒有變更的檔案：主檔不寫入
+    ingest.sync(raw_folder, max_workers=1)
+    assert storage.current_version("master_data") == version
+
+    def rows():
+        con = sqlite3.connect(storage.get_backend().path)
+        try:
+            df = pd.read_sql_query('SELECT rowid, * FROM master_data', con).set_index("rowid").astype(object)
+            return df.where(df.notna(), None)
+        finally:
+            con.close()
+
+    rewrites = []
+    for fn in ("write_table", "write_table_chunks"):
+        monkeypatch.setattr(storage, fn, _recording(getattr(storage, fn), rewrites))
+    before = rows()
+    path = os.path.join(raw_folder, "cases_202601.xlsx")
+    changed = pd.read_excel(path)
+    changed.iloc[1:].to_excel(path, index=False)
+    upserted, report = ingest.sync(raw_folder, max_workers=1)
+    assert report["parsed"] == ["cases_202601.xlsx"]
+    assert "master_data" not in rewrites
+
+    # 未變更期間的列原地保留 (同一 rowid、內容不變)，只有變更檔案的列被刪除後重新寫入
+    after = rows()
+    untouched = before[before["資料期間"] == "2025-12"]
+    pd.testing.assert_frame_equal(after.loc[untouched.index], untouched)
+    assert set(after.loc[after["資料期間"] == "2026-01", "案件名稱"]) == set(changed["案件名稱"].iloc[1:])
+    assert len(after) == len(before) - 1
+
+    rebuilt, _ = ingest.sync(raw_folder, max_workers=1, rebuild=True)
+    key = ["資料期間", "案件名稱"]
+    pd.testing.assert_frame_equal(upserted.sort_values(key).reset_index(drop=True)[key + ["案件編號"]],
+                                  rebuilt.sort_values(key).reset_index(drop=True)[key + ["案件編號"]])
+
+
+def test_small_imports_parse_without_process_pool(raw_folder, monkeypatch):
+    paths = ingest.list_raw_files(raw_folder)
+    serial = ingest.parse_files(paths, max_workers=1)
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("小型匯入不應啟動 process pool")
+
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", no_pool)
+    assert not ingest.use_pool(paths, len(paths), max_workers=None)
+    parsed = ingest.parse_files(paths, max_workers=None)
+    assert [path for path, _, _ in parsed] == [path for path, _, _ in serial]
+    for (_, expected, _), (_, actual, _) in zip(serial, parsed):
+        pd.testing.assert_frame_equal(actual, expected)
+
+    # 門檻降為 0 時多檔匯入改走平行解析
+    monkeypatch.setattr(ingest, "PARALLEL_MIN_BYTES", 0)
+    assert ingest.use_pool(paths, len(paths), max_workers=None)
+    assert not ingest.use_pool(paths, 1, max_workers=None)
+    assert not ingest.use_pool(paths, len(paths), max_workers=1)
+
+
+def test_failed_streamed_parse_removes_spool(raw_folder, output_dir, monkeypatch):
+    _stream_everything(monkeypatch)
+    stream = ingest.iter_excel_chunks
+    paths = ingest.list_raw_files(raw_folder)
+
+    def failing(path, **kwargs):
+        # 第一個檔案正常解析，第二個檔案寫出一個批次後失敗
+        for chunk in stream(path, **kwargs):
+            yield chunk
+            if path == paths[-1]:
+                raise OSError("讀取中斷")
+
+    monkeypatch.setattr(ingest, "iter_excel_chunks", failing)
+    with pytest.raises(OSError, match="讀取中斷"):
+        ingest.sync(raw_folder, max_workers=1)
+    assert os.listdir(os.path.join(ingest.CACHE_DIR, "spool")) == []
+    assert not storage.exists("master_data")
+
+
+def test_failed_chunked_write_removes_spool(output_dir, monkeypatch):
+    def chunks():
+        yield pd.DataFrame({"案件名稱": ["甲"], "個體數": [1]})
+        raise ValueError("批次錯誤")
+
+    with pytest.raises(ValueError, match="批次錯誤"):
+        storage.write_table_chunks("master_data", chunks())
+    assert os.listdir(os.path.join(str(output_dir), "spool")) == []
+    assert not storage.exists("master_data")
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def gate():
+    """讓測試中的工作停在執行中，結束時放行。"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def _wait(report, event, value):
+    event.wait(5)
+    return value
+
+
+def _finish(job):
+    for _ in range(500):
+        if not job.active:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_score_job_is_not_shared_across_sessions(gate):
+    a = jobs.submit("score", _wait, gate, "A", session="a")
+    b = jobs.submit("score", _wait, gate, "B", session="b")
+    assert a is not b
+    assert jobs.submit("score", _wait, gate, "A2", session="a") is a
+    assert jobs.active("score", session="b") == [b]
+    gate.set()
+    _finish(a), _finish(b)
+    assert (a.result, b.result) == ("A", "B")
+
+
+def test_ingest_job_is_shared(gate):
+    a = jobs.submit("ingest", _wait, gate, "A", session="a")
+    assert jobs.submit("ingest", _wait, gate, "B", session="b") is a
+    # 共用的匯入會暫停所有 session；評分只暫停自己的 session
+    s = jobs.submit("score", _wait, gate, "S", session="a")
+    assert set(jobs.blocking("b")) == {a}
+    assert set(jobs.blocking("a")) == {a, s}
+    gate.set()
+    _finish(a), _finish(s)
+    assert jobs.blocking("a") == []
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+import optimizer
+import views
+
+
+def _master(n=40, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"案件編號": np.arange(1, n + 1), "案件名稱": [f"案件{i}" for i in range(n)],
+                         "複雜度評分": rng.integers(5, 40, n).astype(float)})
+
+
+def _roster():
+    return pd.DataFrame({"姓名": ["P1", "P2", "P3", "S1", "S2", "S3", "S4", "P1"],
+                         "角色類型": ["PM", "PM", "PM", "Staff", "Staff", "Staff", "Staff", "PM"],
+                         optimizer.CAPACITY_COL: [1.0, 0.5, None, 1.0, 1.5, 1.0, 0, 1.0]})
+
+
+def test_propose_respects_pools_and_roles():
+    master = _master()
+    proposal = optimizer.propose(master, _roster(), time_limit=0.05)
+    rel, dist = proposal["relation"], proposal["distribution"]
+
+    pm = rel[rel["角色"] == "PM"]
+    assert set(pm["姓名"]) <= {"P1", "P2", "P3"}
+    assert (pm.groupby("案件編號").size() == 1).all() and len(pm) == len(master)
+
+    staff = rel[rel["角色"] == "Staff"]
+    assert set(staff["姓名"]) <= {"S1", "S2", "S3", "S4"}
+    assert not staff.duplicated(subset=["案件編號", "姓名"]).any()
+    tiers = views.risk_codes(master.set_index("案件編號")["複雜度評分"])
+    expected = pd.Series(np.asarray(optimizer.STAFF_PER_TIER)[tiers], index=master["案件編號"])
+    pd.testing.assert_series_equal(staff.groupby("案件編號").size(), expected, check_names=False)
+    assert np.allclose(dist.groupby("案件編號")["占比"].sum(), 100)
+    # 產能缺值或 <= 0 視為 1.0
+    loads = proposal["loads"].set_index("姓名")
+    assert loads.loc["P3", optimizer.CAPACITY_COL] == 1.0 and loads.loc["S4", optimizer.CAPACITY_COL] == 1.0
+
+
+def test_improve_never_raises_max_load():
+    for seed in range(20):
+        rng = np.random.default_rng(seed)
+        balancer = optimizer.Balancer(rng.choice([0.5, 1.0, 1.5], 6), rng.uniform(0, 20, 6))
+        for case, weight in enumerate(rng.integers(1, 30, 30)):
+            balancer.assign(case, float(weight), int(rng.integers(1, 4)))
+        before = balancer.max_load()
+        balancer.improve(time_limit=0.05)
+        assert balancer.max_load() <= before + 1e-9
+
+
+def test_improve_rebalances_imbalanced_assignment(monkeypatch):
+    # 四件案件都在第一人身上 (總負荷 10)：兩人各 5 才是最佳
+    balancer = optimizer.Balancer([1.0, 1.0])
+    for case, weight in enumerate([3.0, 3.0, 2.0, 2.0]):
+        balancer._add(case, 0, weight)
+    assert balancer.improve(time_limit=1) > 0
+    assert balancer.max_load() == 5.0
+
+    # 負荷最低的候選人已負責同一案時，改由其他人承接，不因候選人數提早停止
+    monkeypatch.setattr(optimizer, "CANDIDATES", 1)
+    balancer = optimizer.Balancer([1.0, 1.0, 1.0, 1.0])
+    for person, weights in enumerate([(6.0, 6.0), (0.5, 0.5), (1.0, 1.0)]):
+        for case, weight in enumerate(weights):
+            balancer._add(case, person, weight)
+    balancer._add(2, 3, 5.0)
+    assert balancer.improve(time_limit=1) > 0
+    assert balancer.max_load() < 12.0
@@ -0,0 +1,40 @@
+import gc
+import tracemalloc
+
+import perf
+
+
+def _interrupted_run():
+    # 模擬頁面在 finish 之前因例外或 st.stop() 中斷
+    rec = perf.Recorder("test", memory=True)
+    rec.begin("load")
+    assert tracemalloc.is_tracing()
+    return rec
+
+
+def test_next_run_releases_unfinished_recorder(monkeypatch):
+    monkeypatch.setattr(perf, "LOG_ENABLED", False)
+    first = _interrupted_run()
+    second = perf.Recorder("test", memory=False)
+    assert [s["stage"] for s in first.stages] == ["load"]
+    assert perf._TRACE_USERS == 0
+    assert not tracemalloc.is_tracing()
+    second.close()
+
+
+def test_collected_recorder_releases_tracing(monkeypatch):
+    monkeypatch.setattr(perf, "LOG_ENABLED", False)
+    _interrupted_run()
+    perf.st.session_state.pop(perf.ACTIVE_KEY, None)
+    gc.collect()
+    assert perf._TRACE_USERS == 0
+    assert not tracemalloc.is_tracing()
+
+
+def test_close_is_idempotent(monkeypatch):
+    monkeypatch.setattr(perf, "LOG_ENABLED", False)
+    rec = perf.Recorder("test", memory=True)
+    rec.close()
+    rec.close()
+    assert perf._TRACE_USERS == 0
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import roi
+import scorer
+
+
+def test_unit_value_zero_scores():
+    ratio = roi.unit_value([100, 50, 30, 80, 100], [0, -1, np.nan, 10, 3], decimals=2)
+    # 評分 <= 0 或缺值時為 0，不是 inf / NaN
+    assert ratio.tolist() == [0.0, 0.0, 0.0, 8.0, 33.33]
+    assert np.isfinite(roi.unit_value([np.nan], [5])).all()
+
+
+def test_analyze_quadrants_and_suggested_price():
+    df = pd.DataFrame({"複雜度評分": [10, 20, 30, 40, 25], "最終報價(萬)": [0, 200, 50, 100, 300]})
+    result, stats = roi.analyze(df)
+
+    assert stats["avg_complexity"] == 25 and stats["avg_price"] == 162.5 and stats["active"] == 4
+    # 未報價案件不列入應提高報價；難度恰為平均的案件不屬任何象限
+    assert result["象限"].tolist() == [roi.OTHER, roi.STAR, roi.RAISE_PRICE, roi.RAISE_PRICE, roi.OTHER]
+    avg_roi = np.mean([10.0, 1.67, 2.5, 12.0])
+    assert stats["avg_roi"] == pytest.approx(avg_roi)
+    assert result["建議報價(萬)"].iloc[2:4].tolist() == [round(avg_roi * 30, 2), round(avg_roi * 40, 2)]
+    assert result["價差(萬)"].iloc[2:4].tolist() == [round(avg_roi * 30 - 50, 2), round(avg_roi * 40 - 100, 2)]
+    assert result["建議報價(萬)"].iloc[[0, 1, 4]].isna().all()
+    assert result["高於平均"].tolist() == [False, True, False, False, True]
+
+
+def test_analyze_price_at_average_is_not_flagged():
+    result, _ = roi.analyze(pd.DataFrame({"複雜度評分": [10, 30], "最終報價(萬)": [100, 100]}))
+    assert result["象限"].tolist() == [roi.OTHER, roi.OTHER]
+
+
+def test_analyze_matches_legacy_roi():
+    master = scorer.calculate_complexity(benchmark.make_cases(300))
+    roi_df, _ = benchmark.make_assignments(master, 20)
+    calc_df = pd.merge(master[["案件名稱", "複雜度評分"]], roi_df[["案件名稱", "最終報價(萬)"]], on="案件名稱")
+    engine, _ = roi.analyze(calc_df)
+    legacy, bad_cases, star_cases = benchmark.legacy_roi(calc_df)
+    assert np.array_equal(legacy["投報率"].to_numpy(dtype=float), engine["投報率"].to_numpy())
+    assert np.array_equal(legacy["商務評價"].eq("high").to_numpy(), engine["高於平均"].to_numpy())
+    assert bad_cases.index.equals(engine.index[engine["象限"] == roi.RAISE_PRICE])
+    assert star_cases.index.equals(engine.index[engine["象限"] == roi.STAR])
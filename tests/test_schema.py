@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+import schema
+import scorer
+import storage
+
+
+def _cases():
+    return pd.DataFrame({
+        '案件名稱': ["甲", "乙", "丙"],
+        '案件類型': ["FSA", "0", None],
+        '是否被Q': ["是", "Y", "N/A"],
+        '是否為PCAOB': ["是", "否", "0"],
+        '個體數': ["3", "約10", ""],
+        '系統數': [1, 2, None],
+    })
+
+
+@pytest.mark.parametrize("backend", ["parquet", "sqlite"])
+def test_unrecognized_values_survive_round_trip(output_dir, monkeypatch, backend):
+    monkeypatch.setenv("OMMS_STORAGE", backend)
+    storage.write_table("master_data", _cases())
+    stored = storage.read_table("master_data")
+
+    # 可辨識的欄位照常轉型
+    assert isinstance(stored['是否為PCAOB'].dtype, pd.BooleanDtype)
+    assert stored['是否為PCAOB'].tolist()[:2] == [True, False] and pd.isna(stored['是否為PCAOB'][2])
+    assert str(stored['系統數'].dtype) == "Int8"
+    # 無法辨識的值保留原文字，類別欄位的 "0" 不再被視為空值
+    assert stored['是否被Q'].tolist() == ["是", "Y", "N/A"]
+    assert stored['個體數'].tolist()[:2] == ["3", "約10"] and pd.isna(stored['個體數'][2])
+    assert stored['案件類型'].tolist()[:2] == ["FSA", "0"]
+
+    # 再次寫入 (例如編輯器存檔) 仍保留
+    storage.write_table("master_data", schema.to_display(stored))
+    again = storage.read_table("master_data")
+    assert again['是否被Q'].tolist() == ["是", "Y", "N/A"]
+    assert schema.unrecognized_values(again) == {'是否被Q': ["N/A", "Y"], '個體數': ["約10"]}
+
+
+def test_preserved_text_scores_like_normalized():
+    normalized = schema.normalize_case_frame(_cases())
+    recognized = schema.normalize_case_frame(_cases().assign(是否被Q=["是", None, None], 個體數=[3, None, None]))
+    assert scorer.calculate_complexity(normalized, sort=False)['複雜度評分'].tolist() == \
+        scorer.calculate_complexity(recognized, sort=False)['複雜度評分'].tolist()
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import ingest
+import schema
+import scorer
+import storage
+from conftest import RAW
+
+
+def _fixture():
+    # 合成案件 (含空值、前後空白) 加上範例原始檔
+    raw = [pd.read_excel(os.path.join(RAW, name)) for name in sorted(os.listdir(RAW)) if name.endswith(".xlsx")]
+    return pd.concat([benchmark.make_cases(500, seed=1)] + raw, ignore_index=True)
+
+
+@pytest.mark.parametrize("normalized", [False, True])
+def test_compiled_plan_matches_legacy_scorer(normalized):
+    df = _fixture()
+    legacy = benchmark.legacy_calculate_complexity(df)['複雜度評分'].sort_index()
+    if normalized:
+        df = schema.normalize_case_frame(df)
+    planned = scorer.calculate_complexity(df)['複雜度評分'].sort_index()
+    pd.testing.assert_series_equal(planned, legacy, check_dtype=False)
+
+
+def _ranked(raw_folder):
+    ingest.sync(raw_folder, max_workers=1)
+    # 與主頁的完整評分相同：清洗後評分、依分數排名並重編序號
+    master = storage.read_table("master_data").drop(columns="序號", errors="ignore")
+    ranked = scorer.calculate_complexity(scorer.clean_for_scoring(master)).reset_index(drop=True)
+    ranked.insert(0, "序號", range(1, len(ranked) + 1))
+    return ranked
+
+
+def test_rescore_edits_matches_full_scoring(raw_folder):
+    prev = _ranked(raw_folder)
+    edited = prev.drop(columns=["序號", "複雜度評分"])
+    # 編輯最後一列、刪除第二列、新增一列 (data_editor 的差異格式)
+    last = len(edited) - 1
+    edited.loc[last, "個體數"] = 60
+    edited.loc[last, "是否為PCAOB"] = True
+    added = edited.iloc[[0]].assign(案件名稱="新案件", 案件編號=np.nan)
+    edited = pd.concat([edited.drop(index=1), added], ignore_index=True)
+    delta = {"edited_rows": {last: {"個體數": 60, "是否為PCAOB": True}}, "deleted_rows": [1], "added_rows": [{}]}
+
+    result = scorer.rescore_edits(prev, edited, delta)
+    full = scorer.calculate_complexity(scorer.clean_for_scoring(edited).reset_index(drop=True))
+
+    assert result["複雜度評分"].is_monotonic_decreasing
+    pd.testing.assert_series_equal(result["複雜度評分"].sort_index(), full["複雜度評分"].sort_index().astype(float))
+    assert result["案件名稱"].sort_index().tolist() == edited["案件名稱"].tolist()
+
+
+def test_rescore_edits_falls_back_when_not_ranked(raw_folder):
+    prev = _ranked(raw_folder).iloc[::-1].reset_index(drop=True)
+    edited = prev.drop(columns=["序號", "複雜度評分"])
+    assert scorer.rescore_edits(prev, edited, {"edited_rows": {0: {}}}) is None
+    # 欄位與上次評分不一致 (例如新增欄位) 時同樣改走完整評分
+    assert scorer.rescore_edits(prev, edited.assign(備註=""), {}) is None
+
+
+def test_merge_runs_matches_stable_sort():
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 5, 101).astype(float)
+    bounds = [0, 17, 40, 41, 80, 101]
+    runs = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        idx = start + np.argsort(-scores[start:stop], kind="stable")
+        runs.append((-scores[idx], idx))
+    # 分數大量重複：同分時須保留原列順序，與一次全域穩定排序一致
+    assert scorer._merge_runs(runs).tolist() == np.argsort(-scores, kind="stable").tolist()
+    assert scorer._merge_runs([]).tolist() == []
+
+
+def test_score_batch_matches_calculate_complexity(raw_folder, monkeypatch):
+    monkeypatch.setattr(scorer, "BATCH_MIN_ROWS", 1)
+    master = _ranked(raw_folder).drop(columns=["序號", "複雜度評分"])
+    df = pd.concat([master] * 7, ignore_index=True)
+
+    # 同分列維持原順序 (穩定排序)
+    expected = scorer.calculate_complexity(df, sort=False).sort_values("複雜度評分", ascending=False, kind="stable")
+    actual = scorer.score_batch(df, partitions=3, max_workers=2)
+    assert actual.index.tolist() == expected.index.tolist()
+    assert actual["複雜度評分"].tolist() == expected["複雜度評分"].tolist()
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+import schema
+import simulation
+
+
+def _master():
+    df = pd.DataFrame({
+        "案件名稱": ["A", "B", "C"],
+        "案件類型": ["FSA", None, "FSA"],
+        "複雜度評分": [10, 20, 30],
+    })
+    return schema.normalize_case_frame(df)
+
+
+def test_loads_by_type_blank_categorical_type():
+    master = _master()
+    assert isinstance(master["案件類型"].dtype, pd.CategoricalDtype)
+    loads = simulation.loads_by_type(master)
+    assert loads.to_dict() == {"-": 20, "FSA": 40}
+
+
+def test_loads_by_type_without_type_column():
+    loads = simulation.loads_by_type(_master().drop(columns=["案件類型"]))
+    assert loads.to_dict() == {"-": 60}
+
+
+def test_simulate_with_blank_type():
+    sim = simulation.simulate(simulation.loads_by_type(_master()), n=1000, seed=1)
+    assert set(sim["by_type"]["案件類型"]) == {"-", "FSA"}
+    assert all(len(v) == 1000 for v in sim["samples"].values())
+    totals = simulation.percentiles(sim["samples"])
+    assert np.all(np.diff(totals.to_numpy(), axis=1) >= 0)
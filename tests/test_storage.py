@@ -0,0 +1,175 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import storage
+
+
+def _chunks():
+    # 同一欄位在各批次型別不同：整數 / 含空值、文字 / 數值、類別不同
+    yield pd.DataFrame({"案件名稱": ["甲", "乙"], "案件類型": ["FSA", None], "個體數": [1, 2],
+                        "備註": ["a", None], "前底稿完整度": [np.nan, np.nan]})
+    yield pd.DataFrame({"案件名稱": ["丙"], "案件類型": ["CAATS"], "個體數": [300],
+                        "備註": [3], "前底稿完整度": [0.5]})
+
+
+@pytest.mark.parametrize("backend", ["parquet", "sqlite"])
+def test_write_table_chunks_matches_write_table(output_dir, monkeypatch, backend):
+    monkeypatch.setenv("OMMS_STORAGE", backend)
+    whole = storage.write_table("master_data", pd.concat(list(_chunks()), ignore_index=True))
+    expected = storage.read_table("master_data")
+
+    assert storage.write_table_chunks("master_data", _chunks()) == 3
+    actual = storage.read_table("master_data")
+    # 文字與數值混合的欄位在分批寫入時一律存為文字 (整批寫入的 SQLite 會保留原型別)
+    pd.testing.assert_frame_equal(actual.drop(columns="備註"), expected.drop(columns="備註"))
+    assert list(actual["案件類型"].cat.categories) == list(whole["案件類型"].cat.categories)
+    assert [v if pd.notna(v) else None for v in actual["備註"]] == ["a", None, "3"]
+    assert storage.current_version("master_data") == 2
+
+
+def test_chunk_spool_merge_and_tag(output_dir):
+    first, second = storage.ChunkSpool(), storage.ChunkSpool()
+    first.append(pd.DataFrame({"x": [1, 2]}))
+    second.append(pd.DataFrame({"x": [1.5], "y": ["b"]}))
+    merged = storage.ChunkSpool.merge([first, second])
+    merged.tag("資料期間", "2026-01")
+
+    frame = merged.frame()
+    assert list(frame.columns) == ["x", "y", "資料期間"]
+    assert frame["x"].tolist() == [1.0, 2.0, 1.5]
+    assert frame["y"].isna().tolist() == [True, True, False]
+    assert (frame["資料期間"] == "2026-01").all()
+    merged.close()
+    assert not any(os.path.exists(folder) for folder in merged.folders)
+
+
+def test_legacy_case_ids_link_on_read_and_persist_on_write(output_dir):
+    storage.write_table("master_data", pd.DataFrame({"案件編號": [1, 2], "案件名稱": ["甲", "乙"]}))
+    snap = storage.snapshot()
+    # 舊版 ROI 表沒有案件編號 (寫入時主檔尚無此表，模擬舊資料)
+    storage.get_backend().save("roi_data", pd.DataFrame({"案件名稱": ["乙", "丙"], "預算": [10, 20]}))
+    version = storage.current_version("roi_data")
+    # 之後主檔改名：釘選的 snapshot 仍以當時的主檔對應
+    storage.write_table("master_data", pd.DataFrame({"案件編號": [1, 2], "案件名稱": ["甲", "丙"]}))
+
+    pinned = storage.read_table("roi_data", {**snap, "roi_data": version})
+    assert pinned["案件編號"].tolist()[0] == 2 and pd.isna(pinned["案件編號"][1])
+    # 讀取不寫回
+    assert storage.current_version("roi_data") == version
+
+    assert storage.backfill_case_ids() == ["roi_data"]
+    stored = storage.get_backend().load("roi_data", storage.current_version("roi_data"))
+    assert pd.isna(stored["案件編號"][0]) and stored["案件編號"].tolist()[1] == 2
+    assert storage.backfill_case_ids() == []
+
+
+@pytest.mark.parametrize("backend", ["parquet", "sqlite"])
+def test_upsert_rows_updates_by_key_and_appends_new_keys(output_dir, monkeypatch, backend):
+    # Parquet 後端經 _merge_rows 整檔合併，SQLite 後端以 ON CONFLICT 只寫入變更的列，兩者結果應相同
+    monkeypatch.setenv("OMMS_STORAGE", backend)
+    storage.write_table("workload_distribution", pd.DataFrame({
+        "案件編號": [1, 1, 2], "案件名稱": ["甲", "甲", "乙"], "負責人": ["Amy", "Ben", "Amy"], "占比": [60, 40, 100]}))
+    storage.upsert_rows("workload_distribution", pd.DataFrame({
+        "案件編號": [1, 3, 3], "案件名稱": ["甲", "丙", "丙"], "負責人": ["Ben", "Cid", "Cid"], "占比": [50, 10, 100],
+        "備註": ["調整", None, "新案"]}))
+
+    actual = storage.read_table("workload_distribution")
+    key = ["案件編號", "負責人"]
+    actual = actual.sort_values(key).reset_index(drop=True)
+    assert actual[key].values.tolist() == [[1, "Amy"], [1, "Ben"], [2, "Amy"], [3, "Cid"]]
+    # 既有主鍵就地更新、重複主鍵取最後一列、原表沒有的欄位對既有列補空值
+    assert actual["占比"].tolist() == [60, 50, 100, 100]
+    assert [v if pd.notna(v) else None for v in actual["備註"]] == [None, "調整", None, "新案"]
+
+
+def test_sqlite_upsert_uses_one_conflict_statement(output_dir, monkeypatch):
+    monkeypatch.setenv("OMMS_STORAGE", "sqlite")
+    storage.write_table("roi_data", pd.DataFrame({"案件編號": [1, 2], "案件名稱": ["甲", "乙"], "報價": [100, 200]}))
+    statements = []
+    connect = storage.SQLiteBackend.connect
+
+    def traced(self):
+        con = connect(self)
+        con.set_trace_callback(statements.append)
+        return con
+
+    monkeypatch.setattr(storage.SQLiteBackend, "connect", traced)
+    storage.upsert_rows("roi_data", pd.DataFrame({"案件編號": [2, 3], "案件名稱": ["乙", "丙"], "報價": [250, 300]}))
+    # 兩列共用一個 executemany 的 INSERT ... ON CONFLICT (追蹤輸出逐列展開)，不再逐列 UPDATE / SELECT
+    assert not [s for s in statements if s.startswith(("UPDATE", 'SELECT 1 FROM "roi_data"'))]
+    assert len([s for s in statements if s.startswith('INSERT INTO "roi_data"') and "ON CONFLICT" in s]) == 2
+
+    con = storage.get_backend().connect()
+    try:
+        indexes = {row[1]: row[2] for row in con.execute('PRAGMA index_list("roi_data")')}
+    finally:
+        con.close()
+    assert indexes == {"ux_roi_data": 1}
+    actual = storage.read_table("roi_data")
+    assert actual["案件編號"].tolist() == [1, 2, 3] and actual["報價"].tolist() == [100, 250, 300]
+
+
+def test_sqlite_upsert_rejects_duplicate_stored_keys(output_dir, monkeypatch):
+    monkeypatch.setenv("OMMS_STORAGE", "sqlite")
+    storage.write_table("roi_data", pd.DataFrame({"案件編號": [1, 1], "案件名稱": ["甲", "甲"], "報價": [100, 200]}))
+    with pytest.raises(ValueError, match="重複的主鍵"):
+        storage.upsert_rows("roi_data", pd.DataFrame({"案件編號": [1], "案件名稱": ["甲"], "報價": [300]}))
+    # 交易回滾，原資料不變
+    assert storage.read_table("roi_data")["報價"].tolist() == [100, 200]
+
+
+@pytest.mark.parametrize("backend", ["parquet", "sqlite"])
+def test_read_cache_hits_until_write_or_version_bump(output_dir, monkeypatch, backend):
+    monkeypatch.setenv("OMMS_STORAGE", backend)
+    storage.write_table("roi_data", pd.DataFrame({"案件編號": [1, 2], "案件名稱": ["甲", "乙"], "報價": [100, 200]}))
+    first = storage.read_table("roi_data")
+    before = storage.cache_stats()
+    second = storage.read_table("roi_data")
+    after = storage.cache_stats()
+    assert (after["hits"], after["misses"]) == (before["hits"] + 1, before["misses"])
+    pd.testing.assert_frame_equal(second, first)
+    # 回傳的是副本：呼叫端修改不影響快取
+    second.loc[0, "報價"] = -1
+    assert storage.read_table("roi_data")["報價"].tolist() == [100, 200]
+
+    # 經 write_table 寫入時清除快取
+    storage.write_table("roi_data", pd.DataFrame({"案件編號": [1], "案件名稱": ["甲"], "報價": [150]}))
+    before = storage.cache_stats()
+    assert storage.read_table("roi_data")["報價"].tolist() == [150]
+    assert storage.cache_stats()["misses"] == before["misses"] + 1
+
+    # 其他程序寫入 (不經本程序的 invalidate) 時，依版本號 / 檔案簽章判斷快取失效
+    storage.get_backend().save("roi_data", storage._apply_schema(
+        "roi_data", pd.DataFrame({"案件編號": [1], "案件名稱": ["甲"], "報價": [175]})))
+    before = storage.cache_stats()
+    assert storage.read_table("roi_data")["報價"].tolist() == [175]
+    assert storage.cache_stats()["misses"] == before["misses"] + 1
+    # 同一資料表只保留最近讀取的版本
+    assert storage.cache_stats()["entries"] == 1
+
+
+def test_snapshot_pins_version_and_rollback_moves_catalog(output_dir):
+    v1 = pd.DataFrame({"案件編號": [1], "案件名稱": ["甲"], "報價": [100]})
+    storage.write_table("roi_data", v1)
+    pinned = storage.snapshot()
+    storage.write_table("roi_data", pd.DataFrame({"案件編號": [1, 2], "案件名稱": ["甲", "乙"], "報價": [120, 200]}))
+    first, second = pinned["roi_data"], storage.current_version("roi_data")
+    assert second == first + 1
+
+    # 釘選 v1 的頁面在 v2 寫入後仍讀到 v1
+    assert storage.read_table("roi_data", pinned)["報價"].tolist() == [100]
+    assert storage.read_table("roi_data")["報價"].tolist() == [120, 200]
+
+    restored = storage.rollback("roi_data", first)
+    catalog = json.loads((output_dir / "CURRENT.json").read_text(encoding="utf-8"))
+    assert catalog["parquet"]["roi_data"]["version"] == first
+    pd.testing.assert_frame_equal(restored, storage.read_table("roi_data"))
+    assert storage.read_table("roi_data")["報價"].tolist() == [100]
+    # 回復後再寫入不覆蓋較新的版本檔
+    storage.write_table("roi_data", v1)
+    assert storage.current_version("roi_data") == second + 1
+    assert [v for v, _ in storage.versions("roi_data")] == [first, second, second + 1]
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+import storage
+import views
+
+
+def _master():
+    return pd.DataFrame({
+        "案件編號": [1, 2, 3, 4],
+        "案件名稱": ["甲", "乙", "丙", "丁"],
+        "案件類型": ["FSA", "IPO", "FSA", "FSA"],
+        "個體數": [2, 1, None, 3],
+        "系統數": [4, 2, 1, None],
+        "(系統)已考量共用情況之實際系統數": [3, None, None, None],
+        "複雜度評分": [13.0, 14.0, 26.0, 27.0],
+    })
+
+
+def test_risk_codes_bin_edges():
+    codes = views.risk_codes(pd.Series([13.99, 14, 26.99, 27, 40, None]))
+    assert codes.tolist() == [views.LOW, views.MEDIUM, views.MEDIUM, views.HIGH, views.HIGH, views.LOW]
+    assert codes.dtype == np.int8
+
+
+def test_build_aggregates():
+    frames = views.build(_master(), source=3)
+    view = frames[views.CASE_VIEW]
+    assert view["風險層級"].tolist() == [views.LOW, views.MEDIUM, views.MEDIUM, views.HIGH]
+    # 實際系統數優先採用已考量共用的系統數；個體數空值以 0 計
+    assert view["實際系統數"].tolist()[:3] == [3.0, 2.0, 1.0] and np.isnan(view["實際系統數"].iloc[3])
+    assert view["調整後資源總量"].tolist()[:3] == [5.0, 3.0, 1.0]
+
+    stats = frames[views.STATS_VIEW].iloc[0]
+    assert stats["總案件數"] == 4 and stats["平均複雜度"] == 20.0
+    assert stats["高風險案件數"] == 1 and stats["來源版本"] == 3
+    counts = frames[views.COUNTS_VIEW].set_index(["維度", "類別"])["件數"]
+    assert counts[("案件類型", "FSA")] == 3 and counts[("風險層級", str(views.MEDIUM))] == 2
+    assert frames[views.TOP_VIEW]["案件名稱"].tolist() == ["丁", "丙", "乙", "甲"]
+    assert views.build(_master())[views.STATS_VIEW]["來源版本"].iloc[0] == -1
+
+
+def test_refresh_and_is_stale(output_dir):
+    assert views.refresh(_master().drop(columns="複雜度評分")) is None
+    # 尚未匯入前釘選的 snapshot：主檔版本為 None，視為 -1
+    assert views.is_stale(pd.DataFrame({"來源版本": [-1]}), {"master_data": None}) is False
+    assert views.is_stale(pd.DataFrame(), {"master_data": None})
+
+    storage.write_table("master_data", _master())
+    views.refresh()
+    snap = storage.snapshot()
+    stats = storage.read_table(views.STATS_VIEW, snap)
+    assert stats["來源版本"].iloc[0] == snap["master_data"]
+    assert not views.is_stale(stats, snap)
+
+    storage.write_table("master_data", _master().assign(複雜度評分=30.0))
+    assert views.is_stale(stats, storage.snapshot())
@@ -0,0 +1,56 @@
+import pandas as pd
+
+import benchmark
+import workload
+
+
+def _cases():
+    return pd.DataFrame({"案件名稱": ["甲", "乙", "丙"], "案件類型": ["FSA", "IPO", "FSA"],
+                         "複雜度評分": [10.0, 20.0, 30.0],
+                         "PM名單": ["Amy, Ben", "Amy", None], "Staff名單": ["", "nan", "Cid"]})
+
+
+def _dist():
+    return pd.DataFrame({"案件名稱": ["甲", "甲", "丙", "丁"], "負責人": ["Cid", "Dan", "Cid", "Dan"],
+                         "占比": [60.0, 40.0, 100.0, 100.0]})
+
+
+def test_explode_names_drops_blanks():
+    long = workload.explode_names(_cases()[["案件名稱", "PM名單"]], "PM名單", "PM")
+    assert long[["案件名稱", "PM"]].values.tolist() == [["甲", "Amy"], ["甲", "Ben"], ["乙", "Amy"]]
+    assert workload.explode_names(_cases()[["案件名稱", "Staff名單"]], "Staff名單", "Staff")["Staff"].tolist() == ["Cid"]
+
+
+def test_compute_workload_totals():
+    load = workload.compute_workload(_cases(), _dist())
+    pm = load["pm_summary"].set_index("PM")
+    assert pm.loc["Amy"].tolist() == [2, 30.0, 15.0] and pm.loc["Ben"].tolist() == [1, 10.0, 10.0]
+    assert load["pm_summary"]["PM"].tolist() == ["Amy", "Ben"]
+
+    staff = load["staff_summary"].set_index("負責人")
+    # 加權負荷 = 複雜度 × 占比 %；主檔沒有的案件 (丁) 仍計件數、負荷為空值
+    assert staff.loc["Cid"].tolist() == [2, 36.0] and staff.loc["Dan"].tolist() == [2, 4.0]
+    assert load["staff_summary"]["負責人"].tolist() == ["Dan", "Cid"]
+
+
+def test_compute_workload_matches_legacy():
+    master = benchmark.make_cases(200)
+    master["複雜度評分"] = range(200)
+    roi_df, dist_df = benchmark.make_assignments(master, 15)
+    combined = master[["案件名稱", "案件類型", "複雜度評分"]].merge(roi_df[["案件名稱", "PM名單"]], on="案件名稱")
+    load = workload.compute_workload(combined, dist_df)
+    pd.testing.assert_frame_equal(load["pm_summary"].reset_index(drop=True),
+                                  benchmark.legacy_pm_workload(combined).reset_index(drop=True))
+    pd.testing.assert_frame_equal(load["staff_summary"].reset_index(drop=True),
+                                  benchmark.legacy_staff_workload(dist_df, master).reset_index(drop=True))
+
+
+def test_pm_workload_from_relation_matches_names():
+    cases = _cases().assign(案件編號=[1, 2, 3])
+    relation = pd.DataFrame({"案件編號": [1, 1, 2, 3], "案件名稱": ["舊名", "甲", "乙", "丙"],
+                             "姓名": ["Amy", "Ben", "Amy", "Cid"], "角色": ["PM", "PM", "PM", "Staff"]})
+    detail, summary = workload.pm_workload(cases, relation)
+    _, expected = workload.pm_workload(cases)
+    # 以案件編號 join，案件名稱以主檔為準；Staff 列不計入 PM
+    assert sorted(detail["案件名稱"]) == ["乙", "甲", "甲"]
+    pd.testing.assert_frame_equal(summary.reset_index(drop=True), expected.reset_index(drop=True))
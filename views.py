@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import storage
+from schema import CASE_ID
+
+# --- 1. 風險層級與物化檢視配置 ---
+# 複雜度評分切點：< 14 為低、14 ~ 26 為中、>= 27 為高 (與總覽頁的風險層級定義表一致)
+RISK_BINS = [14, 27]
+LOW, MEDIUM, HIGH = 0, 1, 2
+
+TOP_N = 10
+
+CASE_VIEW = "case_view"
+STATS_VIEW = "overview_stats"
+COUNTS_VIEW = "overview_counts"
+TOP_VIEW = "overview_top"
+
+
+def risk_codes(scores):
+    """以 np.digitize 一次分箱，回傳 int8 風險層級代碼 (0 低 / 1 中 / 2 高)。"""
+    values = pd.to_numeric(scores, errors='coerce').to_numpy(dtype=float)
+    return np.digitize(np.nan_to_num(values, nan=-np.inf), RISK_BINS).astype(np.int8)
+
+
+def _numeric(df, col):
+    if col not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[col], errors='coerce')
+
+
+# --- 2. 物化 ---
+def build(master, source=None):
+    """
+    由已評分的主檔算出總覽頁需要的衍生欄位與彙總：
+    1. case_view：每案一列 (風險層級代碼、實際系統數、調整後資源總量)。
+    2. overview_stats：總案件數、平均複雜度、高風險案件數，以及來源主檔版本。
+    3. overview_counts：案件類型與風險層級的件數 (圓餅圖)。
+    4. overview_top：複雜度前 TOP_N 名 (長條圖)。
+    source 為主檔版本 (None 記為 -1)。
+    """
+    view = master[[c for c in [CASE_ID, '案件名稱', '案件類型', '複雜度評分'] if c in master.columns]].copy()
+    view['風險層級'] = risk_codes(master['複雜度評分'])
+    entities = _numeric(master, '個體數')
+    systems = _numeric(master, '(系統)已考量共用情況之實際系統數').fillna(_numeric(master, '系統數'))
+    view['實際系統數'] = systems.to_numpy(dtype=float)
+    view['調整後資源總量'] = entities.fillna(0).to_numpy(dtype=float) + view['實際系統數'].to_numpy()
+
+    scores = view['複雜度評分'].to_numpy(dtype=float)
+    stats = pd.DataFrame([{
+        "總案件數": len(view),
+        "平均複雜度": float(np.nanmean(scores)) if len(view) else 0.0,
+        "高風險案件數": int((view['風險層級'] == HIGH).sum()),
+    }])
+
+    counts = []
+    for dim in ['案件類型', '風險層級']:
+        if dim in view.columns:
+            freq = view[dim].value_counts(sort=False)
+            counts.append(pd.DataFrame({"維度": dim, "類別": freq.index.astype(str), "件數": freq.to_numpy()}))
+    counts = pd.concat(counts, ignore_index=True)
+
+    top = view.nlargest(TOP_N, '複雜度評分')
+    stats["來源版本"] = -1 if source is None else int(source)
+    return {CASE_VIEW: view, STATS_VIEW: stats, COUNTS_VIEW: counts, TOP_VIEW: top}
+
+
+def refresh(master=None):
+    """重新物化並寫入各檢視；在評分 / 匯入寫入主檔後呼叫。主檔尚未評分時不產生檢視。"""
+    if master is None:
+        master = storage.read_table("master_data")
+    if master.empty or '複雜度評分' not in master.columns:
+        return None
+    frames = build(master, storage.current_version("master_data"))
+    for name, frame in frames.items():
+        storage.write_table(name, frame)
+    return frames
+
+
+def is_stale(stats, snapshot):
+    """檢視的來源版本與釘選的主檔版本不同 (例如主頁僅存檔未評分、或回復舊版) 即需重建。"""
+    if stats.empty or "來源版本" not in stats.columns:
+        return True
+    expected = (snapshot or {}).get("master_data")
+    expected = -1 if expected is None else expected
+    return int(stats["來源版本"].iloc[0]) != expected
@@ -0,0 +1,72 @@
+import pandas as pd
+from schema import CASE_ID
+
+# --- 1. 名單展開 ---
+def explode_names(df, col, person_col):
+    """
+    將逗號分隔的名單欄位展開為「一人一列」(向量化 explode)，
+    空字串、nan 與多餘空白一併排除，結果與逐列 to_list 相同。
+    """
+    names = df[col].astype(str)
+    names = names.where(~names.isin(["nan", ""]))
+    long = df.drop(columns=[col]).assign(**{person_col: names.str.split(',')}).explode(person_col)
+    long[person_col] = long[person_col].str.strip()
+    return long[long[person_col].notna() & (long[person_col] != "")].reset_index(drop=True)
+
+
+# --- 2. 負荷彙總 ---
+def _case_columns(left, case_df):
+    """
+    有案件編號時以編號做索引 join (case_df 以編號為 hash index)，否則退回案件名稱 (舊版資料 / 效能測試)。
+    回傳 (join 鍵, 由 case_df 帶入的欄位)，案件名稱一律以主檔為準。
+    """
+    key = CASE_ID if CASE_ID in left.columns and CASE_ID in case_df.columns else '案件名稱'
+    cols = [c for c in ['案件名稱', '案件類型', '複雜度評分'] if c != key]
+    return key, cols
+
+
+def _join_cases(left, case_df, how):
+    key, cols = _case_columns(left, case_df)
+    cases = case_df.drop_duplicates(subset=key).set_index(key)[cols]
+    joined = left.drop(columns=[c for c in cols if c in left.columns]).join(cases, on=key, how=how)
+    return joined.reset_index(drop=True)
+
+
+def pm_workload(combined_df, relation=None):
+    """
+    PM 案件負擔：
+    1. 明細 (PM, 案件名稱, 案件類型, 複雜度)，供查詢個別 PM 案件。
+       有指派關聯表 (assignments) 時直接 join，否則展開 PM名單 字串。
+    2. 彙總 count / sum / avg，依平均複雜度遞減排序。
+    """
+    if relation is not None:
+        pms = relation[relation['角色'] == 'PM'].rename(columns={'姓名': 'PM'})
+        detail = _join_cases(pms, combined_df, how='inner')
+    else:
+        detail = explode_names(combined_df[['案件名稱', '案件類型', '複雜度評分', 'PM名單']], 'PM名單', 'PM')
+    detail = detail.rename(columns={'複雜度評分': '複雜度'})[['PM', '案件名稱', '案件類型', '複雜度']]
+    if detail.empty:
+        return detail, pd.DataFrame(columns=['PM', 'count', 'sum', 'avg'])
+    summary = detail.groupby('PM').agg(count=('案件名稱', 'count'), sum=('複雜度', 'sum')).reset_index()
+    summary['avg'] = (summary['sum'] / summary['count']).round(2)
+    return detail, summary.sort_values(by='avg', ascending=False)
+
+
+def staff_workload(dist_df, case_df):
+    """
+    Staff 加權負荷：
+    1. 明細 = 分工占比 join 案件複雜度，加權負荷 = 複雜度 × 占比 %。
+    2. 彙總 count / sum，依總加權負荷遞增排序 (橫條圖由下而上)。
+    """
+    detail = _join_cases(dist_df, case_df, how='left')
+    detail['加權負荷'] = (detail['複雜度評分'] * (detail['占比'] / 100)).round(2)
+    summary = detail.groupby('負責人').agg(count=('案件名稱', 'count'), sum=('加權負荷', 'sum')).reset_index().round(2)
+    return detail, summary.sort_values(by='sum', ascending=True)
+
+
+def compute_workload(combined_df, dist_df, relation=None):
+    """一次算出 PM 與 Staff 兩種角色的案件數、總/平均複雜度與加權負荷。"""
+    pm_detail, pm_summary = pm_workload(combined_df, relation)
+    staff_detail, staff_summary = staff_workload(dist_df, combined_df)
+    return {"pm_detail": pm_detail, "pm_summary": pm_summary,
+            "staff_detail": staff_detail, "staff_summary": staff_summary}